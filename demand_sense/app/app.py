@@ -1,13 +1,28 @@
-from flask import Flask, jsonify, request
+import os
+import json
+import logging
+from contextlib import ExitStack
+from flask import Flask, Response, g, jsonify, request
 from flask_caching import Cache
-from demand_sense.inference_module.infer_model import infer
+from demand_sense.inference_module.engine import get_engine
+from demand_sense.inference_module.batch import date_range_queries
+from demand_sense.utils.profiling import METRICS
+from demand_sense.utils.profiling import profiled
+from demand_sense.utils.profiling import trace
 
 """
 Server using Flask to handle the api requests.
 A cache is used in the server to improve the speed of handling redundant 
 requests. 
-This a synchornous server handling sequential requests and can be improved by 
-using threads and more workers depending on the device.
+Run directly, this is a single process development server. demand_sense/serve.py
+serves the app with several threads or worker processes; workers share the
+response cache and the forecast months through a cache directory, so a result
+computed by one worker is served by all of them.
+Every request is traced: the latency of its stages (data and model load,
+test frame, features, prediction, aggregation) goes to per-stage histograms
+served by /metrics, and the breakdown of slow requests is logged. With a
+profile directory configured, a request with a profile tag is run under
+cProfile.
 Additionally to improve, a load balancer can be incorporated to handle 
 different servers. 
 However, the best way to create endpoints and host them is to use hosting 
@@ -15,10 +30,38 @@ services such as Amazon Sagemaker and Azure App Services.
 These services offer automatic scaling options with dynamic servers.
 """
 
+LOGGER = logging.getLogger(__name__)
+
+# directory shared by worker processes, per-process caches if not set
+CACHE_DIR = os.environ.get("DEMAND_SENSE_CACHE_DIR")
+
 config = {
     "DEBUG": False,  # Flask specific configs
-    "CACHE_TYPE": "SimpleCache",  # Flask-Caching related configs
+    # Flask-Caching related configs
+    "CACHE_TYPE": "FileSystemCache" if CACHE_DIR else "SimpleCache",
+    "CACHE_DIR": os.path.join(CACHE_DIR, "responses") if CACHE_DIR else None,
     "CACHE_DEFAULT_TIMEOUT": 300,
+    # model and data served by the resident inference engine
+    "MODEL_FILE": os.environ.get("DEMAND_SENSE_MODEL_FILE", "model/model.txt"),
+    "DATA_FILE": os.environ.get("DEMAND_SENSE_DATA_FILE", "data_trc.csv"),
+    "FORECAST_CACHE_DIR": CACHE_DIR,
+    # stage breakdown of requests slower than this is logged at INFO
+    "SLOW_REQUEST_SECONDS": float(
+        os.environ.get("DEMAND_SENSE_SLOW_REQUEST_SECONDS", 1.0)
+    ),
+    # cProfile stats of requests with a profile tag, disabled if not set
+    "PROFILE_DIR": os.environ.get("DEMAND_SENSE_PROFILE_DIR"),
+    # lightgbm, compiled or native, see engine.PREDICT_BACKENDS
+    "PREDICT_BACKEND": os.environ.get(
+        "DEMAND_SENSE_PREDICT_BACKEND", "lightgbm"
+    ),
+    # lookback in days of the active customer, product pairs forecast, every
+    # pair is forecast if not set
+    "ACTIVE_DAYS": int(os.environ.get("DEMAND_SENSE_ACTIVE_DAYS", 0)) or None,
+    # minimum seconds between checks of the model and data files for changes
+    "RELOAD_CHECK_SECONDS": float(
+        os.environ.get("DEMAND_SENSE_RELOAD_CHECK_SECONDS", 10.0)
+    ),
 }
 
 app = Flask(__name__)
@@ -26,6 +69,110 @@ app.config.from_mapping(config)
 cache = Cache(app)
 
 
+def use_shared_cache(cache_dir):
+    """
+    Switches the response cache and the forecast cache to a directory shared
+    by all worker processes
+
+    :param cache_dir: str, cache directory
+    """
+    app.config["FORECAST_CACHE_DIR"] = cache_dir
+    cache.init_app(
+        app,
+        config={
+            "CACHE_TYPE": "FileSystemCache",
+            "CACHE_DIR": os.path.join(cache_dir, "responses"),
+            "CACHE_DEFAULT_TIMEOUT": app.config["CACHE_DEFAULT_TIMEOUT"],
+        },
+    )
+
+
+@app.before_request
+def start_trace():
+    """
+    Traces the request, under cProfile when it has a profile tag and a
+    profile directory is configured
+    """
+    name = "http." + (request.endpoint or "unknown")
+    g.trace = ExitStack()
+    g.trace.enter_context(
+        trace(name, LOGGER, app.config["SLOW_REQUEST_SECONDS"])
+    )
+    if "profile" in request.args:
+        g.trace.enter_context(
+            profiled(name, app.config["PROFILE_DIR"], LOGGER)
+        )
+
+
+@app.after_request
+def count_status(response):
+    METRICS.increment("http.status.{}".format(response.status_code))
+    return response
+
+
+@app.teardown_request
+def end_trace(error=None):
+    if "trace" in g:
+        g.trace.close()
+
+
+def engine():
+    """
+    Returns the resident inference engine, reloading the model and data if
+    they were replaced on disk, checked at most every RELOAD_CHECK_SECONDS
+
+    :return engine: InferenceEngine shared by all requests
+    """
+    inference_engine = get_engine(
+        app.config["MODEL_FILE"],
+        app.config["DATA_FILE"],
+        app.config["FORECAST_CACHE_DIR"],
+        app.config["PREDICT_BACKEND"],
+        app.config["ACTIVE_DAYS"],
+    )
+    if inference_engine.reload_if_changed(app.config["RELOAD_CHECK_SECONDS"]):
+        cache.clear()
+    return inference_engine
+
+
+@app.route("/api/reload", methods=["POST"])
+def reload():
+    """
+    Function handling /api/reload request, reloads the model and data from
+    disk and drops cached responses
+
+    :return response: json containing the reloaded model and data paths
+    """
+    inference_engine = get_engine(
+        app.config["MODEL_FILE"],
+        app.config["DATA_FILE"],
+        app.config["FORECAST_CACHE_DIR"],
+        app.config["PREDICT_BACKEND"],
+        app.config["ACTIVE_DAYS"],
+    )
+    inference_engine.reload()
+    cache.clear()
+    return jsonify(
+        {
+            "model_file": inference_engine.model_file,
+            "data_file": inference_engine.data_file,
+        }
+    )
+
+
+@app.route("/metrics")
+def metrics():
+    """
+    Function handling /metrics request, counters and per-stage latency
+    histograms of this process
+
+    :return response: Prometheus text format, or json with format=json
+    """
+    if request.args.get("format") == "json":
+        return jsonify(METRICS.snapshot())
+    return Response(METRICS.prometheus(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/api/predict")
 # creates cache entry for each unique attribute combination of requests
 @cache.cached(
@@ -39,7 +186,7 @@ def predict():
     :return response: json containing date and corresponding sales information
     """
     date = request.args.get("date")
-    sales = infer(test_date=date, infer_level="day")
+    sales = engine().infer(test_date=date, infer_level="day")
     prediction = {
         "date": date,
         "sales": sales,
@@ -61,7 +208,9 @@ def predict_customer_sales():
     """
     date = request.args.get("date")
     customer_id = request.args.get("customer_id")
-    sales = infer(test_date=date, customer_id=customer_id, infer_level="customer")
+    sales = engine().infer(
+        test_date=date, customer_id=customer_id, infer_level="customer"
+    )
     prediction = {
         "date": date,
         "customer_id": customer_id,
@@ -85,7 +234,9 @@ def predict_product_sales():
     """
     date = request.args.get("date")
     product_id = request.args.get("product_id")
-    sales = infer(test_date=date, product_id=product_id, infer_level="product")
+    sales = engine().infer(
+        test_date=date, product_id=product_id, infer_level="product"
+    )
     prediction = {
         "date": date,
         "product_id": product_id,
@@ -111,7 +262,7 @@ def predict_customer_product_sales():
     date = request.args.get("date")
     customer_id = request.args.get("customer_id")
     product_id = request.args.get("product_id")
-    sales = infer(
+    sales = engine().infer(
         test_date=date,
         customer_id=customer_id,
         product_id=product_id,
@@ -126,5 +277,43 @@ def predict_customer_product_sales():
     return jsonify(prediction)
 
 
+@app.route("/api/predict_batch", methods=["GET", "POST"])
+def predict_batch():
+    """
+    Function handling /api/predict_batch request. Queries are either posted
+    as json {"queries": [{"date", "infer_level", "customer_id",
+    "product_id"}, ...]} or given as a date range with start_date, end_date,
+    infer_level, customer_id and product_id tags, or months instead of
+    end_date for whole months from the month of start_date. The format tag
+    selects a columnar json response (json, default) or one json object per
+    line (jsonl).
+
+    :return response: sales of every query, predicted once per month
+    """
+    body = request.get_json(silent=True) or {}
+    params = dict(request.args)
+    params.update({k: v for k, v in body.items() if k != "queries"})
+    if "queries" in body:
+        queries = body["queries"]
+    else:
+        queries = date_range_queries(
+            params["start_date"],
+            params.get("end_date"),
+            infer_level=params.get("infer_level", "day"),
+            customer_id=params.get("customer_id"),
+            product_id=params.get("product_id"),
+            n_months=int(params["months"]) if "months" in params else None,
+        )
+    output = engine().infer_batch(queries)
+    if params.get("format", "json") == "jsonl":
+        columns = list(output)
+        lines = (
+            json.dumps(dict(zip(columns, row))) + "\n"
+            for row in zip(*output.values())
+        )
+        return Response(lines, mimetype="application/x-ndjson")
+    return jsonify(output)
+
+
 if __name__ == "__main__":
     app.run()
@@ -0,0 +1,79 @@
+import logging
+import click
+
+from demand_sense.utils import setup_logging
+from demand_sense.trainer.backtest import backtest_model
+
+LOGGER = logging.getLogger(__name__)
+
+
+@click.command()
+@click.option(
+    "--log_level",
+    default="INFO",
+    type=click.Choice(["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG"]),
+)
+@click.option("--log_dir", default="")
+@click.option("--model_dir", default="model/")
+@click.option("--data_file", default="data/prepared_sales_data.csv")
+@click.option(
+    "--encoding",
+    default="onehot",
+    type=click.Choice(["onehot", "categorical"]),
+)
+@click.option("--n_folds", default=6)
+@click.option("--step_days", default=28)
+@click.option("--horizon", default=28)
+@click.option("--workers", default=1)
+@click.option("--num_boost_round", default=300)
+@click.option("--compact", is_flag=True)
+@click.option("--feature_jobs", default=1)
+def backtest(
+    log_level,
+    log_dir,
+    model_dir,
+    data_file,
+    encoding,
+    n_folds,
+    step_days,
+    horizon,
+    workers,
+    num_boost_round,
+    compact,
+    feature_jobs,
+):
+    """
+    Backtest module, evaluates the model over rolling forecast origins
+
+    :param log_level: str, logger level
+    :param log_dir: str, specific log directory
+    :param model_dir: str, model directory the metrics are saved in
+    :param data_file: str, data path
+    :param encoding: str, onehot encoded or integer coded categorical ids
+    :param n_folds: int, number of forecast origins
+    :param step_days: int, days between consecutive origins
+    :param horizon: int, number of days forecast from every origin
+    :param workers: int, number of folds trained in parallel
+    :param num_boost_round: int, boosting rounds of every fold
+    :param compact: bool, whether to store the features in small dtypes
+    :param feature_jobs: int, number of processes computing the series
+    features
+    """
+    setup_logging(log_level=log_level, log_dir=log_dir)
+    LOGGER.info(">backtesting model")
+    backtest_model(
+        model_dir,
+        data_file,
+        encoding,
+        n_folds,
+        step_days,
+        horizon,
+        workers,
+        num_boost_round,
+        compact,
+        feature_jobs,
+    )
+
+
+if __name__ == "__main__":
+    backtest()
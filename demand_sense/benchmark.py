@@ -0,0 +1,88 @@
+import sys
+import logging
+import click
+
+from demand_sense.utils import setup_logging
+from demand_sense.benchmarks.suite import run_suite
+from demand_sense.benchmarks.suite import save_run
+from demand_sense.benchmarks.suite import load_runs
+from demand_sense.benchmarks.suite import previous_run
+from demand_sense.benchmarks.suite import compare_runs
+from demand_sense.benchmarks.suite import FEATURE_CONFIGS
+from demand_sense.benchmarks.suite import RESULTS_FILE
+from demand_sense.benchmarks.suite import REGRESSION_RATIO
+from demand_sense.benchmarks.suite import DEFAULT_REPEAT
+
+LOGGER = logging.getLogger(__name__)
+
+
+@click.command()
+@click.option(
+    "--log_level",
+    default="INFO",
+    type=click.Choice(["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG"]),
+)
+@click.option("--log_dir", default="")
+@click.option("--customers", default=10)
+@click.option("--products", default=20)
+@click.option("--days", default=850)
+@click.option("--seed", default=0)
+@click.option(
+    "--config", default="full", type=click.Choice(sorted(FEATURE_CONFIGS))
+)
+@click.option("--repeat", default=DEFAULT_REPEAT)
+@click.option("--work_dir", default=None)
+@click.option("--results_file", default=RESULTS_FILE)
+@click.option("--regression_ratio", default=REGRESSION_RATIO)
+@click.option("--fail_on_regression", is_flag=True)
+def benchmark(
+    log_level,
+    log_dir,
+    customers,
+    products,
+    days,
+    seed,
+    config,
+    repeat,
+    work_dir,
+    results_file,
+    regression_ratio,
+    fail_on_regression,
+):
+    """
+    Benchmark module, times the feature, training and inference hot paths on
+    synthetic data and compares them with the previous stored run
+
+    :param log_level: str, logger level
+    :param log_dir: str, specific log directory
+    :param customers: int, number of customers of the synthetic data
+    :param products: int, number of products of the synthetic data
+    :param days: int, number of days of the synthetic data
+    :param seed: int, seed of the synthetic data
+    :param config: str, feature configuration of the feature benchmarks
+    :param repeat: int, number of timed calls per benchmark, train_model is
+    timed once
+    :param work_dir: str, directory of the data and model, temporary if None
+    :param results_file: str, JSON lines file the runs are appended to
+    :param regression_ratio: float, slowdown reported as a regression
+    :param fail_on_regression: bool, whether to exit with an error status
+    when a benchmark regressed
+    """
+    setup_logging(log_level=log_level, log_dir=log_dir)
+    LOGGER.info(">benchmarking")
+    run = run_suite(customers, products, days, seed, config, repeat, work_dir)
+    before = previous_run(load_runs(results_file), run["params"])
+    save_run(run, results_file)
+    if before is None:
+        LOGGER.info("No previous run with the same parameters")
+        return
+    comparison = compare_runs(before, run, regression_ratio)
+    regressions = comparison.index[comparison["regression"]].tolist()
+    if regressions:
+        LOGGER.warning("Regressions: %s", ", ".join(regressions))
+        if fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    benchmark()
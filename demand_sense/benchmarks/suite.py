@@ -0,0 +1,489 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import datetime
+import tempfile
+import subprocess
+import tracemalloc
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+from demand_sense.benchmarks.synthetic import write_synthetic_sales
+from demand_sense.feature_extractor.date_features import create_date_features
+from demand_sense.feature_extractor.series_features import series_features
+from demand_sense.feature_extractor.lag import lag_features
+from demand_sense.feature_extractor.rolling_mean import roll_mean_features
+from demand_sense.feature_extractor.expanding_mean_window import ewm_features
+from demand_sense.feature_extractor.feature_extractor import add_features
+from demand_sense.feature_extractor.feature_extractor import encode_features
+from demand_sense.feature_extractor.feature_extractor import get_processed_df
+from demand_sense.feature_extractor.feature_extractor import feature_columns
+from demand_sense.feature_extractor.feature_extractor import FEATURE_CONFIG
+from demand_sense.feature_extractor.feature_extractor import (
+    FULL_FEATURE_CONFIG,
+)
+from demand_sense.feature_extractor.encoding import categorical_features
+from demand_sense.trainer.train_model import train_model
+from demand_sense.inference_module.engine import InferenceEngine
+from demand_sense.inference_module.aggregates import INFER_LEVELS
+from demand_sense.inference_module.compiled_model import compile_booster
+from demand_sense.inference_module.compiled_model import parity_rows
+
+LOGGER = logging.getLogger(__name__)
+
+# results are kept at the root of the repository whatever the working
+# directory
+REPO_ROOT = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+RESULTS_FILE = os.path.join(REPO_ROOT, "benchmarks", "results.jsonl")
+# rows scored by the scoring benchmarks: one row and one series month
+SCORING_ROWS = (1, 31)
+FEATURE_CONFIGS = {"default": FEATURE_CONFIG, "full": FULL_FEATURE_CONFIG}
+# slowdown against the previous run reported as a regression
+REGRESSION_RATIO = 1.2
+# timed calls per benchmark; benchmarks timed fewer than MIN_REPEAT times,
+# such as train_model, are compared but never reported as regressions
+DEFAULT_REPEAT = 5
+MIN_REPEAT = 3
+
+
+def measure(name, function, items, repeat=1, setup=None):
+    """
+    Times a function over several calls, then records the peak memory it
+    allocates in one more call. The peak is traced with tracemalloc, which
+    slows down every allocation, so the timed calls run without it; it sees
+    the Python and numpy allocations but not the ones made inside LightGBM.
+
+    :param name: str, benchmark name
+    :param function: callable, the code being measured
+    :param items: int, rows or queries processed by one call
+    :param repeat: int, number of timed calls
+    :param setup: callable, returns the arguments of a call, run before
+    every call outside of the measurement
+
+    :return result: dict, benchmark name, fastest and median seconds,
+    number of timed calls, items, items per second and peak memory in MB
+    """
+    seconds = []
+    for _ in range(repeat):
+        args = setup() if setup is not None else None
+        start = time.perf_counter()
+        function(*(args or ()))
+        seconds.append(time.perf_counter() - start)
+    args = setup() if setup is not None else None
+    tracemalloc.start()
+    try:
+        function(*(args or ()))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    result = {
+        "benchmark": name,
+        "seconds": min(seconds),
+        "median_seconds": float(np.median(seconds)),
+        "repeat": repeat,
+        "items": items,
+        "items_per_second": items / max(min(seconds), 1e-9),
+        "peak_mb": peak / 2**20,
+    }
+    LOGGER.info(
+        "%-28s %10.4f s %10.4f s %14.1f items/s %10.1f MB",
+        name,
+        result["seconds"],
+        result["median_seconds"],
+        result["items_per_second"],
+        result["peak_mb"],
+    )
+    return result
+
+
+def feature_benchmarks(data, config, repeat=1):
+    """
+    Times every stage of get_processed_df and the lag, rolling mean and
+    expanding window features on their own
+
+    :param data: pandas.Dataframe, typed sales data
+    :param config: dict, feature configuration
+    :param repeat: int, number of calls per benchmark
+
+    :return results: list of dict, output of measure
+    """
+    rows = len(data)
+
+    def fresh():
+        return (data.copy(),)
+
+    def dated():
+        return (create_date_features(data.copy()),)
+
+    def featurized():
+        return (add_features(data.copy(), config),)
+
+    return [
+        measure("date_features", create_date_features, rows, repeat, fresh),
+        measure(
+            "series_features",
+            lambda df: series_features(
+                df,
+                lags=config["lags"],
+                windows=config["windows"],
+                alphas=config["alphas"],
+                ewm_lags=config["ewm_lags"],
+            ),
+            rows,
+            repeat,
+            dated,
+        ),
+        measure(
+            "encode_features",
+            lambda df: encode_features(df, config),
+            rows,
+            repeat,
+            featurized,
+        ),
+        measure(
+            "get_processed_df",
+            lambda df: get_processed_df(df, config),
+            rows,
+            repeat,
+            fresh,
+        ),
+        measure(
+            "lag_features",
+            lambda df: lag_features(df, config["lags"]),
+            rows,
+            repeat,
+            fresh,
+        ),
+        measure(
+            "roll_mean_features",
+            lambda df: roll_mean_features(df, config["windows"]),
+            rows,
+            repeat,
+            fresh,
+        ),
+        measure(
+            "ewm_features",
+            lambda df: ewm_features(df, config["alphas"], config["ewm_lags"]),
+            rows,
+            repeat,
+            fresh,
+        ),
+    ]
+
+
+def dataset_benchmark(data, config, repeat=1):
+    """
+    Times the construction of the LightGBM Dataset of the featurized data
+
+    :param data: pandas.Dataframe, typed sales data
+    :param config: dict, feature configuration
+    :param repeat: int, number of calls
+
+    :return result: dict, output of measure
+    """
+    data = get_processed_df(data.copy(), config)
+    features = feature_columns(data)
+    x_data, y_data = data[features], data["sales"]
+
+    def build():
+        lgb.Dataset(
+            x_data,
+            label=y_data,
+            feature_name=features,
+            categorical_feature=categorical_features(config),
+            params={"verbose": -1},
+        ).construct()
+
+    return measure("dataset_build", build, len(data), repeat)
+
+
+def training_benchmark(data_file, rows, model_dir):
+    """
+    Times train_model from the data file, the dataset cache included. It is
+    timed once, the model directory emptied before the timed and the traced
+    calls.
+
+    :param data_file: str, data file path
+    :param rows: int, number of rows of the data
+    :param model_dir: str, model directory, emptied before training
+
+    :return result: dict, output of measure
+    :return model_file: str, trained model file
+    """
+    result = measure(
+        "train_model",
+        lambda: train_model(model_dir, data_file),
+        rows,
+        setup=lambda: shutil.rmtree(model_dir, ignore_errors=True),
+    )
+    return result, os.path.join(model_dir, "model_trained.txt")
+
+
+def inference_benchmarks(model_file, data_file, data, repeat=1):
+    """
+    Times the engine load and every infer level, cold with the forecast and
+    cube caches emptied, then warm
+
+    :param model_file: str, trained model file
+    :param data_file: str, data file path
+    :param data: pandas.Dataframe, typed sales data of the data file
+    :param repeat: int, number of calls per benchmark
+
+    :return results: list of dict, output of measure
+    """
+    engines = []
+    results = [
+        measure(
+            "engine_load",
+            lambda: engines.append(InferenceEngine(model_file, data_file)),
+            1,
+            repeat,
+        )
+    ]
+    engine = engines[0]
+    test_date = (data["date"].max() + pd.Timedelta(days=1)).strftime("%d%m%Y")
+    customer_id = data["customer_id"].cat.categories[0]
+    product_id = data["product_id"].cat.categories[0]
+
+    def clear():
+        engine.forecast_cache.clear()
+        engine.cube_cache.clear()
+        engine.series_cache.clear()
+
+    for level in INFER_LEVELS:
+
+        def infer():
+            engine.infer(test_date, level, customer_id, product_id)
+
+        results.append(
+            measure("infer_" + level + "_cold", infer, 1, repeat, clear)
+        )
+        results.append(measure("infer_" + level + "_warm", infer, 1, repeat))
+    return results
+
+
+def scoring_benchmarks(model_file, repeat=1):
+    """
+    Times the scoring of small float32 inputs by the booster and by the
+    compiled trees walked by numpy and by the native kernel, after checking
+    that they agree
+
+    :param model_file: str, trained model file
+    :param repeat: int, number of calls per benchmark
+
+    :return results: list of dict, output of measure
+    """
+    booster = lgb.Booster(model_file=model_file)
+    compiled = {
+        "compiled": compile_booster(booster),
+        "native": compile_booster(booster, native=True),
+    }
+    x_data = parity_rows(compiled["compiled"], max(SCORING_ROWS)).astype(
+        np.float32
+    )
+    results = []
+    for rows in SCORING_ROWS:
+        x_rows = x_data[:rows]
+        results.append(
+            measure(
+                "score_lightgbm_{}".format(rows),
+                lambda: booster.predict(x_rows),
+                rows,
+                repeat,
+            )
+        )
+        for name, model in compiled.items():
+            results.append(
+                measure(
+                    "score_{}_{}".format(name, rows),
+                    lambda: model.predict(x_rows),
+                    rows,
+                    repeat,
+                )
+            )
+    return results
+
+
+def git_commit():
+    """
+    :return commit: str, commit of the working tree, with a + when it has
+    uncommitted changes, empty outside of a git repository
+    """
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=cwd,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=cwd,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+    return commit + "+" if dirty else commit
+
+
+def run_suite(
+    n_customers=10,
+    n_products=20,
+    n_days=850,
+    seed=0,
+    config_name="full",
+    repeat=DEFAULT_REPEAT,
+    work_dir=None,
+):
+    """
+    Runs all benchmarks on synthetic sales data. train_model and inference
+    use the default feature configuration of training, the feature and
+    Dataset benchmarks the configuration named config_name.
+
+    :param n_customers: int, number of customers of the synthetic data
+    :param n_products: int, number of products of the synthetic data
+    :param n_days: int, number of days of the synthetic data
+    :param seed: int, seed of the synthetic data
+    :param config_name: str, default or full feature configuration
+    :param repeat: int, number of timed calls per benchmark, training is
+    timed once
+    :param work_dir: str, directory of the data and model, a temporary
+    directory removed at the end if None
+
+    :return run: dict, commit, time, versions, parameters and results
+    """
+    params = {
+        "n_customers": n_customers,
+        "n_products": n_products,
+        "n_days": n_days,
+        "seed": seed,
+        "config": config_name,
+        "repeat": repeat,
+    }
+    config = FEATURE_CONFIGS[config_name]
+    tmp_dir = None
+    if work_dir is None:
+        work_dir = tmp_dir = tempfile.mkdtemp(prefix="demand_sense_bench_")
+    try:
+        data_file = os.path.join(work_dir, "sales.csv")
+        data = write_synthetic_sales(
+            data_file,
+            n_customers=n_customers,
+            n_products=n_products,
+            n_days=n_days,
+            seed=seed,
+        )
+        results = feature_benchmarks(data, config, repeat)
+        results.append(dataset_benchmark(data, config, repeat))
+        result, model_file = training_benchmark(
+            data_file, len(data), os.path.join(work_dir, "model")
+        )
+        results.append(result)
+        results += scoring_benchmarks(model_file, repeat)
+        results += inference_benchmarks(model_file, data_file, data, repeat)
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {
+        "commit": git_commit(),
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "versions": {
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "lightgbm": lgb.__version__,
+        },
+        "params": params,
+        "results": results,
+    }
+
+
+def save_run(run, results_file=RESULTS_FILE):
+    """
+    Appends a run to the JSON lines results file
+
+    :param run: dict, output of run_suite
+    :param results_file: str, results file path
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(results_file)), exist_ok=True)
+    with open(results_file, "a") as f:
+        f.write(json.dumps(run) + "\n")
+    LOGGER.info("Benchmark results saved: %s", results_file)
+
+
+def load_runs(results_file=RESULTS_FILE):
+    """
+    :param results_file: str, results file path
+
+    :return runs: list of dict, stored runs oldest first
+    """
+    if not os.path.isfile(results_file):
+        return []
+    with open(results_file) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def previous_run(runs, params):
+    """
+    :param runs: list of dict, output of load_runs
+    :param params: dict, parameters of the run to compare
+
+    :return run: dict, latest stored run with the same parameters, None if
+    there is none
+    """
+    matching = [run for run in runs if run["params"] == params]
+    return matching[-1] if matching else None
+
+
+def compare_runs(before, after, ratio=REGRESSION_RATIO):
+    """
+    Compares the fastest timings of two runs with the same parameters. A
+    benchmark timed fewer than MIN_REPEAT times in either run is compared
+    but not reported as a regression, a single call being too noisy.
+
+    :param before: dict, baseline run
+    :param after: dict, new run
+    :param ratio: float, slowdown reported as a regression
+
+    :return comparison: pandas.Dataframe, seconds of both runs, their ratio
+    and whether it is a regression, per benchmark
+    """
+    baseline = {r["benchmark"]: r for r in before["results"]}
+    rows = [
+        {
+            "benchmark": r["benchmark"],
+            "before": baseline[r["benchmark"]]["seconds"],
+            "after": r["seconds"],
+            # runs saved before the repeat was recorded per benchmark
+            "repeat": min(
+                baseline[r["benchmark"]].get("repeat", 1),
+                r.get("repeat", 1),
+            ),
+        }
+        for r in after["results"]
+        if r["benchmark"] in baseline
+    ]
+    comparison = pd.DataFrame(
+        rows, columns=["benchmark", "before", "after", "repeat"]
+    ).set_index("benchmark")
+    comparison["ratio"] = comparison["after"] / comparison["before"]
+    comparison["regression"] = (comparison["ratio"] > ratio) & (
+        comparison["repeat"] >= MIN_REPEAT
+    )
+    LOGGER.info(
+        "Compared with %s (%s):\n%s",
+        before["commit"] or "unknown commit",
+        before["time"],
+        comparison.to_string(float_format="%.4f"),
+    )
+    return comparison
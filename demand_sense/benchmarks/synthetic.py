@@ -0,0 +1,77 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+
+from demand_sense.storage.loader import cast_sales_data
+
+LOGGER = logging.getLogger(__name__)
+
+
+def synthetic_sales(
+    n_customers=20,
+    n_products=50,
+    n_days=850,
+    start_date="2017-01-01",
+    seed=0,
+):
+    """
+    Daily sales of every (customer, product) series with a series level,
+    weekly and yearly seasonality and Poisson counts, in the layout of the
+    prepared sales data. The defaults span the train and validation periods.
+
+    :param n_customers: int, number of customers
+    :param n_products: int, number of products
+    :param n_days: int, number of days from start_date
+    :param start_date: str, first date of the sales
+    :param seed: int, seed of the generator
+
+    :return data: pandas.Dataframe, typed sales data sorted by date
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start_date, periods=n_days, freq="D")
+    n_series = n_customers * n_products
+    level = rng.gamma(2.0, 2.0, size=n_series)
+    weekly = 1 + 0.3 * rng.standard_normal((n_series, 7))
+    phase = rng.uniform(0, 2 * np.pi, size=n_series)
+    day_of_year = dates.dayofyear.to_numpy()
+    yearly = 1 + 0.2 * np.sin(
+        2 * np.pi * day_of_year[:, None] / 365.25 + phase
+    )
+    rate = (
+        level
+        * np.clip(weekly[:, dates.dayofweek.to_numpy()].T, 0.1, None)
+        * yearly
+    )
+    sales = rng.poisson(rate).astype(np.float32)
+    customers = np.repeat(
+        ["C{:04d}".format(i) for i in range(n_customers)], n_products
+    )
+    products = np.tile(
+        ["P{:04d}".format(i) for i in range(n_products)], n_customers
+    )
+    data = pd.DataFrame(
+        {
+            "date": np.repeat(dates.to_numpy(), n_series),
+            "customer_id": np.tile(customers, n_days),
+            "product_id": np.tile(products, n_days),
+            "sales": sales.ravel(),
+        }
+    )
+    return cast_sales_data(data)
+
+
+def write_synthetic_sales(data_file, **kwargs):
+    """
+    Writes synthetic sales data as a CSV file readable by load_sales_data
+
+    :param data_file: str, CSV file path
+    :param kwargs: arguments of synthetic_sales
+
+    :return data: pandas.Dataframe, the data written
+    """
+    data = synthetic_sales(**kwargs)
+    os.makedirs(os.path.dirname(os.path.abspath(data_file)), exist_ok=True)
+    data.to_csv(data_file, index=False, date_format="%Y-%m-%d")
+    LOGGER.info("Synthetic sales: %s rows in %s", len(data), data_file)
+    return data
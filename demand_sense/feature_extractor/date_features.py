@@ -1,11 +1,56 @@
-def create_date_features(df):
+import numpy as np
+
+# smallest integer types holding every date feature, used in compact mode
+COMPACT_DATE_DTYPES = {
+    "month": np.int8,
+    "day_of_month": np.int8,
+    "day_of_year": np.int16,
+    "week_of_year": np.int8,
+    "day_of_week": np.int8,
+    "year": np.int16,
+    "is_wknd": np.int8,
+    "is_month_start": np.int8,
+    "is_month_end": np.int8,
+}
+
+
+def create_compact_date_features(df):
+    """
+    Extracts the date features of create_date_features as int8 / int16
+    columns, converting every accessor result once
+
+    :param df: pandas.Dataframe, time series data
+
+    :return df: pandas.Dataframe, input dataframe with date features
+    """
+    dates = df.date.dt
+    values = {
+        "month": dates.month,
+        "day_of_month": dates.day,
+        "day_of_year": dates.dayofyear,
+        "week_of_year": dates.isocalendar().week,
+        "day_of_week": dates.dayofweek,
+        "year": dates.year,
+        "is_wknd": dates.weekday // 4,
+        "is_month_start": dates.is_month_start,
+        "is_month_end": dates.is_month_end,
+    }
+    for name, dtype in COMPACT_DATE_DTYPES.items():
+        df[name] = values.pop(name).to_numpy(dtype=dtype)
+    return df
+
+
+def create_date_features(df, compact=False):
     """
     Extracts date features for time series data
 
     :param df: pandas.Dataframe, time series data
+    :param compact: bool, whether to emit int8 / int16 columns
 
     :return df: pandas.Dataframe, input dataframe with date features
     """
+    if compact:
+        return create_compact_date_features(df)
     df["month"] = df.date.dt.month
     df["day_of_month"] = df.date.dt.day
     df["day_of_year"] = df.date.dt.dayofyear
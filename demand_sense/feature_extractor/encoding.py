@@ -0,0 +1,88 @@
+import os
+import json
+import logging
+import numpy as np
+import pandas as pd
+
+LOGGER = logging.getLogger(__name__)
+
+ID_COLUMNS = ["customer_id", "product_id"]
+# features passed to LightGBM as categorical_feature in categorical mode
+CATEGORICAL_FEATURES = ["customer_id", "product_id", "day_of_week", "month"]
+# columns one-hot encoded in onehot mode
+ONEHOT_COLUMNS = ["customer_id", "product_id", "day_of_week", "month"]
+CATEGORY_MAPPING_FILE = "category_mapping.json"
+
+
+def categorical_features(config):
+    """
+    :param config: dict, feature configuration, onehot encoding if None
+
+    :return categorical_feature: list or "auto", categorical_feature argument
+    of lgb.Dataset
+    """
+    if config and config.get("encoding") == "categorical":
+        return CATEGORICAL_FEATURES
+    return "auto"
+
+
+def fit_category_mapping(data, mapping=None):
+    """
+    Builds the integer code mapping of the id columns. Codes of an existing
+    mapping are kept and unseen ids are appended, so that codes stay stable
+    across retrains.
+
+    :param data: pandas.Dataframe, sales data with id columns
+    :param mapping: dict, existing mapping of column to list of ids
+
+    :return mapping: dict, column to list of ids, the code of an id being its
+    position in the list
+    """
+    mapping = {col: list((mapping or {}).get(col, [])) for col in ID_COLUMNS}
+    for col in ID_COLUMNS:
+        known = set(mapping[col])
+        new_ids = sorted(set(data[col].astype(str).unique()).difference(known))
+        mapping[col].extend(new_ids)
+        LOGGER.info("%s: %s ids, %s new", col, len(mapping[col]), len(new_ids))
+    return mapping
+
+
+def encode_ids(data, mapping):
+    """
+    Replaces the id columns by their integer codes, -1 for unknown ids
+
+    :param data: pandas.Dataframe, sales data with id columns
+    :param mapping: dict, output of fit_category_mapping
+
+    :return data: pandas.Dataframe with integer coded id columns
+    """
+    for col in ID_COLUMNS:
+        codes = pd.Categorical(
+            data[col].astype(str), categories=mapping[col]
+        ).codes
+        data[col] = codes.astype(np.int32)
+    return data
+
+
+def save_category_mapping(mapping, model_dir):
+    """
+    :param mapping: dict, output of fit_category_mapping
+    :param model_dir: str, model directory
+    """
+    path = os.path.join(model_dir, CATEGORY_MAPPING_FILE)
+    with open(path, "w") as f:
+        json.dump(mapping, f)
+    LOGGER.info("Category mapping saved: %s", path)
+
+
+def load_category_mapping(model_dir):
+    """
+    :param model_dir: str, model directory
+
+    :return mapping: dict, saved mapping or None if there is none
+    """
+    path = os.path.join(model_dir, CATEGORY_MAPPING_FILE)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
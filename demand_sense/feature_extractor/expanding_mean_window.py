@@ -1,4 +1,4 @@
-from demand_sense.feature_extractor.utils import random_noise
+from demand_sense.feature_extractor.series_features import series_features
 
 
 def ewm_features(dataframe, alphas, lags):
@@ -9,18 +9,7 @@ def ewm_features(dataframe, alphas, lags):
     :param alphas: list, alpha values for expanding window mean calculation
     :param lags: list, lag values to shift time data
 
-    :return dataframe: pandas.Dataframe with expanding window mean features
+    :return dataframe: pandas.Dataframe with expanding window mean features,
+    without training noise
     """
-    for alpha in alphas:
-        for lag in lags:
-            dataframe[
-                "sales_ewm_alpha_"
-                + str(alpha).replace(".", "")
-                + "_lag_"
-                + str(lag)
-            ] = dataframe.groupby(["customer_id", "product_id"])[
-                "sales"
-            ].transform(
-                lambda x: x.shift(lag).ewm(alpha=alpha).mean()
-            )
-    return dataframe
+    return series_features(dataframe, alphas=alphas, ewm_lags=lags)
@@ -1,48 +1,225 @@
+import math
+import logging
+import numpy as np
 import pandas as pd
 
-from demand_sense.feature_extractor.lag import lag_features
 from demand_sense.feature_extractor.date_features import create_date_features
-from demand_sense.feature_extractor.rolling_mean import roll_mean_features
-from demand_sense.feature_extractor.expanding_mean_window import ewm_features
+from demand_sense.feature_extractor.series_features import series_features
+from demand_sense.feature_extractor.encoding import ONEHOT_COLUMNS
+from demand_sense.feature_extractor.encoding import encode_ids
 
+LOGGER = logging.getLogger(__name__)
 
-def get_processed_df(data):
+# series features of the sales per (customer, product)
+FEATURE_CONFIG = {
+    # lag features by shifting time data
+    "lags": [91, 98, 105],
+    # rolling mean as a window
+    "windows": [],
+    # expanding window features across various lags and alpha values
+    "alphas": [],
+    "ewm_lags": [],
+    # onehot: pd.get_dummies, categorical: integer codes for LightGBM
+    "encoding": "onehot",
+    # int8 / int16 date features, float32 series features and uint8 dummies
+    "compact": False,
+    # seed of the noise added to the lag and rolling mean features in training
+    "noise_seed": 0,
+}
+
+# richer feature set, affordable with the vectorized series features
+FULL_FEATURE_CONFIG = {
+    "lags": [91, 98, 105, 112, 119, 126, 182, 364, 546],
+    "windows": [365, 546],
+    "alphas": [0.95, 0.9, 0.8, 0.7, 0.5],
+    "ewm_lags": [91, 98, 105, 112, 180, 270, 365, 546, 728],
+    "encoding": "onehot",
+    "compact": False,
+    "noise_seed": 0,
+}
+
+# train / validation boundaries used by split
+TRAIN_END = "2019-01-01"
+VALIDATION_END = "2019-04-01"
+
+# relative weight below which expanding window history is ignored when
+# slicing the history needed for new rows
+EWM_TOLERANCE = 1e-6
+
+
+def history_lookback(config=None, ewm_tolerance=EWM_TOLERANCE):
     """
-    Extracts features in the time series data
+    Number of trailing rows per series the series features of a new row
+    depend on
+
+    :param config: dict, series feature configuration, FEATURE_CONFIG if None
+    :param ewm_tolerance: float, weight of the expanding window history that
+    may be dropped
+
+    :return lookback: int, number of history rows needed
+    """
+    config = config or FEATURE_CONFIG
+    lookback = max(config["lags"], default=0)
+    if config["windows"]:
+        # rolling means are taken over the series shifted by one
+        lookback = max(lookback, max(config["windows"]) + 1)
+    if config["alphas"] and config["ewm_lags"]:
+        decay = max(1 - alpha for alpha in config["alphas"])
+        span = 1
+        if decay > 0:
+            span = int(math.ceil(math.log(ewm_tolerance) / math.log(decay)))
+        lookback = max(lookback, max(config["ewm_lags"]) + span)
+    return lookback
+
+
+def horizon_step(config=None):
+    """
+    Number of days that can be forecast in one pass after the last day of
+    known sales: the lag and expanding window features of those days look
+    back before that day
+
+    :param config: dict, series feature configuration, FEATURE_CONFIG if None
+
+    :return step: int, shortest lag, None without lag features
+    """
+    config = config or FEATURE_CONFIG
+    lags = list(config["lags"])
+    if config["alphas"]:
+        lags += list(config["ewm_lags"])
+    return min(lags, default=None)
+
+
+def add_features(data, config=None, noise_seed=None, n_jobs=1):
+    """
+    Extracts date and series features in the time series data
 
     :param data: pandas.Dataframe, time series data
+    :param config: dict, feature configuration, FEATURE_CONFIG if None
+    :param noise_seed: int or list of int, seed of the noise added to the lag
+    and rolling mean features when training, no noise at inference (None)
+    :param n_jobs: int, number of processes the series features are computed
+    in, partitioned by series
 
-    :return data: pandas.Dataframe, time series data with various features
+    :return data: pandas.Dataframe, time series data with features, ids not
+    encoded yet
     """
+    config = config or FEATURE_CONFIG
+    compact = config.get("compact", False)
 
     # creates date features such as month, weekend, year, day of week
-    data = create_date_features(data)
-    # lag features by shifting time data
-    data = lag_features(data, [91, 98, 105,
-                               # 112, 119, 126, 182, 364, 546
-                               ])
-    # rolling mean as a window
-    # data = roll_mean_features(data, [365, 546])
-    # alphas = [0.95, 0.9, 0.8, 0.7, 0.5]
-    # lags = [91, 98, 105, 112, 180, 270, 365, 546, 728]
-    # expanding window features across various lags and alpha values
-    # data = ewm_features(data, alphas, lags)
-    # encode categorical features
-    data = pd.get_dummies(
-        data, columns=["customer_id", "product_id", "day_of_week", "month"]
+    data = create_date_features(data, compact)
+    # lag, rolling mean and expanding window features in a single pass
+    data = series_features(
+        data,
+        lags=config["lags"],
+        windows=config["windows"],
+        alphas=config["alphas"],
+        ewm_lags=config["ewm_lags"],
+        dtype=np.float32 if compact else np.float64,
+        noise_seed=noise_seed,
+        n_jobs=n_jobs,
     )
     return data
 
 
+def encode_features(data, config=None, mapping=None):
+    """
+    Encodes the categorical features
+
+    :param data: pandas.Dataframe, output of add_features
+    :param config: dict, feature configuration, FEATURE_CONFIG if None
+    :param mapping: dict, id code mapping, required for categorical encoding
+
+    :return data: pandas.Dataframe with encoded categorical features
+    """
+    config = config or FEATURE_CONFIG
+    if config.get("encoding") == "categorical":
+        return encode_ids(data, mapping)
+    if config.get("compact"):
+        return pd.get_dummies(data, columns=ONEHOT_COLUMNS, dtype=np.uint8)
+    return pd.get_dummies(data, columns=ONEHOT_COLUMNS)
+
+
+def get_processed_df(
+    data, config=None, mapping=None, noise_seed=None, n_jobs=1
+):
+    """
+    Extracts features in the time series data
+
+    :param data: pandas.Dataframe, time series data
+    :param config: dict, feature configuration, FEATURE_CONFIG if None
+    :param mapping: dict, id code mapping, required for categorical encoding
+    :param noise_seed: int or list of int, seed of the training noise, no
+    noise if None
+    :param n_jobs: int, number of processes the series features are computed
+    in, partitioned by series
+
+    :return data: pandas.Dataframe, time series data with various features
+    """
+    data = add_features(data, config, noise_seed, n_jobs)
+    # encode categorical features
+    data = encode_features(data, config, mapping)
+    LOGGER.debug("Feature frame: %.1f bytes per row", bytes_per_row(data))
+    return data
+
+
+def bytes_per_row(data):
+    """
+    :param data: pandas.Dataframe
+
+    :return size: float, memory of the frame and its index divided by the
+    number of rows
+    """
+    return data.memory_usage(deep=True).sum() / max(len(data), 1)
+
+
+def memory_report(data, config=None, mapping=None):
+    """
+    Featurizes the data in the default and in the compact mode of the
+    configuration and compares the memory of the two feature frames
+
+    :param data: pandas.Dataframe, time series data, not modified
+    :param config: dict, feature configuration, FEATURE_CONFIG if None
+    :param mapping: dict, id code mapping, required for categorical encoding
+
+    :return report: dict, bytes per row of the sales data, of the default and
+    of the compact feature frames
+    """
+    config = config or FEATURE_CONFIG
+    report = {"input": bytes_per_row(data)}
+    for mode, compact in [("default", False), ("compact", True)]:
+        processed = get_processed_df(
+            data.copy(), dict(config, compact=compact), mapping
+        )
+        report[mode] = bytes_per_row(processed)
+        del processed
+    LOGGER.info(
+        "Bytes per row: input %.1f, features %.1f default, %.1f compact",
+        report["input"],
+        report["default"],
+        report["compact"],
+    )
+    return report
+
+
+def feature_columns(data):
+    """
+    :param data: pandas.Dataframe, output of get_processed_df
+
+    :return features: list, model input columns in order
+    """
+    return [
+        col for col in data.columns if col not in ["date", "sales", "year"]
+    ]
+
+
 def split(data):
-    train = data.loc[(data["date"] < "2019-01-01"), :]
+    train = data.loc[(data["date"] < TRAIN_END), :]
     # last three months data for validation
     val = data.loc[
-        (data["date"] >= "2019-01-01") & (data["date"] < "2019-04-01"), :
-    ]
-    train_features = [
-        col for col in train.columns if col not in ["date", "sales", "year"]
+        (data["date"] >= TRAIN_END) & (data["date"] < VALIDATION_END), :
     ]
+    train_features = feature_columns(train)
     y_train = train["sales"]
     x_train = train[train_features]
     y_val = val["sales"]
@@ -1,18 +1,16 @@
-from demand_sense.feature_extractor.utils import random_noise
+from demand_sense.feature_extractor.series_features import series_features
 
 
-def lag_features(dataframe, lags):
+def lag_features(dataframe, lags, noise_seed=0):
     """
     Estimate lag features for time series data
 
     :param dataframe: pandas.Dataframe, time series data
     :param lags: list, lag values to shift time data
+    :param noise_seed: int or list of int, seed of the training noise added
+    to the lag features, no noise if None
 
     :return dataframe: pandas.Dataframe with lag features
     """
     # then we define lag features function with added noise
-    for lag in lags:
-        dataframe["sales_lag_" + str(lag)] = dataframe.groupby(
-            ["customer_id", "product_id"]
-        )["sales"].transform(lambda x: x.shift(lag)) + random_noise(dataframe)
-    return dataframe
+    return series_features(dataframe, lags=lags, noise_seed=noise_seed)
@@ -1,23 +1,15 @@
-from demand_sense.feature_extractor.utils import random_noise
+from demand_sense.feature_extractor.series_features import series_features
 
 
-def roll_mean_features(dataframe, windows):
+def roll_mean_features(dataframe, windows, noise_seed=0):
     """
     Estimate rolling mean features for time series data
 
     :param dataframe: pandas.Dataframe, time series data
     :param windows: list, window lengths
+    :param noise_seed: int or list of int, seed of the training noise added
+    to the rolling mean features, no noise if None
 
     :return dataframe: pandas.Dataframe with rolling mean features
     """
-    for window in windows:
-        dataframe["sales_roll_mean_" + str(window)] = dataframe.groupby(
-            ["customer_id", "product_id"]
-        )["sales"].transform(
-            lambda x: x.shift(1)
-            .rolling(window=window, min_periods=10, win_type="triang")
-            .mean()
-        ) + random_noise(
-            dataframe
-        )
-    return dataframe
+    return series_features(dataframe, windows=windows, noise_seed=noise_seed)
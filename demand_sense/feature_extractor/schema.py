@@ -0,0 +1,123 @@
+import os
+import json
+import logging
+import numpy as np
+import pandas as pd
+
+from demand_sense.feature_extractor.encoding import ID_COLUMNS
+from demand_sense.feature_extractor.encoding import ONEHOT_COLUMNS
+from demand_sense.feature_extractor.feature_extractor import FEATURE_CONFIG
+
+LOGGER = logging.getLogger(__name__)
+
+SCHEMA_SUFFIX = "_schema.json"
+
+
+def schema_path(model_file):
+    """
+    :param model_file: str, path of the model
+
+    :return path: str, path of the feature schema saved next to the model
+    """
+    return os.path.splitext(model_file)[0] + SCHEMA_SUFFIX
+
+
+def build_feature_schema(x_train, config, mapping=None):
+    """
+    Describes the model input: feature order and dtypes, the feature
+    configuration and the vocabulary of every encoded categorical column
+
+    :param x_train: pandas.Dataframe, model input used for training
+    :param config: dict, feature configuration, FEATURE_CONFIG if None
+    :param mapping: dict, id code mapping for categorical encoding
+
+    :return schema: dict, feature schema
+    """
+    config = config or FEATURE_CONFIG
+    features = list(x_train.columns)
+    if config.get("encoding") == "categorical":
+        categories = {col: list(mapping[col]) for col in ID_COLUMNS}
+    else:
+        # vocabularies of the one-hot columns, in feature order
+        categories = {
+            col: [
+                name[len(col) + 1 :]
+                for name in features
+                if name.startswith(col + "_")
+            ]
+            for col in ONEHOT_COLUMNS
+        }
+    return {
+        "features": features,
+        "dtypes": {name: str(dtype) for name, dtype in x_train.dtypes.items()},
+        "config": dict(config),
+        "categories": categories,
+    }
+
+
+def save_feature_schema(schema, model_file):
+    """
+    :param schema: dict, output of build_feature_schema
+    :param model_file: str, path of the model the schema belongs to
+    """
+    path = schema_path(model_file)
+    with open(path, "w") as f:
+        json.dump(schema, f)
+    LOGGER.info("Feature schema saved: %s", path)
+
+
+def load_feature_schema(model_file):
+    """
+    :param model_file: str, path of the model
+
+    :return schema: dict, saved feature schema or None if there is none
+    """
+    path = schema_path(model_file)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def check_feature_schema(schema, booster):
+    """
+    Raises if the schema does not describe the input of the booster
+
+    :param schema: dict, output of build_feature_schema
+    :param booster: lightgbm.Booster, trained model
+    """
+    if schema["features"] != booster.feature_name():
+        raise ValueError("Feature schema does not match the model features")
+
+
+def build_feature_matrix(data, schema):
+    """
+    Fills the model input directly in the schema layout, encoding the
+    categorical columns from their vocabularies instead of one-hot encoding
+    and reindexing a dataframe
+
+    :param data: pandas.Dataframe, output of add_features
+    :param schema: dict, output of build_feature_schema
+
+    :return matrix: numpy array, rows of data by schema features
+    """
+    features = schema["features"]
+    index = {name: i for i, name in enumerate(features)}
+    matrix = np.zeros((len(data), len(features)))
+    categories = schema["categories"]
+    onehot = schema["config"].get("encoding") != "categorical"
+    for col, vocab in categories.items():
+        codes = pd.Categorical(data[col].astype(str), categories=vocab).codes
+        if onehot:
+            columns = np.array(
+                [index[col + "_" + value] for value in vocab], dtype=np.intp
+            )
+            rows = np.flatnonzero(codes >= 0)
+            matrix[rows, columns[codes[rows]]] = 1.0
+        else:
+            # unknown ids are coded -1, missing for LightGBM
+            matrix[:, index[col]] = codes
+    for name, i in index.items():
+        if name in data.columns and name not in categories:
+            matrix[:, i] = data[name].to_numpy(dtype=np.float64)
+    return matrix
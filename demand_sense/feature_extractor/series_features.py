@@ -0,0 +1,396 @@
+import os
+import shutil
+import logging
+import tempfile
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from demand_sense.feature_extractor.utils import noise_block
+
+LOGGER = logging.getLogger(__name__)
+
+SERIES_KEYS = ["customer_id", "product_id"]
+
+# series partitions per process, smaller partitions even out the uneven
+# lengths of the series
+PARTITIONS_PER_JOB = 4
+
+
+def lag_name(lag):
+    return "sales_lag_" + str(lag)
+
+
+def roll_mean_name(window):
+    return "sales_roll_mean_" + str(window)
+
+
+def ewm_name(alpha, lag):
+    return (
+        "sales_ewm_alpha_" + str(alpha).replace(".", "") + "_lag_" + str(lag)
+    )
+
+
+def triang_weights(window):
+    """
+    Symmetric triangular window, identical to scipy.signal.get_window(
+    "triang", window, fftbins=False) used by pandas for win_type="triang"
+
+    :param window: int, window length
+
+    :return weights: numpy array of window weights
+    """
+    if window == 1:
+        return np.ones(1)
+    n = np.arange(1, (window + 1) // 2 + 1)
+    if window % 2 == 0:
+        weights = (2 * n - 1.0) / window
+        return np.r_[weights, weights[::-1]]
+    weights = 2 * n / (window + 1.0)
+    return np.r_[weights, weights[-2::-1]]
+
+
+class SeriesLayout:
+    """
+    Rows of a frame sorted once by (customer, product, date). Every series
+    feature is computed on the sorted sales array for all series at once and
+    scattered back to the original row order.
+    """
+
+    def __init__(self, dataframe, keys=SERIES_KEYS):
+        codes = (
+            dataframe.groupby(keys, sort=False, observed=True)
+            .ngroup()
+            .to_numpy()
+        )
+        self.order = np.lexsort((dataframe["date"].to_numpy(), codes))
+        group = codes[self.order]
+        self.n_rows = len(group)
+        self.starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+        self.lengths = np.diff(np.r_[self.starts, self.n_rows])
+        self.pos = np.arange(self.n_rows) - np.repeat(
+            self.starts, self.lengths
+        )
+        # rows whose series keys are missing are left out, as in groupby
+        self.valid = group >= 0
+        self.values = dataframe["sales"].to_numpy(dtype=np.float64)[self.order]
+
+    @classmethod
+    def from_sorted(cls, values, lengths):
+        """
+        Layout of sales already sorted by series and date, such as a range
+        of series of another layout
+
+        :param values: numpy array, sales in series order
+        :param lengths: numpy array, number of rows of every series
+
+        :return layout: SeriesLayout in which the row order is the series
+        order
+        """
+        layout = cls.__new__(cls)
+        layout.n_rows = len(values)
+        layout.order = np.arange(layout.n_rows)
+        layout.lengths = np.asarray(lengths, dtype=np.int64)
+        layout.starts = np.cumsum(layout.lengths) - layout.lengths
+        layout.pos = np.arange(layout.n_rows) - np.repeat(
+            layout.starts, layout.lengths
+        )
+        layout.valid = np.ones(layout.n_rows, dtype=bool)
+        layout.values = np.asarray(values, dtype=np.float64)
+        return layout
+
+    def scatter(self, sorted_values, dtype=np.float64):
+        """
+        :param sorted_values: numpy array in series order
+        :param dtype: numpy dtype of the result
+
+        :return values: numpy array in the original row order
+        """
+        sorted_values = np.where(self.valid, sorted_values, np.nan)
+        values = np.empty(self.n_rows, dtype=dtype)
+        values[self.order] = sorted_values
+        return values
+
+    def shift(self, sorted_values, lag):
+        """
+        Equivalent of groupby(keys)[col].shift(lag) on sorted values
+        """
+        shifted = np.full(self.n_rows, np.nan)
+        if lag < self.n_rows:
+            shifted[lag:] = sorted_values[: self.n_rows - lag]
+            shifted[self.pos < lag] = np.nan
+        return shifted
+
+    def lag(self, lag):
+        return self.shift(self.values, lag)
+
+    def roll_mean(self, window, min_periods=10):
+        """
+        Equivalent of x.shift(1).rolling(window, min_periods,
+        win_type="triang").mean() per series, accumulated in the same order
+        as pandas so the result matches it exactly
+        """
+        weights = triang_weights(window)
+        n_series = len(self.starts)
+        n_steps = self.lengths.max() if n_series else 0
+        series = np.repeat(np.arange(n_series), self.lengths)
+        # series laid out as rows of a matrix left padded by the window, so
+        # that every window offset is a plain slice; padding and missing
+        # sales add exact zeros
+        observed = ~np.isnan(self.values)
+        padded = np.zeros((n_series, n_steps + window))
+        padded[series, self.pos + window] = np.where(
+            observed, self.values, 0.0
+        )
+        counted = np.zeros((n_series, n_steps + window))
+        counted[series, self.pos + window] = observed
+        total = np.zeros((n_series, n_steps))
+        total_weight = np.zeros((n_series, n_steps))
+        # blocks of series keep the accumulators in cache
+        block = 64
+        scratch = np.empty((block, n_steps))
+        for start in range(0, n_series, block):
+            stop = min(start + block, n_series)
+            tmp = scratch[: stop - start]
+            for win_i, weight in enumerate(weights):
+                # shift(1) followed by a look back of window - 1 - win_i rows
+                np.multiply(
+                    padded[start:stop, win_i : win_i + n_steps],
+                    weight,
+                    out=tmp,
+                )
+                total[start:stop] += tmp
+                np.multiply(
+                    counted[start:stop, win_i : win_i + n_steps],
+                    weight,
+                    out=tmp,
+                )
+                total_weight[start:stop] += tmp
+        cumulative = np.zeros((n_series, n_steps + window + 1))
+        np.cumsum(counted, axis=1, out=cumulative[:, 1:])
+        counts = (
+            cumulative[:, window : window + n_steps] - cumulative[:, :n_steps]
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / total_weight
+        mean[(counts < max(min_periods, 1)) | (total_weight == 0)] = np.nan
+        return mean[series, self.pos]
+
+    def ewm(self, alpha):
+        """
+        Equivalent of x.ewm(alpha=alpha).mean() per series (adjust=True,
+        ignore_na=False), iterating over time steps for all series at once
+        """
+        # pandas derives alpha back from the center of mass
+        com = (1.0 - alpha) / alpha
+        old_wt_factor = 1.0 - 1.0 / (1.0 + com)
+        new_wt = 1.0
+        n_series = len(self.starts)
+        weighted = np.full(n_series, np.nan)
+        old_wt = np.ones(n_series)
+        nobs = np.zeros(n_series)
+        result = np.full(self.n_rows, np.nan)
+        for step in range(self.lengths.max() if n_series else 0):
+            active = np.flatnonzero(self.lengths > step)
+            rows = self.starts[active] + step
+            cur = self.values[rows]
+            is_obs = ~np.isnan(cur)
+            nobs[active] += is_obs
+            if step == 0:
+                weighted[active] = cur
+            else:
+                w = weighted[active]
+                ow = old_wt[active]
+                has_w = ~np.isnan(w)
+                ow = np.where(has_w, ow * old_wt_factor, ow)
+                update = has_w & is_obs
+                mix = update & (w != cur)
+                w[mix] = (ow[mix] * w[mix] + new_wt * cur[mix]) / (
+                    ow[mix] + new_wt
+                )
+                ow[update] += new_wt
+                first = ~has_w & is_obs
+                w[first] = cur[first]
+                weighted[active] = w
+                old_wt[active] = ow
+            result[rows] = np.where(
+                nobs[active] >= 1, weighted[active], np.nan
+            )
+        return result
+
+
+def feature_names(lags=(), windows=(), alphas=(), ewm_lags=()):
+    """
+    :return names: list, series feature columns in the order of
+    sorted_features
+    """
+    names = [lag_name(lag) for lag in lags]
+    names += [roll_mean_name(window) for window in windows]
+    for alpha in alphas:
+        names += [ewm_name(alpha, lag) for lag in ewm_lags]
+    return names
+
+
+def sorted_features(layout, lags=(), windows=(), alphas=(), ewm_lags=()):
+    """
+    Lag, triangular rolling mean and expanding window mean features of every
+    series of the layout, in the order of feature_names
+
+    :param layout: SeriesLayout
+
+    :return features: generator of numpy arrays in series order
+    """
+    for lag in lags:
+        yield layout.lag(lag)
+    for window in windows:
+        yield layout.roll_mean(window)
+    for alpha in alphas:
+        if not len(ewm_lags):
+            continue
+        # the ewm of a shifted series is the shifted ewm of the series
+        ewm = layout.ewm(alpha)
+        for lag in ewm_lags:
+            yield layout.shift(ewm, lag)
+
+
+def series_partitions(lengths, n_partitions):
+    """
+    Splits consecutive series into ranges of about the same number of rows
+
+    :param lengths: numpy array, number of rows of every series
+    :param n_partitions: int, maximum number of ranges
+
+    :return bounds: numpy array, first series of every range followed by the
+    number of series
+    """
+    ends = np.cumsum(lengths)
+    targets = ends[-1] * np.arange(1, n_partitions) / n_partitions
+    cuts = np.searchsorted(ends, targets) + 1
+    return np.unique(np.r_[0, cuts, len(lengths)].clip(0, len(lengths)))
+
+
+def partition_features(
+    work_dir, first_row, lengths, lags, windows, alphas, ewm_lags
+):
+    """
+    Worker of parallel_features: computes the series features of a range of
+    series of the memory-mapped sorted sales into the memory-mapped feature
+    matrix
+
+    :param work_dir: str, directory of the values.npy and features.npy maps
+    :param first_row: int, first sorted row of the range
+    :param lengths: numpy array, number of rows of every series of the range
+    """
+    values = np.load(os.path.join(work_dir, "values.npy"), mmap_mode="r")
+    features = np.load(os.path.join(work_dir, "features.npy"), mmap_mode="r+")
+    rows = slice(first_row, first_row + int(np.sum(lengths)))
+    layout = SeriesLayout.from_sorted(values[rows], lengths)
+    for i, sorted_values in enumerate(
+        sorted_features(layout, lags, windows, alphas, ewm_lags)
+    ):
+        features[i, rows] = sorted_values
+    features.flush()
+
+
+def parallel_features(layout, lags, windows, alphas, ewm_lags, n_jobs):
+    """
+    sorted_features computed on ranges of series across a pool of processes.
+    The sorted sales and the feature matrix are memory-mapped files in a
+    temporary directory (under TMPDIR, e.g. /dev/shm to keep them in
+    memory), so the workers only receive the bounds of their series.
+
+    :param layout: SeriesLayout
+    :param n_jobs: int, number of processes
+
+    :return features: generator of numpy arrays in series order, the same as
+    sorted_features
+    """
+    bounds = series_partitions(layout.lengths, n_jobs * PARTITIONS_PER_JOB)
+    n_features = len(feature_names(lags, windows, alphas, ewm_lags))
+    work_dir = tempfile.mkdtemp(prefix="series_features_")
+    try:
+        np.save(os.path.join(work_dir, "values.npy"), layout.values)
+        features = np.lib.format.open_memmap(
+            os.path.join(work_dir, "features.npy"),
+            mode="w+",
+            dtype=np.float64,
+            shape=(n_features, layout.n_rows),
+        )
+        # spawned, forking after LightGBM used OpenMP may deadlock
+        context = multiprocessing.get_context("spawn")
+        n_workers = min(n_jobs, len(bounds) - 1)
+        with ProcessPoolExecutor(n_workers, mp_context=context) as executor:
+            futures = [
+                executor.submit(
+                    partition_features,
+                    work_dir,
+                    int(layout.starts[first]),
+                    layout.lengths[first:stop],
+                    lags,
+                    windows,
+                    alphas,
+                    ewm_lags,
+                )
+                for first, stop in zip(bounds[:-1], bounds[1:])
+            ]
+            for future in futures:
+                future.result()
+        LOGGER.debug(
+            "Series features of %s partitions in %s processes",
+            len(futures),
+            n_workers,
+        )
+        for i in range(n_features):
+            yield features[i]
+        del features
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def series_features(
+    dataframe,
+    lags=(),
+    windows=(),
+    alphas=(),
+    ewm_lags=(),
+    dtype=np.float64,
+    noise_seed=None,
+    n_jobs=1,
+):
+    """
+    Estimates lag, triangular rolling mean and expanding window mean features
+    for all (customer, product) series in a single pass over sorted arrays
+
+    :param dataframe: pandas.Dataframe, time series data
+    :param lags: list, lag values to shift time data
+    :param windows: list, rolling mean window lengths
+    :param alphas: list, alpha values for expanding window mean calculation
+    :param ewm_lags: list, lag values of the expanding window mean features
+    :param dtype: numpy dtype of the feature columns, the features are
+    computed in float64 and stored as dtype
+    :param noise_seed: int or list of int, seed of the noise added to the lag
+    and rolling mean features in training, no noise if None
+    :param n_jobs: int, number of processes the series are partitioned
+    across, computed in this process if 1
+
+    :return dataframe: pandas.Dataframe with lag, rolling mean and expanding
+    window mean features
+    """
+    layout = SeriesLayout(dataframe)
+    noise = None
+    n_noisy = len(lags) + len(windows)
+    if noise_seed is not None and n_noisy:
+        noise = noise_block(len(dataframe), n_noisy, noise_seed, dtype=dtype)
+    names = feature_names(lags, windows, alphas, ewm_lags)
+    if n_jobs > 1 and len(layout.starts) > 1 and names:
+        features = parallel_features(
+            layout, lags, windows, alphas, ewm_lags, n_jobs
+        )
+    else:
+        features = sorted_features(layout, lags, windows, alphas, ewm_lags)
+    for i, sorted_values in enumerate(features):
+        values = layout.scatter(sorted_values, dtype)
+        if noise is not None and i < n_noisy:
+            values += noise[i]
+        dataframe[names[i]] = values
+    return dataframe
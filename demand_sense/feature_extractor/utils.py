@@ -1,11 +1,23 @@
 import numpy as np
 
+# standard deviation of the noise added to the lag and rolling mean features
+NOISE_SCALE = 1.6
 
-def random_noise(data):
+
+def noise_block(n_rows, n_columns, seed, scale=NOISE_SCALE, dtype=np.float64):
     """
-    :param data: pandas.Dataframe, time series data
+    Gaussian noise of all the noise bearing features drawn at once from a
+    seeded generator, the same seed giving the same noise
+
+    :param n_rows: int, number of rows of the time series data
+    :param n_columns: int, number of noise bearing features
+    :param seed: int or list of int, seed of the generator
+    :param scale: float, standard deviation of the noise
+    :param dtype: numpy dtype, float32 or float64
 
-    :return data: numpy array of noise
+    :return noise: numpy array of shape (n_columns, n_rows)
     """
-    # add random noise to our dataset
-    return np.random.normal(scale=1.6, size=(len(data),))
+    rng = np.random.default_rng(seed)
+    noise = rng.standard_normal((n_columns, n_rows), dtype=dtype)
+    noise *= scale
+    return noise
@@ -3,6 +3,7 @@ import click
 
 from demand_sense.utils import setup_logging
 from demand_sense.inference_module.infer_model import infer
+from demand_sense.inference_module.infer_model import infer_horizon
 
 LOGGER = logging.getLogger(__name__)
 
@@ -24,6 +25,7 @@ LOGGER = logging.getLogger(__name__)
 )
 @click.option("--customer_id", default="S0028")
 @click.option("--product_id", default="P0268")
+@click.option("--months", default=1)
 def inference(
     log_level,
     log_dir,
@@ -33,6 +35,7 @@ def inference(
     infer_level,
     customer_id,
     product_id,
+    months,
 ):
     """
     Inference module
@@ -45,9 +48,22 @@ def inference(
     :param infer_level: str, type of sales statistics required
     :param customer_id: str, customer id
     :param product_id: str, product id
+    :param months: int, number of months from the month of the test date
+    forecast day by day, only the test date if 1
     """
     setup_logging(log_level=log_level, log_dir=log_dir)
     LOGGER.info(">inference model")
+    if months > 1:
+        infer_horizon(
+            model_file,
+            data_file,
+            test_date,
+            months,
+            infer_level,
+            customer_id,
+            product_id,
+        )
+        return
     infer(model_file, data_file, test_date, infer_level, customer_id, product_id)
 
 
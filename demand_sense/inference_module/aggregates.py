@@ -0,0 +1,152 @@
+import logging
+import numpy as np
+import pandas as pd
+
+from demand_sense.inference_module.test_helper import sales_d_m_or_y
+from demand_sense.inference_module.test_helper import truncate_dates
+from demand_sense.inference_module.hierarchy import Hierarchy
+from demand_sense.utils.profiling import span
+
+LOGGER = logging.getLogger(__name__)
+
+INFER_LEVELS = ["day", "customer", "product", "customer_product"]
+
+
+class SalesCube:
+    """
+    Daily sales of a forecast month summed per (customer, product) series
+    and day, with the total, customer and product levels summed from them
+    in one pass over the nodes of the month hierarchy. Every
+    infer level is then an index lookup instead of a filter over the month
+    frame. Ids in the categories of the month frame without rows, such as
+    the pairs left out of an active pairs forecast, have zero sales. The
+    levels are the bottom up sums of the predicted series, coherent by
+    construction.
+    """
+
+    def __init__(self, df_month):
+        """
+        :param df_month: pandas.Dataframe, output of forecast_month
+        """
+        dates = df_month["date"].to_numpy(dtype="datetime64[ns]")
+        self.first_date = truncate_dates(dates[:1], "monthly")[0]
+        days = ((dates - self.first_date) // np.timedelta64(1, "D")).astype(
+            np.int64
+        )
+        self.n_days = int(days.max()) + 1 if len(days) else 0
+        self.customers = df_month["customer_id"].cat.categories
+        self.products = df_month["product_id"].cat.categories
+        customer = df_month["customer_id"].cat.codes.to_numpy(np.int64)
+        product = df_month["product_id"].cat.codes.to_numpy(np.int64)
+        n_products = len(self.products)
+        # sorted pair codes of the series with rows in the month
+        self.pairs, series = np.unique(
+            customer * n_products + product, return_inverse=True
+        )
+        self.hierarchy = Hierarchy(
+            self.pairs // max(n_products, 1),
+            self.pairs % max(n_products, 1),
+            len(self.customers),
+            n_products,
+        )
+        # missing sales sum to zero as in pandas, the rows are still counted
+        sales = np.nan_to_num(df_month["sales"].to_numpy(dtype=np.float64))
+        bottom = np.bincount(
+            series * self.n_days + days,
+            weights=sales,
+            minlength=len(self.pairs) * self.n_days,
+        ).reshape(len(self.pairs), self.n_days)
+        with span("cube.aggregate", LOGGER):
+            self.nodes = self.hierarchy.aggregate(bottom)
+        self.day_rows = np.bincount(days, minlength=self.n_days)
+
+    @property
+    def day(self):
+        return self.nodes[0]
+
+    def day_index(self, dates):
+        """
+        :param dates: array of datetime64 values
+
+        :return days: numpy array, day of the month index, -1 outside it
+        """
+        dates = np.asarray(dates, dtype="datetime64[ns]")
+        days = (dates - self.first_date) // np.timedelta64(1, "D")
+        days = days.astype(np.int64)
+        days[(days < 0) | (days >= self.n_days)] = -1
+        return days
+
+    def lookup(self, infer_level, dates, customer_ids=None, product_ids=None):
+        """
+        Sales of many queries of one infer level
+
+        :param infer_level: str, type of sales statistics required
+        :param dates: array of datetime64 values
+        :param customer_ids: array of str, customer ids of the queries
+        :param product_ids: array of str, product ids of the queries
+
+        :return sales: numpy array, NaN for unknown ids and where the month
+        has no sales rows on the day
+        """
+        days = self.day_index(dates)
+        node = np.zeros(len(days), dtype=np.int64)
+        valid = days >= 0
+        if infer_level in ("customer", "customer_product"):
+            customer = self.customers.get_indexer(customer_ids)
+            node, valid = customer, valid & (customer >= 0)
+        if infer_level in ("product", "customer_product"):
+            product = self.products.get_indexer(product_ids)
+            node, valid = product, valid & (product >= 0)
+        if infer_level == "customer_product":
+            # known ids of a pair without rows in the month sold nothing
+            pair = customer * len(self.products) + product
+            node = np.searchsorted(self.pairs, pair)
+            stored = node < len(self.pairs)
+            stored[stored] = self.pairs[node[stored]] == pair[stored]
+        else:
+            stored = np.ones(len(days), dtype=bool)
+        stored &= valid
+        rows = np.where(stored, self.hierarchy.offsets[infer_level] + node, 0)
+        days = np.where(valid, days, 0)
+        found = valid & (self.day_rows[days] > 0)
+        totals = np.where(stored, self.nodes[rows, days], 0.0)
+        return np.where(found, totals, np.nan)
+
+    def sales(
+        self, test_date, infer_level="day", customer_id=None, product_id=None
+    ):
+        """
+        :param test_date: datetime.date, date of the sales report required
+        :param infer_level: str, type of sales statistics required
+        :param customer_id: str, customer id
+        :param product_id: str, product id
+
+        :return sales: float, sales statistics requested
+        """
+        sales = self.lookup(
+            infer_level,
+            [np.datetime64(pd.Timestamp(test_date))],
+            [str(customer_id)],
+            [str(product_id)],
+        )[0]
+        if np.isnan(sales):
+            raise KeyError("No sales rows on {}".format(test_date))
+        return float(sales)
+
+    def totals(self, time="daily"):
+        """
+        Total sales of the month rolled up per day, month or year
+
+        :param time: str, time frame daily, monthly or yearly
+
+        :return df_t: pandas.Dataframe, date and sales columns
+        """
+        observed = self.day_rows > 0
+        dates = self.first_date + np.arange(self.n_days).astype(
+            "timedelta64[D]"
+        )
+        df_t = pd.DataFrame(
+            {"date": dates[observed], "sales": self.day[observed]}
+        )
+        with span("cube.sales_d_m_or_y", LOGGER):
+            return sales_d_m_or_y(df_t, time)
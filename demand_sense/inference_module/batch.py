@@ -0,0 +1,109 @@
+import logging
+import numpy as np
+import pandas as pd
+
+from demand_sense.inference_module.aggregates import INFER_LEVELS
+
+LOGGER = logging.getLogger(__name__)
+
+QUERY_COLUMNS = ["date", "infer_level", "customer_id", "product_id"]
+
+
+def date_range_queries(
+    start_date,
+    end_date=None,
+    infer_level="day",
+    customer_id=None,
+    product_id=None,
+    n_months=None,
+):
+    """
+    Queries of one infer level for every day of a date range
+
+    :param start_date: str, first date in the format DDMMYYYY
+    :param end_date: str, last date in the format DDMMYYYY, the start date
+    if None and n_months is not given
+    :param infer_level: str, type of sales statistics required
+    :param customer_id: str, customer id
+    :param product_id: str, product id
+    :param n_months: int, number of months from the month of the start
+    date, taken instead of the end date
+
+    :return queries: list of dict with date, infer_level, customer_id and
+    product_id
+    """
+    start = pd.to_datetime(start_date, format="%d%m%Y")
+    if end_date is not None:
+        end = pd.to_datetime(end_date, format="%d%m%Y")
+    elif n_months:
+        end = start.to_period("M").to_timestamp() + pd.DateOffset(
+            months=n_months, days=-1
+        )
+    else:
+        end = start
+    dates = pd.date_range(start, end)
+    return [
+        {
+            "date": date.strftime("%d%m%Y"),
+            "infer_level": infer_level,
+            "customer_id": customer_id,
+            "product_id": product_id,
+        }
+        for date in dates
+    ]
+
+
+def batch_sales(engine, queries):
+    """
+    Answers many queries at any infer level, running the prediction once
+    per distinct forecast month. The months after the sales history, up to
+    the last one queried, are predicted in one horizon pass from the end of
+    the history; months within the history are predicted on their own.
+
+    :param engine: InferenceEngine, resident inference engine
+    :param queries: list of dict with date (DDMMYYYY), infer_level and the
+    customer_id and product_id the level requires
+
+    :return output: dict of columns date, infer_level, customer_id,
+    product_id and sales, None where the sales are unknown
+    """
+    frame = pd.DataFrame(list(queries), columns=QUERY_COLUMNS)
+    frame["infer_level"] = frame["infer_level"].fillna("day")
+    unknown = set(frame["infer_level"]).difference(INFER_LEVELS)
+    if unknown:
+        raise ValueError("Unknown infer level: {}".format(sorted(unknown)))
+    frame["test_date"] = pd.to_datetime(frame["date"], format="%d%m%Y")
+    sales = np.full(len(frame), np.nan)
+    months = frame.groupby(
+        [frame["test_date"].dt.year, frame["test_date"].dt.month]
+    )
+    LOGGER.info("%s queries over %s months", len(frame), months.ngroups)
+    future = frame["test_date"] >= engine.horizon_month
+    if future.any():
+        first, last = engine.horizon_month, frame["test_date"][future].max()
+        n_months = (last.year - first.year) * 12 + last.month - first.month + 1
+        # months evicted before their lookup would be predicted again
+        if n_months > engine.forecast_cache.max_entries:
+            raise ValueError(
+                "{} months after the sales history exceed the {} months of "
+                "the forecast cache".format(
+                    n_months, engine.forecast_cache.max_entries
+                )
+            )
+        engine.forecast_horizon(first, n_months)
+    for _, month_queries in months:
+        cube = engine.month_cube(month_queries["test_date"].iloc[0])
+        for infer_level, level_queries in month_queries.groupby("infer_level"):
+            rows = frame.index.get_indexer(level_queries.index)
+            sales[rows] = cube.lookup(
+                infer_level,
+                level_queries["test_date"],
+                level_queries["customer_id"].astype(str),
+                level_queries["product_id"].astype(str),
+            )
+    output = {
+        col: [None if pd.isna(v) else v for v in frame[col]]
+        for col in QUERY_COLUMNS
+    }
+    output["sales"] = [None if np.isnan(s) else float(s) for s in sales]
+    return output
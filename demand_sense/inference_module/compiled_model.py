@@ -0,0 +1,513 @@
+import os
+import ctypes
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+import lightgbm as lgb
+import numpy as np
+
+LOGGER = logging.getLogger(__name__)
+
+# |value| at or below which LightGBM takes a feature value as zero, the
+# float 1e-35 of its sources
+ZERO_THRESHOLD = float(np.float32(1e-35))
+# dump_model writes infinite thresholds as +-1e300
+INF_THRESHOLD = 1e300
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+MISSING_TYPES = {
+    "None": MISSING_NONE,
+    "Zero": MISSING_ZERO,
+    "NaN": MISSING_NAN,
+}
+# objectives whose prediction is the raw score, or its exponential
+IDENTITY_OBJECTIVES = {
+    "regression",
+    "regression_l1",
+    "huber",
+    "fair",
+    "quantile",
+    "mape",
+}
+EXP_OBJECTIVES = {"poisson", "gamma", "tweedie"}
+# largest input scored by the numpy walk, LightGBM is faster above
+COMPILED_MAX_ROWS = 64
+# bits of the node flags of the native kernel
+NAN_RIGHT, ZERO_MISSING, DEFAULT_RIGHT = 1, 2, 4
+# walks every tree of every row, summing the leaf values in tree order as
+# LightGBM does
+NATIVE_SOURCE = r"""
+#include <math.h>
+#include <stdint.h>
+
+#define ZERO_THRESHOLD %r
+
+void predict(const double *x, int64_t n_rows, int64_t n_features,
+             const int64_t *roots, int64_t n_trees, const int64_t *feature,
+             const double *threshold, const int64_t *children,
+             const uint8_t *flags, const int64_t *category_set,
+             const uint8_t *categories, int64_t width, const double *value,
+             double *out)
+{
+    for (int64_t r = 0; r < n_rows; ++r) {
+        const double *row = x + r * n_features;
+        double score = 0.0;
+        for (int64_t t = 0; t < n_trees; ++t) {
+            int64_t node = roots[t];
+            while (children[2 * node] != node) {
+                double v = row[feature[node]];
+                uint8_t f = flags[node];
+                if (fabs(v) <= ZERO_THRESHOLD) {
+                    v = 0.0;
+                }
+                int right;
+                if (isnan(v)) {
+                    right = (f & 1) != 0;
+                } else if (category_set[node] >= 0) {
+                    double c = trunc(v);
+                    right = !(c >= 0 && c < width
+                              && categories[category_set[node] * width
+                                            + (int64_t)c]);
+                } else if ((f & 2) && v == 0.0) {
+                    right = (f & 4) != 0;
+                } else {
+                    right = v > threshold[node];
+                }
+                node = children[2 * node + right];
+            }
+            score += value[node];
+        }
+        out[r] = score;
+    }
+}
+""" % (ZERO_THRESHOLD,)
+
+_NATIVE_LOCK = threading.Lock()
+# built kernel of the process, False once a build failed
+_NATIVE = None
+
+
+def native_kernel():
+    """
+    Builds the native tree walk with the C compiler of the CC environment
+    variable, cc by default, once per process. The shared library is built
+    in a private temporary directory removed once loaded.
+
+    :return kernel: ctypes function, None when no compiler is available
+    """
+    global _NATIVE
+    with _NATIVE_LOCK:
+        if _NATIVE is None:
+            _NATIVE = _build_native() or False
+        return _NATIVE or None
+
+
+def _build_native():
+    build_dir = tempfile.mkdtemp(prefix="demand_sense_trees_")
+    try:
+        source = os.path.join(build_dir, "trees.c")
+        library = os.path.join(build_dir, "trees.so")
+        with open(source, "w") as f:
+            f.write(NATIVE_SOURCE)
+        compiler = os.environ.get("CC", "cc")
+        subprocess.run(
+            [
+                compiler,
+                "-O2",
+                "-shared",
+                "-fPIC",
+                "-o",
+                library,
+                source,
+                "-lm",
+            ],
+            capture_output=True,
+            check=True,
+        )
+        kernel = ctypes.CDLL(library).predict
+    except (OSError, subprocess.CalledProcessError) as e:
+        LOGGER.warning("Native tree walk not built, using numpy: %s", e)
+        return None
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+    def array(dtype):
+        return np.ctypeslib.ndpointer(dtype, flags="C_CONTIGUOUS")
+
+    size = ctypes.c_int64
+    kernel.argtypes = [
+        array(np.float64),
+        size,
+        size,
+        array(np.int64),
+        size,
+        array(np.int64),
+        array(np.float64),
+        array(np.int64),
+        array(np.uint8),
+        array(np.int64),
+        array(np.uint8),
+        size,
+        array(np.float64),
+        array(np.float64),
+    ]
+    kernel.restype = None
+    return kernel
+
+
+class CompiledModel:
+    """
+    Tree ensemble of a LightGBM model flattened into node arrays. Rows are
+    scored by numpy gathers walking all the trees one level at a time for
+    all rows at once, or on request by a native walk of the trees built with
+    the C compiler at load; leaves point to themselves, so every numpy walk takes
+    the depth of the deepest tree. Splits follow LightGBM: values within
+    ZERO_THRESHOLD of zero are taken as zero, values <= threshold go left,
+    missing values go to the default side or are taken as zero, and
+    categorical values go left when they are in the split category set.
+    """
+
+    def __init__(self, model, native=False):
+        """
+        :param model: dict, output of lightgbm.Booster.dump_model
+        :param native: bool, whether to score with the native walk when it
+        can be built
+        """
+        objective = model.get("objective", "regression").split()[0]
+        if objective not in IDENTITY_OBJECTIVES | EXP_OBJECTIVES:
+            raise ValueError("Unsupported objective: {}".format(objective))
+        if model.get("num_tree_per_iteration", 1) != 1:
+            raise ValueError("Only single output models can be compiled")
+        self.objective = objective
+        self.num_features = model["max_feature_idx"] + 1
+        self.feature_names = model["feature_names"]
+        nodes = []
+        category_sets = []
+        self.roots = np.array(
+            [
+                self._add_node(tree["tree_structure"], nodes, category_sets)
+                for tree in model["tree_info"]
+            ],
+            dtype=np.int64,
+        )
+        self.depth = max(
+            (
+                self._depth(tree["tree_structure"])
+                for tree in model["tree_info"]
+            ),
+            default=0,
+        )
+        columns = list(zip(*nodes)) if nodes else [()] * 8
+        self.feature = np.array(columns[0], dtype=np.int64)
+        self.threshold = np.array(columns[1], dtype=np.float64)
+        left = np.array(columns[2], dtype=np.int64)
+        right = np.array(columns[3], dtype=np.int64)
+        # children of node i at 2 * i (left) and 2 * i + 1 (right)
+        self.children = np.stack([left, right], axis=1).ravel()
+        self.is_split = left != np.arange(len(left))
+        self.default_right = ~np.array(columns[4], dtype=bool)
+        missing = np.array(columns[5], dtype=np.int8)
+        self.category_set = np.array(columns[6], dtype=np.int64)
+        self.value = np.array(columns[7], dtype=np.float64)
+        self.categorical = self.category_set >= 0
+        # side of a NaN value: default side, or the side of zero. NaN casts
+        # to a negative category in LightGBM and goes right.
+        self.nan_right = np.where(
+            missing == MISSING_NONE, self.threshold < 0, self.default_right
+        )
+        self.nan_right[self.categorical] = True
+        self.nan_right[~self.is_split] = False
+        self.zero_missing = missing == MISSING_ZERO
+        width = max((max(s) + 1 for s in category_sets if s), default=1)
+        # category membership of every categorical split
+        self.categories = np.zeros(
+            (max(len(category_sets), 1), width), np.uint8
+        )
+        for i, values in enumerate(category_sets):
+            self.categories[i, list(values)] = 1
+        self.flags = (
+            self.nan_right * NAN_RIGHT
+            + self.zero_missing * ZERO_MISSING
+            + self.default_right * DEFAULT_RIGHT
+        ).astype(np.uint8)
+        self.kernel = native_kernel() if native else None
+
+    def _add_node(self, node, nodes, category_sets):
+        """
+        Appends a node and its subtree to the node list
+
+        :return index: int, index of the node
+        """
+        index = len(nodes)
+        if "leaf_value" in node:
+            if "leaf_coeff" in node:
+                raise ValueError("Linear trees can not be compiled")
+            # a leaf goes to itself whatever the value
+            nodes.append(
+                (0, np.inf, index, index, True, 0, -1, node["leaf_value"])
+            )
+            return index
+        nodes.append(None)
+        category_set = -1
+        threshold = node["threshold"]
+        if node["decision_type"] == "==":
+            category_set = len(category_sets)
+            category_sets.append(
+                [int(value) for value in str(threshold).split("||")]
+            )
+            threshold = np.inf
+        elif node["decision_type"] != "<=":
+            raise ValueError(
+                "Unsupported decision type: {}".format(node["decision_type"])
+            )
+        elif abs(threshold) >= INF_THRESHOLD:
+            threshold = np.copysign(np.inf, threshold)
+        left = self._add_node(node["left_child"], nodes, category_sets)
+        right = self._add_node(node["right_child"], nodes, category_sets)
+        nodes[index] = (
+            node["split_feature"],
+            float(threshold),
+            left,
+            right,
+            node["default_left"],
+            MISSING_TYPES[node["missing_type"]],
+            category_set,
+            0.0,
+        )
+        return index
+
+    def _depth(self, node):
+        if "leaf_value" in node:
+            return 0
+        return 1 + max(
+            self._depth(node["left_child"]), self._depth(node["right_child"])
+        )
+
+    @property
+    def native(self):
+        """
+        :return native: bool, whether rows are scored by the native walk
+        """
+        return self.kernel is not None
+
+    @classmethod
+    def from_booster(cls, booster, native=False):
+        """
+        :param booster: lightgbm.Booster, trained model, compiled up to its
+        best iteration as predicted by default
+        :param native: bool, whether to score with the native walk
+
+        :return model: CompiledModel
+        """
+        return cls(booster.dump_model(), native)
+
+    @classmethod
+    def from_model_file(cls, model_file, native=False):
+        """
+        :param model_file: str, saved LightGBM model
+        :param native: bool, whether to score with the native walk
+
+        :return model: CompiledModel
+        """
+        return cls.from_booster(lgb.Booster(model_file=model_file), native)
+
+    def raw_score(self, x_data):
+        """
+        :param x_data: numpy array of shape (rows, features), float32 or
+        float64, compared in double as LightGBM does
+
+        :return score: numpy array, sum of the leaf values of every row
+        """
+        x_data = np.ascontiguousarray(x_data, dtype=np.float64)
+        if x_data.ndim != 2 or x_data.shape[1] != self.num_features:
+            raise ValueError(
+                "Expected {} features, got shape {}".format(
+                    self.num_features, x_data.shape
+                )
+            )
+        if self.kernel is None:
+            return self._walk(x_data)
+        score = np.empty(len(x_data))
+        self.kernel(
+            x_data,
+            len(x_data),
+            self.num_features,
+            self.roots,
+            len(self.roots),
+            self.feature,
+            self.threshold,
+            self.children,
+            self.flags,
+            self.category_set,
+            self.categories,
+            self.categories.shape[1],
+            self.value,
+            score,
+        )
+        return score
+
+    def _walk(self, x_data):
+        n_rows, n_trees = len(x_data), len(self.roots)
+        flat = x_data.ravel()
+        zero = np.abs(flat) <= ZERO_THRESHOLD
+        if zero.any():
+            flat = np.where(zero, 0.0, flat)
+        offsets = np.repeat(np.arange(n_rows) * self.num_features, n_trees)
+        node = np.tile(self.roots, n_rows)
+        for _ in range(self.depth):
+            value = flat.take(offsets + self.feature.take(node))
+            # leaves and categorical splits have an infinite threshold
+            right = value > self.threshold.take(node)
+            nan = np.isnan(value)
+            if nan.any():
+                right[nan] = self.nan_right.take(node[nan])
+            zero = self.zero_missing.take(node)
+            if zero.any():
+                zero &= value == 0.0
+                right[zero] = self.default_right.take(node[zero])
+            split = self.categorical.take(node) & ~nan
+            if split.any():
+                right[split] = ~self._in_category(node[split], value[split])
+            node = self.children.take(2 * node + right)
+        return self.value.take(node).reshape(n_rows, n_trees).sum(axis=1)
+
+    def _in_category(self, node, value):
+        # LightGBM truncates the value to an int, negative values go right
+        category = np.trunc(value)
+        known = (category >= 0) & (category < self.categories.shape[1])
+        return known & self.categories[
+            self.category_set.take(node),
+            np.where(known, category, 0).astype(np.int64),
+        ].astype(bool)
+
+    def predict(self, x_data):
+        """
+        :param x_data: numpy array of shape (rows, features), float32 or
+        float64
+
+        :return preds: numpy array, predictions as lightgbm.Booster.predict
+        """
+        score = self.raw_score(x_data)
+        if self.objective in EXP_OBJECTIVES:
+            return np.exp(score)
+        return score
+
+
+def parity_rows(model, n_rows=256, seed=0):
+    """
+    Inputs exercising both sides of the splits: every feature takes the
+    thresholds of its splits, their neighbouring doubles, categories in and
+    out of the split sets, zeros and missing values
+
+    :param model: CompiledModel
+    :param n_rows: int, number of rows
+    :param seed: int, seed of the generator
+
+    :return x_data: numpy array of shape (n_rows, features)
+    """
+    rng = np.random.default_rng(seed)
+    x_data = rng.standard_normal((n_rows, model.num_features))
+    splits = np.flatnonzero(model.is_split)
+    for feature in range(model.num_features):
+        nodes = splits[model.feature[splits] == feature]
+        if not len(nodes):
+            continue
+        if model.categorical[nodes].any():
+            candidates = np.arange(-1, model.categories.shape[1] + 1)
+        else:
+            thresholds = model.threshold[nodes]
+            candidates = np.concatenate(
+                [
+                    thresholds,
+                    np.nextafter(thresholds, -np.inf),
+                    np.nextafter(thresholds, np.inf),
+                ]
+            )
+        candidates = np.concatenate([candidates, [0.0, np.nan]])
+        x_data[:, feature] = rng.choice(candidates, size=n_rows)
+    return x_data
+
+
+def check_parity(model, booster, x_data=None, tolerance=1e-9):
+    """
+    Raises if the compiled model and the booster disagree
+
+    :param model: CompiledModel
+    :param booster: lightgbm.Booster, model that was compiled
+    :param x_data: numpy array, inputs compared, parity_rows if None
+    :param tolerance: float, largest difference relative to the predictions
+
+    :return difference: float, largest absolute difference
+    """
+    if x_data is None:
+        x_data = parity_rows(model)
+    expected = booster.predict(x_data)
+    difference = float(np.max(np.abs(model.predict(x_data) - expected)))
+    scale = max(1.0, float(np.max(np.abs(expected))))
+    if difference > tolerance * scale:
+        raise ValueError(
+            "Compiled model differs from LightGBM by {}".format(difference)
+        )
+    return difference
+
+
+def compile_booster(booster, native=False):
+    """
+    Compiles the booster and checks the compiled trees against it
+
+    :param booster: lightgbm.Booster, trained model
+    :param native: bool, whether to score with the native walk when it can
+    be built
+
+    :return model: CompiledModel
+    """
+    model = CompiledModel.from_booster(booster, native)
+    difference = check_parity(model, booster)
+    LOGGER.info(
+        "Compiled %s trees of depth %s for the %s walk, parity within %.2e",
+        len(model.roots),
+        model.depth,
+        "native" if model.native else "numpy",
+        difference,
+    )
+    return model
+
+
+class Predictor:
+    """
+    Scores model inputs with the compiled trees, falling back to the booster
+    for dataframes and, with the numpy walk, for inputs large enough for
+    LightGBM to be faster
+    """
+
+    def __init__(self, booster, compiled=None, max_rows=None):
+        """
+        :param booster: lightgbm.Booster, trained model
+        :param compiled: CompiledModel, compiled booster, None to always
+        predict with the booster
+        :param max_rows: int, largest input scored by the compiled trees,
+        unbounded for the native walk and COMPILED_MAX_ROWS for the numpy
+        walk if None
+        """
+        self.booster = booster
+        self.compiled = compiled
+        if max_rows is None and compiled is not None and not compiled.native:
+            max_rows = COMPILED_MAX_ROWS
+        self.max_rows = max_rows
+
+    def predict(self, x_data):
+        """
+        :param x_data: numpy array or pandas.Dataframe, model input
+
+        :return preds: numpy array, predictions
+        """
+        if (
+            self.compiled is not None
+            and isinstance(x_data, np.ndarray)
+            and (self.max_rows is None or len(x_data) <= self.max_rows)
+        ):
+            return self.compiled.predict(x_data)
+        return self.booster.predict(
+            x_data, num_iteration=self.booster.best_iteration
+        )
@@ -0,0 +1,563 @@
+import os
+import time
+import logging
+import threading
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+from demand_sense.inference_module.forecast import check_and_generate_test_date
+from demand_sense.storage.loader import load_sales_data
+from demand_sense.inference_module.forecast import forecast_month
+from demand_sense.inference_module.forecast import forecast_horizon
+from demand_sense.inference_module.forecast import split_months
+from demand_sense.inference_module.forecast import month_range
+from demand_sense.inference_module.forecast import model_features
+from demand_sense.inference_module.test_helper import active_pairs
+from demand_sense.inference_module.forecast_cache import ForecastCache
+from demand_sense.inference_module.forecast_cache import DiskForecastCache
+from demand_sense.inference_module.forecast_cache import forecast_key
+from demand_sense.inference_module.batch import batch_sales
+from demand_sense.inference_module.aggregates import INFER_LEVELS
+from demand_sense.inference_module.aggregates import SalesCube
+from demand_sense.inference_module.single_flight import SingleFlight
+from demand_sense.inference_module.compiled_model import compile_booster
+from demand_sense.inference_module.compiled_model import Predictor
+from demand_sense.utils.profiling import span
+from demand_sense.utils.profiling import METRICS
+
+LOGGER = logging.getLogger(__name__)
+
+# lightgbm predicts with the booster, compiled with the compiled trees
+# walked by numpy, native with the compiled trees walked by a C kernel built
+# with the system compiler at load
+PREDICT_BACKENDS = ("lightgbm", "compiled", "native")
+
+# aggregates of the series predicted on their own by the compiled backends
+SERIES_CACHE_ENTRIES = 1024
+
+
+def file_stamp(path):
+    """
+    Cheap fingerprint of a file or of a columnar store directory on disk
+    used to detect changes
+
+    :param path: str, file or directory path
+
+    :return stamp: tuple, latest modification time in ns and size in bytes
+    """
+    if not os.path.isdir(path):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    mtime, size = os.stat(path).st_mtime_ns, 0
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            stat = os.stat(os.path.join(root, name))
+            mtime = max(mtime, stat.st_mtime_ns)
+            size += stat.st_size if name in files else 0
+    return mtime, size
+
+
+def stamp_version(stamp):
+    """
+    :param stamp: tuple, output of file_stamp
+
+    :return version: str, version string of the file
+    """
+    return "{}-{}".format(*stamp)
+
+
+class InferenceEngine:
+    """
+    Long-lived inference state: the booster and the typed sales history are
+    loaded once and kept resident so that every query is answered from
+    memory. Call reload() (or reload_if_changed()) after the model or the
+    data file is replaced on disk. Predicted months are kept in a forecast
+    cache keyed by model version, data version and month. With the compiled
+    and native backends the trees are compiled at every model load, the
+    native one building its C kernel then, and checked against the booster,
+    which is used instead when they disagree, and a customer, product or
+    customer-product query for a month not in the forecast cache predicts
+    only the series it selects. With active_days
+    only the customer, product pairs that sold in that many days before the
+    end of the history are forecast.
+    """
+
+    def __init__(
+        self,
+        model_file,
+        data_file,
+        forecast_cache=None,
+        backend="lightgbm",
+        active_days=None,
+    ):
+        if backend not in PREDICT_BACKENDS:
+            raise ValueError("Unknown predict backend: {}".format(backend))
+        self.model_file = model_file
+        self.data_file = data_file
+        self.backend = backend
+        self.active_days = active_days
+        if forecast_cache is None:
+            forecast_cache = ForecastCache()
+        self.forecast_cache = forecast_cache
+        # aggregates of the cached months, rebuilt from them when evicted
+        self.cube_cache = ForecastCache()
+        self.series_cache = ForecastCache(SERIES_CACHE_ENTRIES)
+        self.booster = None
+        self.predictor = None
+        self.config = None
+        self.mapping = None
+        self.schema = None
+        self.history = None
+        self.series = None
+        self.history_end = None
+        self.horizon_month = None
+        self._model_stamp = None
+        self._data_stamp = None
+        self._checked = None
+        self._lock = threading.RLock()
+        # concurrent requests for the same cold month share one prediction
+        self._flight = SingleFlight()
+        self.reload()
+
+    def _load_model(self):
+        LOGGER.info("Loading model: %s", self.model_file)
+        self._model_stamp = file_stamp(self.model_file)
+        with span("engine.load_model", LOGGER, logging.INFO):
+            self.booster = lgb.Booster(model_file=self.model_file)
+            self.config, self.mapping, self.schema = model_features(
+                self.model_file, self.booster
+            )
+        self.predictor = Predictor(self.booster, self._compile())
+
+    def _compile(self):
+        if self.backend == "lightgbm":
+            return None
+        with span("engine.compile_model", LOGGER, logging.INFO):
+            try:
+                return compile_booster(
+                    self.booster, native=self.backend == "native"
+                )
+            except ValueError as e:
+                LOGGER.warning("Predicting with LightGBM: %s", e)
+                return None
+
+    def _load_data(self):
+        LOGGER.info("Loading data: %s", self.data_file)
+        self._data_stamp = file_stamp(self.data_file)
+        with span("engine.load_data", LOGGER, logging.INFO):
+            self.history = load_sales_data(self.data_file)
+        self.series = self.history[
+            ["customer_id", "product_id"]
+        ].drop_duplicates()
+        self.history_end = self.history["date"].max() + pd.Timedelta(days=1)
+        # first month with days after the history
+        self.horizon_month, _ = month_range(self.history_end)
+
+    @property
+    def model_version(self):
+        return stamp_version(self._model_stamp)
+
+    @property
+    def data_version(self):
+        return stamp_version(self._data_stamp)
+
+    def reload(self):
+        """
+        Reloads both the model and the sales history from disk
+        """
+        with self._lock:
+            self._load_model()
+            self._load_data()
+            self.forecast_cache.clear()
+            self.cube_cache.clear()
+            self.series_cache.clear()
+
+    def reload_if_changed(self, min_interval=0.0):
+        """
+        Reloads the model and/or the sales history if the files on disk
+        changed since they were last loaded
+
+        :param min_interval: float, seconds since the last check below which
+        the files are not checked again, stamping a partitioned store walks
+        all its files
+
+        :return changed: bool, whether anything was reloaded
+        """
+        with self._lock:
+            now = time.monotonic()
+            if (
+                self._checked is not None
+                and now - self._checked < min_interval
+            ):
+                return False
+            self._checked = now
+            changed = False
+            if file_stamp(self.model_file) != self._model_stamp:
+                self._load_model()
+                changed = True
+            if file_stamp(self.data_file) != self._data_stamp:
+                self._load_data()
+                changed = True
+            if changed:
+                self.forecast_cache.clear()
+                self.cube_cache.clear()
+                self.series_cache.clear()
+            return changed
+
+    def month_key(self, test_date):
+        """
+        :param test_date: datetime.date, any date in the forecast month
+
+        :return key: tuple, forecast cache key of the month for the loaded
+        model and data
+        """
+        with self._lock:
+            return forecast_key(
+                self.model_version,
+                self.data_version,
+                test_date,
+                self.active_days,
+            )
+
+    def predict_month(self, test_date):
+        """
+        Predicts the month of the given date without the forecast cache
+
+        :param test_date: datetime.date, any date in the forecast month
+
+        :return df_month: pandas.Dataframe, output of forecast_month
+        """
+        with self._lock:
+            booster, history, series = self.booster, self.history, self.series
+            config, mapping, schema = self.config, self.mapping, self.schema
+            predictor = self.predictor
+        return forecast_month(
+            booster,
+            history,
+            test_date,
+            series,
+            config,
+            mapping,
+            schema,
+            predictor,
+            self.active_days,
+        )
+
+    def predict_horizon(self, test_date, n_months=1):
+        """
+        Predicts n_months months from the month of the given date in one
+        forecast_horizon pass, without the forecast cache
+
+        :param test_date: datetime.date, any date in the first month
+        :param n_months: int, number of months
+
+        :return months: dict of first day of the month to the output of
+        forecast_month
+        """
+        with self._lock:
+            booster, history, series = self.booster, self.history, self.series
+            config, mapping, schema = self.config, self.mapping, self.schema
+            predictor = self.predictor
+        return split_months(
+            forecast_horizon(
+                booster,
+                history,
+                test_date,
+                n_months,
+                series,
+                config,
+                mapping,
+                schema,
+                predictor,
+                self.active_days,
+            )
+        )
+
+    def predict_series(self, test_date, customer_id=None, product_id=None):
+        """
+        Predicts the month of the given date for the series of one customer,
+        one product or one customer-product pair, without the forecast
+        cache. Every series is forecast from its own history only, so its
+        rows are those of the whole month.
+
+        :param test_date: datetime.date, any date in the forecast month
+        :param customer_id: str, customer id, any customer if None
+        :param product_id: str, product id, any product if None
+
+        :return df_month: pandas.Dataframe, output of forecast_month for the
+        selected series, None if no series is selected or forecast
+        """
+        with self._lock:
+            booster, history, series = self.booster, self.history, self.series
+            config, mapping, schema = self.config, self.mapping, self.schema
+            predictor, history_end = self.predictor, self.history_end
+        rows = np.ones(len(history), dtype=bool)
+        pairs = np.ones(len(series), dtype=bool)
+        for col, value in [
+            ("customer_id", customer_id),
+            ("product_id", product_id),
+        ]:
+            if value is not None:
+                rows &= (history[col] == value).to_numpy()
+                pairs &= (series[col] == value).to_numpy()
+        history, series = history.loc[rows], series.loc[pairs]
+        grid = series
+        if self.active_days:
+            grid = active_pairs(history, history_end, self.active_days)
+        if not len(grid):
+            return None
+        return forecast_month(
+            booster,
+            history,
+            test_date,
+            series,
+            config,
+            mapping,
+            schema,
+            predictor,
+            self.active_days,
+            history_end,
+        )
+
+    def after_history(self, test_date):
+        """
+        :param test_date: datetime.date, any date in a month
+
+        :return after: bool, whether the month has days after the sales
+        history, forecast recursively from the end of the history
+        """
+        return pd.Timestamp(test_date) >= self.horizon_month
+
+    def _forecast_after_history(self, last_date):
+        """
+        Months from the first one after the sales history up to the month of
+        last_date, predicted in one forecast_horizon pass and cached. The
+        pass always starts from the end of the history, so every pass after
+        the history runs under the flight key of its first month: requests
+        for any of these months, single or batched, wait for the pass in
+        flight rather than predicting the same months again.
+
+        :param last_date: datetime.date, any date in the last month
+
+        :return months: dict of first day of the month to the output of
+        forecast_month, for every month up to the month of last_date
+        """
+        first_day = self.horizon_month
+        last_day, _ = month_range(last_date)
+        n_months = (last_day.year - first_day.year) * 12
+        n_months += last_day.month - first_day.month + 1
+        dates = [first_day + pd.DateOffset(months=i) for i in range(n_months)]
+
+        def predict():
+            keys = [self.month_key(date) for date in dates]
+            months = [self.forecast_cache.get(key) for key in keys]
+            if all(df_month is not None for df_month in months):
+                return dict(zip(dates, months))
+            with span("engine.predict_horizon", LOGGER, logging.INFO):
+                predicted = self.predict_horizon(first_day, n_months)
+            for key, date in zip(keys, dates):
+                self.forecast_cache.put(key, predicted[date])
+            return predicted
+
+        while True:
+            # a follower of a shorter pass predicts the months left
+            predicted = self._flight.do(self.month_key(first_day), predict)
+            if last_day in predicted:
+                return predicted
+
+    def forecast_horizon(self, test_date, n_months=1):
+        """
+        Sales per customer, product and date for n_months months from the
+        month of the given date. Months within the sales history missing
+        from the forecast cache are predicted on their own; those after the
+        history with the pass from the end of the history up to the last of
+        them, which caches every month it predicts.
+
+        :param test_date: datetime.date, any date in the first month
+        :param n_months: int, number of months
+
+        :return months: list of pandas.Dataframe, output of forecast_month
+        for every month
+        """
+        first_day, _ = month_range(test_date, n_months)
+        dates = [first_day + pd.DateOffset(months=i) for i in range(n_months)]
+        months = [
+            self.forecast_cache.get(self.month_key(date)) for date in dates
+        ]
+        missing = [i for i, df_month in enumerate(months) if df_month is None]
+        METRICS.increment("forecast_cache.hit", n_months - len(missing))
+        METRICS.increment("forecast_cache.miss", len(missing))
+        future = [i for i in missing if self.after_history(dates[i])]
+        if future:
+            predicted = self._forecast_after_history(dates[future[-1]])
+            for i in future:
+                months[i] = predicted[dates[i]]
+        for i in missing:
+            if months[i] is None:
+                months[i] = self._forecast_within_history(dates[i])
+        return months
+
+    def _forecast_within_history(self, test_date):
+        key = self.month_key(test_date)
+
+        def predict():
+            # a flight that finished after the lookup already cached it
+            if key in self.forecast_cache:
+                return self.forecast_cache.get(key)
+            with span("engine.predict_month", LOGGER, logging.INFO):
+                df_month = self.predict_month(test_date)
+            self.forecast_cache.put(key, df_month)
+            return df_month
+
+        return self._flight.do(key, predict)
+
+    def forecast_month(self, test_date):
+        """
+        Sales per customer, product and date for the month of the given
+        date, predicted once per model, data and month. Concurrent calls for
+        a month being predicted wait for that prediction.
+
+        :param test_date: datetime.date, date of the sales report required
+
+        :return df_month: pandas.Dataframe, output of forecast_month
+        """
+        return self.forecast_horizon(test_date, 1)[0]
+
+    def month_cube(self, test_date):
+        """
+        Daily sales per customer, product and customer-product of the month
+        of the given date, aggregated once per forecast month
+
+        :param test_date: datetime.date, date of the sales report required
+
+        :return cube: SalesCube of the forecast month
+        """
+        key = self.month_key(test_date)
+        cube = self.cube_cache.get(key)
+        METRICS.increment(
+            "cube_cache.miss" if cube is None else "cube_cache.hit"
+        )
+        if cube is None:
+            df_month = self.forecast_month(test_date)
+            with span("engine.build_cube", LOGGER):
+                cube = SalesCube(df_month)
+            self.cube_cache.put(key, cube)
+        return cube
+
+    def series_cube(self, test_date, customer_id=None, product_id=None):
+        """
+        Daily sales of the series of one customer, one product or one
+        customer-product pair over the month of the given date, predicted on
+        their own: a few rows the compiled trees score faster than a whole
+        month
+
+        :param test_date: datetime.date, date of the sales report required
+        :param customer_id: str, customer id, any customer if None
+        :param product_id: str, product id, any product if None
+
+        :return cube: SalesCube of the series, None if they are not
+        forecast on their own, such as unknown ids or inactive pairs
+        """
+        key = self.month_key(test_date) + ("series", customer_id, product_id)
+        cube = self.series_cache.get(key)
+        METRICS.increment(
+            "series_cache.miss" if cube is None else "series_cache.hit"
+        )
+        if cube is None:
+            with span("engine.predict_series", LOGGER):
+                df_month = self.predict_series(
+                    test_date, customer_id, product_id
+                )
+            if df_month is None:
+                return None
+            cube = SalesCube(df_month)
+            self.series_cache.put(key, cube)
+        return cube
+
+    def infer(
+        self, test_date, infer_level="day", customer_id=None, product_id=None
+    ):
+        """
+        Estimates the sales statistics as requested
+
+        :param test_date: str, date of the sales report required (DDMMYYYY),
+        or the datetime.datetime already parsed from it
+        :param infer_level: str, type of sales statistics required
+        :param customer_id: str, customer id
+        :param product_id: str, product id
+
+        :return output: float, sales statistics requested
+        """
+        if infer_level not in INFER_LEVELS:
+            raise ValueError("Unknown infer level: {}".format(infer_level))
+        if isinstance(test_date, str):
+            test_date = check_and_generate_test_date(test_date)
+        cube = None
+        if (
+            infer_level != "day"
+            and self.predictor.compiled is not None
+            and self.month_key(test_date) not in self.forecast_cache
+        ):
+            if infer_level == "customer":
+                product_id = None
+            elif infer_level == "product":
+                customer_id = None
+            cube = self.series_cube(test_date, customer_id, product_id)
+        if cube is None:
+            cube = self.month_cube(test_date)
+        with span("engine.lookup", LOGGER):
+            return cube.sales(test_date, infer_level, customer_id, product_id)
+
+    def infer_batch(self, queries):
+        """
+        Answers many queries at once, predicting each month once
+
+        :param queries: list of dict with date (DDMMYYYY), infer_level,
+        customer_id and product_id
+
+        :return output: dict of columns, see batch_sales
+        """
+        METRICS.increment("batch.queries", len(queries))
+        with span("engine.infer_batch", LOGGER):
+            return batch_sales(self, queries)
+
+
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def get_engine(
+    model_file, data_file, cache_dir=None, backend="lightgbm", active_days=None
+):
+    """
+    Returns the process wide engine for a model and data file pair, creating
+    it on first use
+
+    :param model_file: str, path of the model
+    :param data_file: str, data path
+    :param cache_dir: str, directory of a forecast cache shared with other
+    processes, forecasts are kept in memory only if None
+    :param backend: str, predict backend, one of PREDICT_BACKENDS
+    :param active_days: int, lookback of the active customer, product pairs
+    forecast, every pair if None
+
+    :return engine: InferenceEngine
+    """
+    key = (
+        os.path.abspath(model_file),
+        os.path.abspath(data_file),
+        backend,
+        active_days,
+    )
+    with _ENGINES_LOCK:
+        if key not in _ENGINES:
+            forecast_cache = None
+            if cache_dir:
+                forecast_cache = DiskForecastCache(
+                    os.path.join(cache_dir, "forecasts")
+                )
+            _ENGINES[key] = InferenceEngine(
+                model_file, data_file, forecast_cache, backend, active_days
+            )
+        return _ENGINES[key]
@@ -0,0 +1,364 @@
+import os
+import logging
+import datetime
+import numpy as np
+import pandas as pd
+
+from demand_sense.inference_module.test_helper import generate_range_df
+from demand_sense.inference_module.test_helper import active_pairs
+from demand_sense.feature_extractor.feature_extractor import add_features
+from demand_sense.feature_extractor.feature_extractor import encode_features
+from demand_sense.feature_extractor.feature_extractor import history_lookback
+from demand_sense.feature_extractor.feature_extractor import horizon_step
+from demand_sense.feature_extractor.feature_extractor import FEATURE_CONFIG
+from demand_sense.feature_extractor.encoding import ID_COLUMNS
+from demand_sense.feature_extractor.series_features import SERIES_KEYS
+from demand_sense.feature_extractor.encoding import load_category_mapping
+from demand_sense.feature_extractor.schema import load_feature_schema
+from demand_sense.feature_extractor.schema import check_feature_schema
+from demand_sense.feature_extractor.schema import build_feature_matrix
+from demand_sense.utils.profiling import span
+
+LOGGER = logging.getLogger(__name__)
+
+
+def check_and_generate_test_date(test_date):
+    """
+    Checks the test date string and converts to a specific format
+
+    :param test_date: str, test date string in format DDMMYYYY
+    :param test_date: datetime.date, test date in format YYYY-MM-DD
+    """
+    assert len(test_date) == 8, "Enter date in format DDMMYYYY"
+    if len(test_date) == 8:
+        test_date = datetime.datetime.strptime(test_date, "%d%m%Y")
+    return test_date
+
+
+def model_features(model_file, booster):
+    """
+    Feature configuration, id code mapping and feature schema a model was
+    trained with. Without a saved schema, ids are taken as integer coded when
+    the model has customer_id as a feature, with the mapping saved next to
+    the model.
+
+    :param model_file: str, path of the model
+    :param booster: lightgbm.Booster, trained model
+
+    :return config: dict, feature configuration
+    :return mapping: dict, id code mapping, None for onehot encoding
+    :return schema: dict, feature schema, None for models saved without one
+    """
+    schema = load_feature_schema(model_file)
+    if schema is not None:
+        check_feature_schema(schema, booster)
+        config = schema["config"]
+        mapping = None
+        if config.get("encoding") == "categorical":
+            mapping = schema["categories"]
+        return config, mapping, schema
+    if "customer_id" not in booster.feature_name():
+        return FEATURE_CONFIG, None, None
+    model_dir = os.path.dirname(os.path.abspath(model_file))
+    mapping = load_category_mapping(model_dir)
+    if mapping is None:
+        raise FileNotFoundError(
+            "No category mapping next to {}".format(model_file)
+        )
+    return dict(FEATURE_CONFIG, encoding="categorical"), mapping, None
+
+
+def history_between(df_train, start, end):
+    """
+    Rows of the sales history with start <= date < end
+
+    :param df_train: pandas.Dataframe, sales history
+    :param start: datetime.date, first date
+    :param end: datetime.date, date after the last date
+
+    :return df_slice: pandas.Dataframe, slice of the sales history
+    """
+    dates = df_train["date"]
+    if dates.is_monotonic_increasing:
+        # sorted history, as returned by load_sales_data, is sliced by bisection
+        lo, hi = dates.searchsorted([pd.Timestamp(start), pd.Timestamp(end)])
+        return df_train.iloc[lo:hi]
+    return df_train.loc[(dates >= start) & (dates < end)]
+
+
+def history_tail(df_train, end, n_rows):
+    """
+    Last rows of every series of the sales history before a date. The series
+    features look back by position within a series, so the rows a new row
+    depends on are counted per series rather than in days: a series with
+    days without sales reaches further back than n_rows days.
+
+    :param df_train: pandas.Dataframe, sales history
+    :param end: datetime.date, date after the last date
+    :param n_rows: int, number of rows kept per series
+
+    :return df_slice: pandas.Dataframe, slice of the sales history in date
+    order
+    """
+    dates = df_train["date"]
+    if dates.is_monotonic_increasing:
+        history = df_train.iloc[: dates.searchsorted(pd.Timestamp(end))]
+    else:
+        history = df_train.loc[dates < end].sort_values("date", kind="stable")
+    position = history.groupby(
+        SERIES_KEYS, sort=False, observed=True
+    ).cumcount(ascending=False)
+    # rows without series keys have no position and no series features
+    return history.loc[(position < n_rows).to_numpy()]
+
+
+def forecast_features(df_train, df_test, config=None):
+    """
+    Features of the rows to forecast, computed from the trailing rows of
+    every series the configured series features need rather than from the
+    whole history
+
+    :param df_train: pandas.Dataframe, sales history, left unmodified
+    :param df_test: pandas.Dataframe, rows to forecast
+    :param config: dict, feature configuration, FEATURE_CONFIG if None
+
+    :return test: pandas.Dataframe, rows of df_test in order with date and
+    series features, categorical features not encoded
+    """
+    past = history_tail(
+        df_train, df_test["date"].min(), history_lookback(config)
+    )
+    data = pd.concat([past, df_test], ignore_index=True)
+    data = add_features(data, config)
+    return data.iloc[len(past) :]
+
+
+def model_input(test, booster, config=None, mapping=None, schema=None):
+    """
+    Model input of the rows to forecast, laid out directly from the feature
+    schema when the model has one
+
+    :param test: pandas.Dataframe, output of forecast_features
+    :param booster: lightgbm.Booster, trained model
+    :param config: dict, feature configuration, FEATURE_CONFIG if None
+    :param mapping: dict, id code mapping for categorical encoding
+    :param schema: dict, feature schema of the model
+
+    :return x_test: numpy array or pandas.Dataframe, model input
+    """
+    if schema is not None:
+        return build_feature_matrix(test, schema)
+    test = encode_features(test, config, mapping)
+    return test.reindex(columns=booster.feature_name(), fill_value=0)
+
+
+def month_range(test_date, n_months=1):
+    """
+    :param test_date: datetime.date, any date in the first month
+    :param n_months: int, number of consecutive months
+
+    :return first_day: pandas.Timestamp, first day of the first month
+    :return end: pandas.Timestamp, first day after the last month
+    """
+    first_day = pd.Timestamp(test_date).to_period("M").to_timestamp()
+    return first_day, first_day + pd.DateOffset(months=n_months)
+
+
+def horizon_blocks(start, end, last_day, step):
+    """
+    Day ranges predicted in turn: blocks of step days counted from the day
+    after the known sales, so that the lag features of a block only look
+    back at known or already predicted days
+
+    :param start: pandas.Timestamp, first day to predict
+    :param end: pandas.Timestamp, day after the last day to predict
+    :param last_day: pandas.Timestamp, day after the last day of known sales
+    :param step: int, output of horizon_step, a single block if None
+
+    :return blocks: list of (start, stop) days, stop excluded
+    """
+    if not step:
+        return [(start, end)] if start < end else []
+    blocks = []
+    while start < end:
+        index = (start - last_day).days // step
+        stop = min(last_day + pd.Timedelta(days=(index + 1) * step), end)
+        blocks.append((start, stop))
+        start = stop
+    return blocks
+
+
+def forecast_horizon(
+    booster,
+    df_train,
+    test_date,
+    n_months=1,
+    series=None,
+    config=None,
+    mapping=None,
+    schema=None,
+    predictor=None,
+    active_days=None,
+    history_end=None,
+):
+    """
+    Sales per customer, product and date for n_months months from the month
+    of the given date. Observed history falling in the months is kept next
+    to the predicted rows.
+
+    Days after the sales history are predicted recursively, in blocks of the
+    shortest lag (horizon_step) counted from the end of the history: each
+    block is predicted in one vectorized pass and appended to the history the
+    next blocks take their lag features from, so months far past the history
+    get predicted lags rather than missing or misaligned ones. Days between
+    the history and the first month are predicted for that purpose only.
+
+    :param booster: lightgbm.Booster, trained model
+    :param df_train: pandas.Dataframe, sales history, left unmodified
+    :param test_date: datetime.date, any date in the first month
+    :param n_months: int, number of months
+    :param series: pandas.Dataframe, unique customer_id, product_id pairs of
+    the history, derived from df_train if None
+    :param config: dict, feature configuration, FEATURE_CONFIG if None
+    :param mapping: dict, id code mapping for categorical encoding
+    :param schema: dict, feature schema of the model
+    :param predictor: Predictor, scores the model input instead of the
+    booster when given
+    :param active_days: int, only the customer, product pairs with sales in
+    that many days before the end of the history are forecast, the others
+    count as zero sales; every pair of customers and products if None
+    :param history_end: pandas.Timestamp, day after the last day of the
+    sales history, for df_train holding some of its series only; the day
+    after the last date of df_train if None
+
+    :return df_horizon: pandas.Dataframe with customer_id, product_id, date
+    and sales columns
+    """
+    if series is None:
+        series = df_train[["customer_id", "product_id"]].drop_duplicates()
+    keys = ["customer_id", "product_id", "date"]
+    first_day, end = month_range(test_date, n_months)
+    last_day = history_end
+    if last_day is None:
+        last_day = df_train["date"].max() + pd.Timedelta(days=1)
+    lookback = history_lookback(config)
+    grid, pairs = series, False
+    if active_days:
+        grid, pairs = active_pairs(df_train, last_day, active_days), True
+        LOGGER.debug("%s active series of %s", len(grid), len(series))
+    known, predicted = df_train, []
+    blocks = horizon_blocks(
+        min(first_day, last_day), end, last_day, horizon_step(config)
+    )
+    for start, stop in blocks:
+        with span("forecast.generate_test_df", LOGGER):
+            df_test = generate_range_df(start, stop, grid, pairs)
+
+        with span("forecast.features", LOGGER):
+            test = forecast_features(known, df_test, config)
+        with span("forecast.model_input", LOGGER):
+            x_test = model_input(test, booster, config, mapping, schema)
+        with span("forecast.predict", LOGGER):
+            if predictor is not None:
+                test_preds = predictor.predict(x_test)
+            else:
+                test_preds = booster.predict(
+                    x_test, num_iteration=booster.best_iteration
+                )
+        df_test = df_test[keys].copy()
+        df_test["sales"] = test_preds
+        predicted.append(df_test)
+        if stop > last_day and stop < end:
+            # predictions stand in for the sales after the history, kept
+            # sorted by date for the slicing of forecast_features
+            future = df_test.loc[df_test["date"] >= last_day]
+            known = pd.concat(
+                [
+                    history_tail(known, stop, lookback),
+                    future.sort_values("date", kind="stable"),
+                ],
+                ignore_index=True,
+            )
+
+    with span("forecast.assemble", LOGGER):
+        df_test = pd.concat(predicted, ignore_index=True)
+        df_test = df_test.loc[df_test["date"] >= first_day]
+        df_observed = history_between(df_train, first_day, end)
+        df_horizon = pd.concat(
+            [df_observed[keys + ["sales"]], df_test], ignore_index=True
+        )
+        # categorical ids turn the per level row selection into code
+        # comparisons; every id of the history is a category, so that the
+        # pairs left out of an active pairs forecast are known with no sales
+        for col in ID_COLUMNS:
+            ids = df_horizon[col].astype(str)
+            categories = np.union1d(
+                series[col].astype(str).unique(), ids.unique()
+            )
+            df_horizon[col] = pd.Categorical(ids, categories=categories)
+    return df_horizon
+
+
+def split_months(df_horizon):
+    """
+    :param df_horizon: pandas.Dataframe, output of forecast_horizon
+
+    :return months: dict of first day of the month to the rows of the month,
+    as output by forecast_month
+    """
+    months = df_horizon["date"].dt.to_period("M").dt.to_timestamp()
+    return {
+        month: df_month.reset_index(drop=True)
+        for month, df_month in df_horizon.groupby(months, sort=True)
+    }
+
+
+def forecast_month(
+    booster,
+    df_train,
+    test_date,
+    series=None,
+    config=None,
+    mapping=None,
+    schema=None,
+    predictor=None,
+    active_days=None,
+    history_end=None,
+):
+    """
+    Sales per customer, product and date for the month of the given date.
+    Observed history falling in the month is kept next to the predicted
+    rows.
+
+    :param booster: lightgbm.Booster, trained model
+    :param df_train: pandas.Dataframe, sales history, left unmodified
+    :param test_date: datetime.date, date of the sales report required
+    :param series: pandas.Dataframe, unique customer_id, product_id pairs of
+    the history, derived from df_train if None
+    :param config: dict, feature configuration, FEATURE_CONFIG if None
+    :param mapping: dict, id code mapping for categorical encoding
+    :param schema: dict, feature schema of the model
+    :param predictor: Predictor, scores the model input instead of the
+    booster when given
+    :param active_days: int, only the customer, product pairs with sales in
+    that many days before the end of the history are forecast, the others
+    count as zero sales; every pair of customers and products if None
+    :param history_end: pandas.Timestamp, day after the last day of the
+    sales history, the day after the last date of df_train if None
+
+    :return df_month: pandas.Dataframe with customer_id, product_id, date
+    and sales columns
+    """
+    return forecast_horizon(
+        booster,
+        df_train,
+        test_date,
+        1,
+        series,
+        config,
+        mapping,
+        schema,
+        predictor,
+        active_days,
+        history_end,
+    )
@@ -0,0 +1,166 @@
+import os
+import pickle
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+LOGGER = logging.getLogger(__name__)
+
+FORECAST_SUFFIX = ".forecast.pkl"
+
+
+def forecast_key(model_version, data_version, test_date, active_days=None):
+    """
+    Cache key of a forecast month
+
+    :param model_version: str, version of the model the forecast comes from
+    :param data_version: str, version of the sales history used
+    :param test_date: datetime.date, any date in the forecast month
+    :param active_days: int, lookback of an active pairs forecast
+
+    :return key: tuple, (model version, data version, year, month), followed
+    by active_days for an active pairs forecast
+    """
+    key = model_version, data_version, test_date.year, test_date.month
+    if active_days:
+        key += (active_days,)
+    return key
+
+
+class ForecastCache:
+    """
+    Least recently used store of forecast months. Every infer level and every
+    day of a month is served from the single frame stored for that month.
+    """
+
+    def __init__(self, max_entries=24):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        :param key: tuple, output of forecast_key
+
+        :return df_month: pandas.Dataframe or None if the month is not cached
+        """
+        with self._lock:
+            df_month = self._entries.get(key)
+            if df_month is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return df_month
+
+    def put(self, key, df_month):
+        """
+        :param key: tuple, output of forecast_key
+        :param df_month: pandas.Dataframe, output of forecast_month
+        """
+        with self._lock:
+            self._entries[key] = df_month
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                LOGGER.debug("Evicted forecast month %s", evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class DiskForecastCache(ForecastCache):
+    """
+    Forecast cache shared by several server processes through a directory.
+    A month predicted by one worker is written once to disk and loaded by
+    every other worker instead of being predicted again; an in-memory LRU
+    sits in front of the directory. Keys carry the model and data versions,
+    so stale files are never served and are pruned oldest first.
+    """
+
+    def __init__(self, cache_dir, max_entries=24, max_files=96):
+        super().__init__(max_entries)
+        self.cache_dir = cache_dir
+        self.max_files = max_files
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        """
+        :param key: tuple, output of forecast_key
+
+        :return path: str, file storing the forecast month of the key
+        """
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest + FORECAST_SUFFIX)
+
+    def get(self, key):
+        df_month = super().get(key)
+        if df_month is not None:
+            return df_month
+        try:
+            df_month = pd.read_pickle(self.path(key))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        with self._lock:
+            # counted as a miss of the memory layer above, a hit overall
+            self.misses -= 1
+            self.hits += 1
+        super().put(key, df_month)
+        return df_month
+
+    def put(self, key, df_month):
+        super().put(key, df_month)
+        path = self.path(key)
+        # written to a temporary file first so readers never see a partial
+        # forecast
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                pickle.dump(df_month, tmp_file, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError:
+            LOGGER.exception("Could not write forecast file %s", path)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._prune()
+
+    def _prune(self):
+        files = [
+            os.path.join(self.cache_dir, name)
+            for name in os.listdir(self.cache_dir)
+            if name.endswith(FORECAST_SUFFIX)
+        ]
+        if len(files) <= self.max_files:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[: len(files) - self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                # already removed by another worker
+                pass
+
+    def __contains__(self, key):
+        return super().__contains__(key) or os.path.exists(self.path(key))
+
+    def clear(self):
+        """
+        Drops the in-memory layer only, files of other versions are left to
+        the workers still serving them and to pruning
+        """
+        super().clear()
@@ -0,0 +1,58 @@
+import logging
+import numpy as np
+
+LOGGER = logging.getLogger(__name__)
+
+N_LEVELS = 4
+
+
+class Hierarchy:
+    """
+    Customer / product hierarchy over bottom (customer, product) series: the
+    total, every customer, every product and every series, aggregates first.
+    Every bottom series adds to one node of each level, so all the levels
+    are summed in one bincount over the nodes of the series.
+    """
+
+    def __init__(self, customer, product, n_customers, n_products):
+        """
+        :param customer: numpy array, customer code of every bottom series
+        :param product: numpy array, product code of every bottom series
+        :param n_customers: int, number of customers
+        :param n_products: int, number of products
+        """
+        n_series = len(customer)
+        self.n_series = n_series
+        self.offsets = {
+            "day": 0,
+            "customer": 1,
+            "product": 1 + n_customers,
+            "customer_product": 1 + n_customers + n_products,
+        }
+        self.n_aggregates = self.offsets["customer_product"]
+        self.n_nodes = self.n_aggregates + n_series
+        # node of every bottom series in each level, level after level
+        self.nodes = np.concatenate(
+            [
+                np.zeros(n_series, dtype=np.int64),
+                self.offsets["customer"] + np.asarray(customer, np.int64),
+                self.offsets["product"] + np.asarray(product, np.int64),
+                self.offsets["customer_product"] + np.arange(n_series),
+            ]
+        )
+
+    def aggregate(self, bottom):
+        """
+        :param bottom: numpy array of shape (series, periods)
+
+        :return nodes: numpy array of shape (nodes, periods), coherent sums
+        of every node
+        """
+        bottom = np.asarray(bottom, dtype=np.float64)
+        periods = bottom.shape[1]
+        index = self.nodes[:, None] * periods + np.arange(periods)
+        return np.bincount(
+            index.ravel(),
+            weights=np.tile(bottom, (N_LEVELS, 1)).ravel(),
+            minlength=self.n_nodes * periods,
+        ).reshape(self.n_nodes, periods)
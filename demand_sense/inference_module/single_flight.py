@@ -0,0 +1,65 @@
+import logging
+import threading
+
+LOGGER = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the
+    function, later callers wait for it and share its result (or its
+    exception) instead of running the same computation in parallel.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key, function):
+        """
+        :param key: hashable, identity of the computation
+        :param function: callable without arguments computing the result
+
+        :return result: output of function, computed once for all concurrent
+        callers of the key
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.shared += 1
+        if not leader:
+            LOGGER.debug("Waiting for in-flight computation of %s", key)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function()
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self):
+        """
+        :return count: int, number of computations currently running
+        """
+        with self._lock:
+            return len(self._calls)
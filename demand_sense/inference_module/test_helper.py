@@ -1,11 +1,29 @@
 import logging
+import numpy as np
 import pandas as pd
 import calendar
 import datetime
-from itertools import product
 
 LOGGER = logging.getLogger(__name__)
 
+# numpy datetime unit a date is truncated to for each aggregation period
+PERIOD_UNITS = {"daily": "D", "monthly": "M", "yearly": "Y"}
+
+
+def truncate_dates(dates, time):
+    """
+    Truncates dates to the start of their day, month or year without string
+    conversions
+
+    :param dates: pandas.Series or array of datetime64 values
+    :param time: str, time frame daily, monthly or yearly
+
+    :return dates: numpy array of datetime64[ns] period starts
+    """
+    unit = PERIOD_UNITS.get(time, "Y")
+    values = np.asarray(dates, dtype="datetime64[ns]")
+    return values.astype("datetime64[" + unit + "]").astype("datetime64[ns]")
+
 
 def givedays(f):
     """A function to return all the days in the month of a given date
@@ -31,15 +49,113 @@ def generate_test_df(test_date, prev_data):
 
     :return df_test: pandas.Dataframe as product of days, customers, products
     """
-    test_dates = givedays(test_date)
-    products = prev_data["product_id"].unique()
-    customers = prev_data["customer_id"].unique()
-    df_test = pd.DataFrame(
-        product(products, customers, test_dates),
-        columns=["product_id", "customer_id", "date"],
+    return product_df(givedays(test_date), prev_data)
+
+
+def generate_range_df(start_date, end_date, prev_data, pairs=False):
+    """
+    Generate a test dataframe of the days from the start date to the day
+    before the end date, for the cartesian product of customers and products
+    or for the customer, product pairs only
+
+    :param start_date: datetime.date, first day
+    :param end_date: datetime.date, day after the last day
+    :param prev_date: pandas.Dataframe of previous sales information
+    :param pairs: bool, whether to keep the customer, product pairs of
+    prev_data rather than every combination of its customers and products
+
+    :return df_test: pandas.Dataframe with product_id, customer_id and date
+    """
+    test_dates = pd.date_range(start_date, end_date, inclusive="left")
+    if pairs:
+        return pairs_df(test_dates, prev_data)
+    return product_df(test_dates, prev_data)
+
+
+def unique_ids(values):
+    """
+    :param values: pandas.Series of ids
+
+    :return ids: numpy array, distinct ids in order of appearance
+    """
+    ids = np.asarray(values.unique())
+    return ids[~pd.isna(ids)]
+
+
+def product_df(test_dates, prev_data):
+    """
+    Cartesian product of products, customers and dates, product major as
+    itertools.product, built from repeated and tiled integer codes
+
+    :param test_dates: list of dates
+    :param prev_date: pandas.Dataframe of previous sales information
+
+    :return df_test: pandas.Dataframe with categorical product_id and
+    customer_id and a date column
+    """
+    products = unique_ids(prev_data["product_id"])
+    customers = unique_ids(prev_data["customer_id"])
+    dates = np.asarray(test_dates, dtype="datetime64[ns]")
+    n_customers, n_dates = len(customers), len(dates)
+    product = np.repeat(
+        np.arange(len(products), dtype=np.int32), n_customers * n_dates
+    )
+    customer = np.tile(
+        np.repeat(np.arange(n_customers, dtype=np.int32), n_dates),
+        len(products),
+    )
+    return pd.DataFrame(
+        {
+            "product_id": pd.Categorical.from_codes(product, products),
+            "customer_id": pd.Categorical.from_codes(customer, customers),
+            "date": np.tile(dates, len(products) * n_customers),
+        }
+    )
+
+
+def pairs_df(test_dates, pairs):
+    """
+    Every date for every customer, product pair, pair major
+
+    :param test_dates: list of dates
+    :param pairs: pandas.Dataframe with customer_id and product_id columns
+
+    :return df_test: pandas.Dataframe with categorical product_id and
+    customer_id and a date column
+    """
+    pairs = pairs[["customer_id", "product_id"]].dropna().drop_duplicates()
+    dates = np.asarray(test_dates, dtype="datetime64[ns]")
+    columns = {}
+    for col in ["product_id", "customer_id"]:
+        codes, ids = pd.factorize(pairs[col].astype(str))
+        columns[col] = pd.Categorical.from_codes(
+            np.repeat(codes.astype(np.int32), len(dates)), ids
+        )
+    columns["date"] = np.tile(dates, len(pairs))
+    return pd.DataFrame(columns)
+
+
+def active_pairs(prev_data, end_date, lookback_days):
+    """
+    Customer, product pairs with sales in a trailing window
+
+    :param prev_data: pandas.Dataframe, sales history
+    :param end_date: datetime.date, day after the window
+    :param lookback_days: int, length of the window in days
+
+    :return pairs: pandas.Dataframe, unique customer_id, product_id pairs
+    with positive sales between end_date - lookback_days and end_date
+    """
+    end = pd.Timestamp(end_date)
+    dates = prev_data["date"]
+    recent = (
+        (dates >= end - pd.Timedelta(days=lookback_days))
+        & (dates < end)
+        & (prev_data["sales"] > 0)
     )
-    df_test["date"] = pd.to_datetime(df_test["date"])
-    return df_test
+    return prev_data.loc[
+        recent, ["customer_id", "product_id"]
+    ].drop_duplicates()
 
 
 def sales_d_m_or_y(df_t, time):
@@ -51,13 +167,7 @@ def sales_d_m_or_y(df_t, time):
 
     :return df_t: pandas.Dataframe, aggregates sales information
     """
-    df_t = df_t.copy()
-    if time == "daily":
-        df_t.date = df_t.date.apply(lambda x: str(x)[:-9])
-    elif time == "monthly":
-        df_t.date = df_t.date.apply(lambda x: str(x)[:-12])
-    else:
-        df_t.date = df_t.date.apply(lambda x: str(x)[:4])
-    df_t = df_t.groupby("date")["sales"].sum().reset_index()
-    df_t.date = pd.to_datetime(df_t.date)
-    return df_t
+    periods = truncate_dates(df_t["date"], time)
+    return (
+        df_t["sales"].groupby(periods).sum().rename_axis("date").reset_index()
+    )
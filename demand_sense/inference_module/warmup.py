@@ -0,0 +1,46 @@
+import time
+import logging
+import pandas as pd
+
+LOGGER = logging.getLogger(__name__)
+
+
+def warmup_months(start_date, n_months):
+    """
+    :param start_date: datetime.date, any date in the first month
+    :param n_months: int, number of consecutive months
+
+    :return dates: list of datetime, first day of every month
+    """
+    first = pd.Timestamp(start_date).to_period("M").to_timestamp()
+    return list(pd.date_range(first, periods=n_months, freq="MS"))
+
+
+def warm_up(engine, start_date=None, n_months=3):
+    """
+    Predicts the coming months ahead of the requests and stores them in the
+    forecast cache of the engine, from which every infer level and day of
+    those months is served. The months are forecast recursively, so they
+    are predicted together in one horizon pass.
+
+    :param engine: InferenceEngine, engine whose forecast cache is filled
+    :param start_date: datetime.date, any date in the first month, the day
+    after the sales history if None
+    :param n_months: int, number of months to predict
+
+    :return dates: list of datetime, first day of the months predicted
+    """
+    start = time.time()
+    if start_date is None:
+        start_date = engine.history["date"].max() + pd.Timedelta(days=1)
+    dates = [
+        date
+        for date in warmup_months(start_date, n_months)
+        if engine.month_key(date) not in engine.forecast_cache
+    ]
+    if dates:
+        engine.forecast_horizon(start_date, n_months)
+    LOGGER.info(
+        "Warmed up %s months in %.2f s", len(dates), time.time() - start
+    )
+    return dates
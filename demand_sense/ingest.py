@@ -0,0 +1,36 @@
+import logging
+import click
+
+from demand_sense.utils import setup_logging
+from demand_sense.storage.ingest import ingest_csv
+
+LOGGER = logging.getLogger(__name__)
+
+
+@click.command()
+@click.option(
+    "--log_level",
+    default="INFO",
+    type=click.Choice(["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG"]),
+)
+@click.option("--log_dir", default="")
+@click.option("--data_file", default="data/prepared_sales_data.csv")
+@click.option("--store_dir", default="data/sales_store/")
+@click.option("--overwrite", is_flag=True)
+def ingest(log_level, log_dir, data_file, store_dir, overwrite):
+    """
+    Ingest module, converts the sales CSV into the columnar store
+
+    :param log_level: str, logger level
+    :param log_dir: str, specific log directory
+    :param data_file: str, sales CSV path
+    :param store_dir: str, directory of the columnar store
+    :param overwrite: bool, whether to replace an existing store
+    """
+    setup_logging(log_level=log_level, log_dir=log_dir)
+    LOGGER.info(">ingesting data")
+    ingest_csv(data_file, store_dir, overwrite)
+
+
+if __name__ == "__main__":
+    ingest()
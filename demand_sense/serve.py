@@ -0,0 +1,136 @@
+import os
+import signal
+import logging
+import click
+from werkzeug.serving import make_server
+
+from demand_sense.utils import setup_logging
+from demand_sense.app.app import app
+from demand_sense.app.app import engine
+from demand_sense.app.app import use_shared_cache
+from demand_sense.inference_module.warmup import warm_up
+from demand_sense.inference_module.engine import PREDICT_BACKENDS
+
+LOGGER = logging.getLogger(__name__)
+
+
+@click.command()
+@click.option(
+    "--log_level",
+    default="INFO",
+    type=click.Choice(["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG"]),
+)
+@click.option("--log_dir", default="")
+@click.option("--host", default="127.0.0.1")
+@click.option("--port", default=5000)
+@click.option("--workers", default=1)
+@click.option("--cache_dir", default="")
+@click.option("--warmup_months", default=0)
+@click.option(
+    "--backend",
+    default=app.config["PREDICT_BACKEND"],
+    type=click.Choice(PREDICT_BACKENDS),
+)
+@click.option("--active_days", default=app.config["ACTIVE_DAYS"] or 0)
+def serve(
+    log_level,
+    log_dir,
+    host,
+    port,
+    workers,
+    cache_dir,
+    warmup_months,
+    backend,
+    active_days,
+):
+    """
+    Serving module. Every worker handles requests concurrently with threads.
+    The listening socket is created before the workers are forked and every
+    worker loads its inference engine after the fork, since forking after
+    LightGBM used OpenMP may deadlock; the workers share the response and
+    forecast caches through the cache directory, so the months warmed up by
+    the first worker are served by all of them. Several workers without a
+    cache directory share ./cache. The workers are stopped and reaped when
+    the first worker stops.
+
+    :param log_level: str, logger level
+    :param log_dir: str, specific log directory
+    :param host: str, interface to listen on
+    :param port: int, port to listen on
+    :param workers: int, number of worker processes
+    :param cache_dir: str, cache directory shared by the workers, ./cache
+    for several workers if empty
+    :param warmup_months: int, number of months after the sales history
+    predicted before serving
+    :param backend: str, predict backend, lightgbm, compiled or native
+    :param active_days: int, only the customer, product pairs with sales in
+    that many days before the end of the history are forecast, every pair if
+    0
+    """
+    setup_logging(log_level=log_level, log_dir=log_dir)
+    app.config["PREDICT_BACKEND"] = backend
+    app.config["ACTIVE_DAYS"] = active_days or None
+    if workers > 1 and not cache_dir:
+        # without a shared cache every worker would predict every month
+        cache_dir = "cache"
+        LOGGER.warning(
+            "No --cache_dir for %s workers, sharing caches through %s",
+            workers,
+            os.path.abspath(cache_dir),
+        )
+    if cache_dir:
+        use_shared_cache(cache_dir)
+    LOGGER.info(
+        ">serving on %s:%s with %s workers, cache directory: %s",
+        host,
+        port,
+        workers,
+        cache_dir or "none",
+    )
+    server = make_server(host, port, app, threaded=True)
+    # terminating the parent or a worker stops it like an interrupt
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    children = []
+    for _ in range(workers - 1):
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                # loaded before serving so that the first request is warm
+                engine()
+                # returns on an interrupt
+                server.serve_forever()
+                status = 0
+            except KeyboardInterrupt:
+                status = 0
+            except BaseException:
+                LOGGER.exception("Worker %s failed", os.getpid())
+            finally:
+                # never return into the code of the parent
+                os._exit(status)
+        children.append(pid)
+    try:
+        inference_engine = engine()
+        if warmup_months:
+            warm_up(inference_engine, n_months=warmup_months)
+        server.serve_forever()
+    except KeyboardInterrupt:
+        LOGGER.info(">server stopped")
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                _, status = os.waitpid(pid, 0)
+            except ChildProcessError:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if code:
+                LOGGER.warning("Worker %s exited with code %s", pid, code)
+
+
+if __name__ == "__main__":
+    serve()
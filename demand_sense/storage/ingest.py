@@ -0,0 +1,44 @@
+import os
+import shutil
+import logging
+import pandas as pd
+
+from demand_sense.storage.loader import SALES_COLUMNS
+from demand_sense.storage.loader import PARTITION_COLUMN
+from demand_sense.storage.loader import cast_sales_data
+from demand_sense.storage.loader import month_partition
+
+LOGGER = logging.getLogger(__name__)
+
+
+def ingest_csv(data_file, store_dir, overwrite=False):
+    """
+    Converts the sales CSV into a columnar parquet store partitioned by month
+    with typed columns, read back by load_sales_data
+
+    :param data_file: str, sales CSV file path
+    :param store_dir: str, directory of the columnar store
+    :param overwrite: bool, whether to replace an existing store
+    """
+    if os.path.exists(store_dir) and os.listdir(store_dir):
+        if not overwrite:
+            raise FileExistsError(
+                "Store {} already exists, use overwrite".format(store_dir)
+            )
+        LOGGER.info("Removing existing store: %s", store_dir)
+        shutil.rmtree(store_dir)
+
+    LOGGER.info("Reading: %s", data_file)
+    data = pd.read_csv(data_file, usecols=SALES_COLUMNS)
+    data = cast_sales_data(data)
+    data = data.sort_values("date", kind="stable", ignore_index=True)
+    data[PARTITION_COLUMN] = month_partition(data["date"])
+    LOGGER.info("Memory usage: %s bytes", data.memory_usage(deep=True).sum())
+
+    LOGGER.info("Writing %s rows to: %s", len(data), store_dir)
+    data.to_parquet(
+        store_dir,
+        engine="pyarrow",
+        partition_cols=[PARTITION_COLUMN],
+        index=False,
+    )
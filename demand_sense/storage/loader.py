@@ -0,0 +1,98 @@
+import logging
+import pandas as pd
+
+LOGGER = logging.getLogger(__name__)
+
+SALES_COLUMNS = ["date", "customer_id", "product_id", "sales"]
+# hive partition column of the columnar store
+PARTITION_COLUMN = "year_month"
+
+
+def is_csv(data_file):
+    """
+    :param data_file: str, data path
+
+    :return is_csv: bool, whether the data is a CSV file rather than the
+    columnar store written by ingest_csv
+    """
+    return data_file.lower().endswith(".csv")
+
+
+def cast_sales_data(data):
+    """
+    Casts the sales columns present in the dataframe to their storage dtypes:
+    datetime64 dates, categorical ids and float32 sales
+
+    :param data: pandas.Dataframe, sales data
+
+    :return data: pandas.Dataframe, typed sales data
+    """
+    if "date" in data:
+        data["date"] = pd.to_datetime(data["date"])
+    for col in ["customer_id", "product_id"]:
+        if col in data:
+            data[col] = data[col].astype(str).astype("category")
+    if "sales" in data:
+        data["sales"] = data["sales"].astype("float32")
+    return data
+
+
+def month_partition(date):
+    """
+    :param date: datetime.date or pandas datetime Series
+
+    :return partition: str or Series, YYYY-MM partition value
+    """
+    if isinstance(date, pd.Series):
+        return date.dt.strftime("%Y-%m")
+    return pd.Timestamp(date).strftime("%Y-%m")
+
+
+def load_sales_data(data_file, columns=None, start_date=None, end_date=None):
+    """
+    Loads typed sales data, reading only the requested columns and the rows
+    with start_date <= date < end_date. Both the raw CSV and the columnar
+    store are accepted; the store only reads the matching partitions.
+
+    :param data_file: str, CSV file or columnar store directory
+    :param columns: list, columns to read, all sales columns if None
+    :param start_date: datetime.date or str, first date to read
+    :param end_date: datetime.date or str, date after the last date to read
+
+    :return data: pandas.Dataframe, typed sales data sorted by date
+    """
+    columns = list(columns or SALES_COLUMNS)
+    read_columns = columns
+    if (start_date is not None or end_date is not None) and (
+        "date" not in columns
+    ):
+        read_columns = columns + ["date"]
+
+    if is_csv(data_file):
+        data = pd.read_csv(data_file, usecols=read_columns)
+        data = cast_sales_data(data)
+        if start_date is not None:
+            data = data.loc[data["date"] >= pd.Timestamp(start_date)]
+        if end_date is not None:
+            data = data.loc[data["date"] < pd.Timestamp(end_date)]
+    else:
+        filters = []
+        if start_date is not None:
+            filters.append(
+                (PARTITION_COLUMN, ">=", month_partition(start_date))
+            )
+            filters.append(("date", ">=", pd.Timestamp(start_date)))
+        if end_date is not None:
+            filters.append((PARTITION_COLUMN, "<=", month_partition(end_date)))
+            filters.append(("date", "<", pd.Timestamp(end_date)))
+        data = pd.read_parquet(
+            data_file,
+            engine="pyarrow",
+            columns=read_columns,
+            filters=filters or None,
+        )
+
+    if "date" in data and not data["date"].is_monotonic_increasing:
+        data = data.sort_values("date", kind="stable")
+    data = data.reset_index(drop=True)
+    return data[columns]
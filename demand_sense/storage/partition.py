@@ -0,0 +1,113 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from demand_sense.storage.loader import SALES_COLUMNS
+from demand_sense.storage.loader import cast_sales_data
+from demand_sense.storage.loader import is_csv
+
+LOGGER = logging.getLogger(__name__)
+
+# arrow schema of the series partition files
+PARTITION_SCHEMA = pa.schema(
+    [
+        ("date", pa.timestamp("ns")),
+        ("customer_id", pa.string()),
+        ("product_id", pa.string()),
+        ("sales", pa.float32()),
+    ]
+)
+
+
+def iter_sales_chunks(data_file, chunk_rows=1000000):
+    """
+    Streams typed sales data in chunks of rows, without loading the whole
+    CSV or columnar store
+
+    :param data_file: str, CSV file or columnar store directory
+    :param chunk_rows: int, maximum number of rows per chunk
+
+    :return chunks: iterator of pandas.Dataframe, typed sales data
+    """
+    if is_csv(data_file):
+        chunks = pd.read_csv(
+            data_file, usecols=SALES_COLUMNS, chunksize=chunk_rows
+        )
+    else:
+        dataset = ds.dataset(data_file, format="parquet", partitioning="hive")
+        chunks = (
+            batch.to_pandas()
+            for batch in dataset.to_batches(
+                columns=SALES_COLUMNS, batch_size=chunk_rows
+            )
+        )
+    for chunk in chunks:
+        yield cast_sales_data(chunk[SALES_COLUMNS])
+
+
+def series_partition(data, n_partitions):
+    """
+    :param data: pandas.Dataframe, sales data with id columns
+    :param n_partitions: int, number of partitions
+
+    :return partition: numpy array, partition of every row, the same for all
+    rows of a (customer, product) series
+    """
+    keys = data[["customer_id", "product_id"]].astype(str)
+    hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    return (hashes % np.uint64(n_partitions)).astype(np.int64)
+
+
+def partition_by_series(data_file, work_dir, n_partitions, chunk_rows=1000000):
+    """
+    Splits the sales data into files holding whole (customer, product)
+    series, reading the source one chunk at a time
+
+    :param data_file: str, CSV file or columnar store directory
+    :param work_dir: str, directory of the partition files
+    :param n_partitions: int, number of partitions
+    :param chunk_rows: int, maximum number of rows read at a time
+
+    :return paths: list of str, non empty partition files
+    :return vocab: dict, sorted ids and date feature values seen in the data
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    paths = [
+        os.path.join(work_dir, "part-{:04d}.parquet".format(i))
+        for i in range(n_partitions)
+    ]
+    writers = [None] * n_partitions
+    seen = {
+        "customer_id": set(),
+        "product_id": set(),
+        "month": set(),
+        "day_of_week": set(),
+    }
+    try:
+        for chunk in iter_sales_chunks(data_file, chunk_rows):
+            seen["customer_id"].update(chunk["customer_id"].cat.categories)
+            seen["product_id"].update(chunk["product_id"].cat.categories)
+            seen["month"].update(chunk["date"].dt.month.unique())
+            seen["day_of_week"].update(chunk["date"].dt.dayofweek.unique())
+            partition = series_partition(chunk, n_partitions)
+            for i in np.unique(partition):
+                table = pa.Table.from_pandas(
+                    chunk.loc[partition == i].astype(
+                        {"customer_id": str, "product_id": str}
+                    ),
+                    schema=PARTITION_SCHEMA,
+                    preserve_index=False,
+                )
+                if writers[i] is None:
+                    writers[i] = pq.ParquetWriter(paths[i], PARTITION_SCHEMA)
+                writers[i].write_table(table)
+    finally:
+        for writer in writers:
+            if writer is not None:
+                writer.close()
+    vocab = {col: sorted(values) for col, values in seen.items()}
+    return [p for p, w in zip(paths, writers) if w is not None], vocab
@@ -4,6 +4,7 @@ import click
 from demand_sense.utils import setup_logging
 from demand_sense.trainer.train_model import train_model
 from demand_sense.trainer.train_model_hpo import train_model_hpo
+from demand_sense.trainer.backtest import backtest_model
 
 LOGGER = logging.getLogger(__name__)
 
@@ -18,7 +19,33 @@ LOGGER = logging.getLogger(__name__)
 @click.option("--model_dir", default="model/")
 @click.option("--data_file", default="data/prepared_sales_data.csv")
 @click.option("--hpo", is_flag=True)
-def train(log_level, log_dir, model_dir, data_file, hpo):
+@click.option(
+    "--encoding",
+    default="onehot",
+    type=click.Choice(["onehot", "categorical"]),
+)
+@click.option("--n_trials", default=10)
+@click.option("--n_jobs", default=1)
+@click.option("--workers", default=1)
+@click.option("--backtest", is_flag=True)
+@click.option("--partitions", default=0)
+@click.option("--compact", is_flag=True)
+@click.option("--feature_jobs", default=1)
+def train(
+    log_level,
+    log_dir,
+    model_dir,
+    data_file,
+    hpo,
+    encoding,
+    n_trials,
+    n_jobs,
+    workers,
+    backtest,
+    partitions,
+    compact,
+    feature_jobs,
+):
     """
     Train module
 
@@ -28,13 +55,47 @@ def train(log_level, log_dir, model_dir, data_file, hpo):
     :param data_file: str, data path
     :param hpo: bool, whether to train with hyperparameter optimization using
     OPTUNA
+    :param encoding: str, onehot encoded or integer coded categorical ids
+    :param n_trials: int, number of hyperparameter optimization trials
+    :param n_jobs: int, number of concurrent trials per worker process
+    :param workers: int, number of hyperparameter optimization processes,
+    also the number of parallel backtest folds
+    :param backtest: bool, whether to backtest over rolling forecast origins
+    after training
+    :param partitions: int, number of series partitions the data is streamed
+    through when it does not fit in memory, 0 to load it at once
+    :param compact: bool, whether to store the features in int8 / int16 /
+    float32 columns to reduce the training memory
+    :param feature_jobs: int, number of processes the series features are
+    computed in, partitioned by (customer, product) series
     """
     setup_logging(log_level=log_level, log_dir=log_dir)
     LOGGER.info(">training model")
     if hpo:
-        train_model_hpo(model_dir, data_file)
+        train_model_hpo(
+            model_dir,
+            data_file,
+            encoding,
+            n_trials,
+            n_jobs,
+            workers,
+            n_partitions=partitions,
+            compact=compact,
+            feature_jobs=feature_jobs,
+        )
     else:
-        train_model(model_dir, data_file)
+        train_model(
+            model_dir, data_file, encoding, partitions, compact, feature_jobs
+        )
+    if backtest:
+        backtest_model(
+            model_dir,
+            data_file,
+            encoding,
+            workers=workers,
+            compact=compact,
+            feature_jobs=feature_jobs,
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,316 @@
+import os
+import time
+import logging
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+from demand_sense.utils.check_df import check_df
+from demand_sense.storage.loader import load_sales_data
+from demand_sense.feature_extractor.feature_extractor import get_processed_df
+from demand_sense.feature_extractor.feature_extractor import feature_columns
+from demand_sense.feature_extractor.encoding import categorical_features
+from demand_sense.feature_extractor.encoding import ID_COLUMNS
+from demand_sense.feature_extractor.series_features import lag_name
+from demand_sense.feature_extractor.series_features import roll_mean_name
+from demand_sense.feature_extractor.utils import noise_block
+from demand_sense.trainer.train_model import fit_encoding
+from demand_sense.trainer.train_model import LGB_PARAMS
+from demand_sense.metrics.metrics import smape
+from demand_sense.metrics.metrics import mean_absolute_error
+from demand_sense.metrics.metrics import mean_squared_error
+
+LOGGER = logging.getLogger(__name__)
+
+# trees of train_model with a fixed number of rounds, folds have no
+# validation set to stop early on
+BACKTEST_PARAMS = dict(LGB_PARAMS, verbosity=-1)
+
+
+def rolling_origins(last_date, n_folds=6, step_days=28, horizon=28):
+    """
+    Forecast origins stepping back from the end of the data, so that the
+    horizon of the last origin ends with the data
+
+    :param last_date: datetime, last date of the sales data
+    :param n_folds: int, number of origins
+    :param step_days: int, days between consecutive origins
+    :param horizon: int, number of days forecast from every origin
+
+    :return origins: list of pandas.Timestamp, oldest first
+    """
+    last_origin = pd.Timestamp(last_date) - pd.Timedelta(days=horizon - 1)
+    return [
+        last_origin - pd.Timedelta(days=step_days * fold)
+        for fold in reversed(range(n_folds))
+    ]
+
+
+def max_leak_free_horizon(config):
+    """
+    Longest horizon whose features only use sales before the origin
+
+    :param config: dict, feature configuration
+
+    :return horizon: int, number of days
+    """
+    lags = list(config["lags"])
+    if config["alphas"]:
+        lags += list(config["ewm_lags"])
+    if config["windows"]:
+        # rolling means are taken over the series shifted by one
+        lags.append(1)
+    return min(lags, default=np.iinfo(np.int32).max)
+
+
+def error_metrics(preds, target):
+    """
+    :param preds: numpy array, predicted sales
+    :param target: numpy array, actual sales
+
+    :return metrics: dict, smape, mae and rmse
+    """
+    return {
+        "smape": smape(preds, target),
+        "mae": mean_absolute_error(target, preds),
+        "rmse": np.sqrt(mean_squared_error(target, preds)),
+    }
+
+
+class Backtest:
+    """
+    Rolling-origin evaluation: for every origin a model is trained on the
+    sales before it and scored on the following horizon days. The data is
+    featurized once for all folds and sorted by date, so that the training
+    rows of a fold are a prefix of the rows and its forecast rows a range,
+    both views instead of copies. The training noise is added once to the
+    whole matrix and the forecast rows get back the values without noise,
+    so that they are scored as the served model sees them. The LightGBM bins
+    are found once on the data before the first origin and reused by every
+    fold.
+    """
+
+    def __init__(
+        self,
+        data,
+        config,
+        mapping=None,
+        num_boost_round=300,
+        params=None,
+        feature_jobs=1,
+    ):
+        self.config = config
+        self.num_boost_round = num_boost_round
+        self.params = dict(params or BACKTEST_PARAMS)
+        data = get_processed_df(data, config, mapping, None, feature_jobs)
+        self.feature_names = feature_columns(data)
+        # LightGBM bins float32 matrices without an upcast copy
+        dtype = np.float32 if config.get("compact") else np.float64
+        features = data[self.feature_names].to_numpy(dtype=dtype)
+        dates = data["date"].to_numpy(dtype="datetime64[ns]")
+        order = np.argsort(dates, kind="stable")
+        # rows by date, in C order so that LightGBM reads views uncopied
+        self.features = np.ascontiguousarray(features[order])
+        self.dates = dates[order]
+        self.target = data["sales"].to_numpy(dtype=np.float64)[order]
+        self.last_date = data["date"].max()
+        # the noise get_processed_df adds in training, same seed and order
+        noisy = [lag_name(lag) for lag in config["lags"]]
+        noisy += [roll_mean_name(window) for window in config["windows"]]
+        self.noise_columns = [self.feature_names.index(col) for col in noisy]
+        self.clean = None
+        if config.get("noise_seed") is not None and noisy:
+            noise = noise_block(
+                len(data), len(noisy), config["noise_seed"], dtype=dtype
+            )
+            self.clean = self.features[:, self.noise_columns]
+            self.features[:, self.noise_columns] += noise[:, order].T
+        self.reference = None
+
+    def _dataset(self, end, reference=None):
+        """
+        :param end: int, number of training rows, the rows before it
+        :param reference: lightgbm.Dataset whose bins are reused
+
+        :return dataset: lightgbm.Dataset of the rows with training noise
+        """
+        # the categorical features of a referenced Dataset come with its bins
+        categorical_feature = "auto"
+        if reference is None:
+            categorical_feature = categorical_features(self.config)
+        return lgb.Dataset(
+            self.features[:end],
+            label=self.target[:end],
+            feature_name=self.feature_names,
+            categorical_feature=categorical_feature,
+            reference=reference,
+            free_raw_data=False,
+        )
+
+    def prepare(self, first_origin):
+        """
+        Bins the data before the first origin, the bin boundaries every fold
+        reuses
+
+        :param first_origin: datetime, oldest forecast origin
+        """
+        end = np.searchsorted(self.dates, np.datetime64(first_origin))
+        self.reference = self._dataset(end).construct()
+
+    def run_fold(self, origin, horizon, num_threads=0):
+        """
+        :param origin: datetime, first forecast day
+        :param horizon: int, number of days forecast
+        :param num_threads: int, LightGBM threads of the fold
+
+        :return fold: pandas.Dataframe, horizon day, prediction and actual
+        sales of every test row
+        """
+        origin = np.datetime64(origin)
+        start, stop = np.searchsorted(
+            self.dates, [origin, origin + np.timedelta64(horizon, "D")]
+        )
+        params = dict(self.params, num_threads=num_threads)
+        model = lgb.train(
+            params,
+            self._dataset(start, self.reference),
+            num_boost_round=self.num_boost_round,
+        )
+        test = self.features[start:stop]
+        if self.clean is not None:
+            test = test.copy()
+            test[:, self.noise_columns] = self.clean[start:stop]
+        return pd.DataFrame(
+            {
+                "origin": pd.Timestamp(origin),
+                "horizon_day": (self.dates[start:stop] - origin)
+                // np.timedelta64(1, "D")
+                + 1,
+                "pred": model.predict(test),
+                "sales": self.target[start:stop],
+            }
+        )
+
+    def run(self, origins, horizon, workers=1):
+        """
+        Runs the folds of all origins, workers at a time
+
+        :param origins: list of datetime, forecast origins
+        :param horizon: int, number of days forecast from every origin
+        :param workers: int, number of folds trained in parallel
+
+        :return fold_metrics: pandas.Dataframe, metrics per origin
+        :return horizon_metrics: pandas.Dataframe, metrics per horizon day
+        """
+        start = time.time()
+        self.prepare(min(origins))
+        num_threads = max(1, (os.cpu_count() or 1) // workers)
+        with ThreadPoolExecutor(workers) as executor:
+            folds = list(
+                executor.map(
+                    lambda origin: self.run_fold(origin, horizon, num_threads),
+                    origins,
+                )
+            )
+        results = pd.concat(folds, ignore_index=True)
+        fold_metrics = pd.DataFrame(
+            [
+                dict(
+                    origin=origin,
+                    n_test=len(fold),
+                    **error_metrics(
+                        fold["pred"].to_numpy(), fold["sales"].to_numpy()
+                    )
+                )
+                for origin, fold in results.groupby("origin")
+            ]
+        )
+        horizon_metrics = pd.DataFrame(
+            [
+                dict(
+                    horizon_day=day,
+                    n_test=len(rows),
+                    **error_metrics(
+                        rows["pred"].to_numpy(), rows["sales"].to_numpy()
+                    )
+                )
+                for day, rows in results.groupby("horizon_day")
+            ]
+        )
+        LOGGER.info(
+            "Backtest of %s folds in %.2f s", len(origins), time.time() - start
+        )
+        return fold_metrics, horizon_metrics
+
+
+def backtest_model(
+    model_dir,
+    data_file,
+    encoding="onehot",
+    n_folds=6,
+    step_days=28,
+    horizon=28,
+    workers=1,
+    num_boost_round=300,
+    compact=False,
+    feature_jobs=1,
+):
+    """
+    Backtests the model over rolling forecast origins and saves the metrics
+    per fold and per horizon day in the backtest folder of model_dir
+
+    :param model_dir: str, model directory
+    :param data_file: str, data file path
+    :param encoding: str, onehot or categorical encoding of the ids
+    :param n_folds: int, number of forecast origins
+    :param step_days: int, days between consecutive origins
+    :param horizon: int, number of days forecast from every origin
+    :param workers: int, number of folds trained in parallel
+    :param num_boost_round: int, boosting rounds of every fold
+    :param compact: bool, whether to featurize into small dtypes
+    :param feature_jobs: int, number of processes computing the series
+    features
+
+    :return fold_metrics: pandas.Dataframe, metrics per origin
+    :return horizon_metrics: pandas.Dataframe, metrics per horizon day
+    """
+    data = load_sales_data(data_file)
+    check_df(data)
+    config, mapping = fit_encoding(
+        data[ID_COLUMNS], model_dir, encoding, compact
+    )
+    if horizon > max_leak_free_horizon(config):
+        LOGGER.warning(
+            "Horizon of %s days exceeds the shortest feature lag, forecasts "
+            "use sales after the origin",
+            horizon,
+        )
+    backtest = Backtest(
+        data, config, mapping, num_boost_round, feature_jobs=feature_jobs
+    )
+    origins = rolling_origins(backtest.last_date, n_folds, step_days, horizon)
+    fold_metrics, horizon_metrics = backtest.run(origins, horizon, workers)
+
+    LOGGER.info("%%% Backtest metrics per fold %%%")
+    for row in fold_metrics.itertuples():
+        LOGGER.info(
+            "\t%s: SMAPE %.3f, MAE %.4f, RMSE %.4f",
+            row.origin.date(),
+            row.smape,
+            row.mae,
+            row.rmse,
+        )
+    LOGGER.info(
+        "\tMean: SMAPE %.3f, MAE %.4f, RMSE %.4f",
+        fold_metrics["smape"].mean(),
+        fold_metrics["mae"].mean(),
+        fold_metrics["rmse"].mean(),
+    )
+    backtest_dir = os.path.join(model_dir, "backtest")
+    os.makedirs(backtest_dir, exist_ok=True)
+    fold_metrics.to_csv(os.path.join(backtest_dir, "folds.csv"), index=False)
+    horizon_metrics.to_csv(
+        os.path.join(backtest_dir, "horizon_days.csv"), index=False
+    )
+    return fold_metrics, horizon_metrics
@@ -0,0 +1,273 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import lightgbm as lgb
+import numpy as np
+
+from demand_sense.feature_extractor.feature_extractor import TRAIN_END
+from demand_sense.feature_extractor.feature_extractor import VALIDATION_END
+
+LOGGER = logging.getLogger(__name__)
+
+# constructed LightGBM Datasets and the arrays needed next to them, per key
+DATASET_CACHE_DIR = "dataset_cache"
+TRAIN_BINARY = "train.bin"
+VALID_BINARY = "valid.bin"
+FULL_BINARY = "full.bin"
+X_VALID_FILE = "x_valid.npy"
+Y_VALID_FILE = "y_valid.npy"
+SCHEMA_FILE = "schema.json"
+# data digests with the sizes and modification times they were computed at
+FINGERPRINT_FILE = "fingerprints.json"
+# what the HPO trials need, train_model needs the full data Dataset too
+TRIAL_FILES = [TRAIN_BINARY, VALID_BINARY, X_VALID_FILE, Y_VALID_FILE]
+# most recently used entries kept, older data leaves its binaries otherwise
+DATASET_CACHE_ENTRIES = 3
+
+
+def load_fingerprints(memo_file):
+    """
+    :param memo_file: str, fingerprint memo path, None for no memo
+
+    :return fingerprints: dict, data path to its file stamps and digest
+    """
+    if memo_file is None or not os.path.isfile(memo_file):
+        return {}
+    try:
+        with open(memo_file) as f:
+            return json.load(f)
+    except ValueError:
+        LOGGER.warning("Ignoring unreadable fingerprints: %s", memo_file)
+        return {}
+
+
+def save_fingerprints(memo_file, fingerprints):
+    """
+    :param memo_file: str, fingerprint memo path
+    :param fingerprints: dict, data path to its file stamps and digest
+    """
+    os.makedirs(os.path.dirname(memo_file) or ".", exist_ok=True)
+    # replaced at once, concurrent runs never read a partial file
+    tmp_path = "{}.{}.tmp".format(memo_file, os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(fingerprints, f)
+    os.replace(tmp_path, memo_file)
+
+
+def data_fingerprint(data_file, chunk_size=1 << 20, memo_file=None):
+    """
+    Hash of the content of a sales CSV or of every file of a columnar store.
+    With a memo file the hash is kept next to the size and modification
+    time of every file and the content only read again when they change.
+
+    :param data_file: str, data file or store directory
+    :param chunk_size: int, bytes read at a time
+    :param memo_file: str, fingerprint memo path, None to always hash
+
+    :return fingerprint: str, hex digest
+    """
+    if os.path.isdir(data_file):
+        paths = sorted(
+            os.path.join(root, name)
+            for root, dirs, files in os.walk(data_file)
+            for name in files
+        )
+    else:
+        paths = [data_file]
+    stamps = []
+    for path in paths:
+        stat = os.stat(path)
+        stamps.append(
+            [os.path.relpath(path, data_file), stat.st_size, stat.st_mtime_ns]
+        )
+    fingerprints = load_fingerprints(memo_file)
+    memo = fingerprints.get(os.path.abspath(data_file))
+    if memo is not None and memo["stamps"] == stamps:
+        return memo["digest"]
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.relpath(path, data_file).encode("utf-8"))
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+    if memo_file is not None:
+        fingerprints[os.path.abspath(data_file)] = {
+            "stamps": stamps,
+            "digest": digest.hexdigest(),
+        }
+        save_fingerprints(memo_file, fingerprints)
+    return digest.hexdigest()
+
+
+def save_rows(path, rows):
+    """
+    Saves rows as a float64 numpy file, an lgb.Sequence being copied in
+    batches so that its rows are never all in memory
+
+    :param path: str, .npy file path
+    :param rows: numpy array, pandas.Dataframe or lgb.Sequence of rows
+    """
+    if not isinstance(rows, lgb.Sequence):
+        np.save(path, np.asarray(rows, dtype=np.float64))
+        return
+    saved = None
+    for start in range(0, len(rows), rows.batch_size):
+        batch = np.asarray(
+            rows[start : start + rows.batch_size], dtype=np.float64
+        )
+        if saved is None:
+            saved = np.lib.format.open_memmap(
+                path,
+                mode="w+",
+                dtype=np.float64,
+                shape=(len(rows), batch.shape[1]),
+            )
+        saved[start : start + len(batch)] = batch
+    if saved is None:
+        np.save(path, np.empty((0, 0)))
+        return
+    saved.flush()
+    del saved
+
+
+def dataset_key(
+    data_file, config, mapping=None, n_partitions=0, model_dir=None
+):
+    """
+    Key of the Datasets built from a data file with a feature configuration
+    and the train / validation split boundaries
+
+    :param data_file: str, data file or store directory
+    :param config: dict, feature configuration
+    :param mapping: dict, id code mapping for categorical encoding
+    :param n_partitions: int, number of series partitions of a streaming
+    build, 0 for the in-memory build; the noise is drawn per partition and
+    the features stored as float32 when streaming
+    :param model_dir: str, model directory whose dataset cache keeps the
+    data fingerprints, the data is hashed on every call if None
+
+    :return key: str, hex digest
+    """
+    memo_file = None
+    if model_dir is not None:
+        memo_file = os.path.join(
+            model_dir, DATASET_CACHE_DIR, FINGERPRINT_FILE
+        )
+    description = {
+        "data": data_fingerprint(data_file, memo_file=memo_file),
+        "config": config,
+        "mapping": mapping,
+        "partitions": n_partitions,
+        "train_end": TRAIN_END,
+        "validation_end": VALIDATION_END,
+        "lightgbm": lgb.__version__,
+    }
+    text = json.dumps(description, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class DatasetCache:
+    """
+    Directory of LightGBM Dataset binaries, validation arrays and feature
+    schema built for one dataset_key. Later runs with unchanged data and
+    feature configuration load them instead of featurizing and binning.
+    Only the most recently used entries are kept.
+    """
+
+    def __init__(self, model_dir, key):
+        self.key = key
+        self.cache_dir = os.path.join(model_dir, DATASET_CACHE_DIR, key)
+
+    def path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def touch(self):
+        """
+        Marks the entry as the most recently used
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        os.utime(self.cache_dir)
+
+    def prune(self, keep=DATASET_CACHE_ENTRIES):
+        """
+        Removes the entries of the other keys beyond the keep most recently
+        used, this entry included
+
+        :param keep: int, number of entries kept
+        """
+        root = os.path.dirname(self.cache_dir)
+        entries = [
+            os.path.join(root, name)
+            for name in os.listdir(root)
+            if name != self.key and os.path.isdir(os.path.join(root, name))
+        ]
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for path in entries[max(keep - 1, 0) :]:
+            LOGGER.info("Removing cached datasets: %s", path)
+            shutil.rmtree(path, ignore_errors=True)
+
+    def has(self, names):
+        """
+        :param names: list of str, cached file names
+
+        :return cached: bool, whether all the files are cached
+        """
+        return all(
+            os.path.isfile(self.path(name)) for name in names + [SCHEMA_FILE]
+        )
+
+    def save(self, datasets, x_val, y_val, schema):
+        """
+        :param datasets: dict, file name to lgb.Dataset to save
+        :param x_val: pandas.Dataframe, array or lgb.Sequence, validation
+        features
+        :param y_val: pandas.Series or array, validation sales
+        :param schema: dict, feature schema of the model input
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for name, dataset in datasets.items():
+            # LightGBM refuses to overwrite a binary
+            tmp_path = self.path(name + ".tmp")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            dataset.save_binary(tmp_path)
+            os.replace(tmp_path, self.path(name))
+        save_rows(self.path(X_VALID_FILE), x_val)
+        np.save(self.path(Y_VALID_FILE), np.asarray(y_val, dtype=np.float64))
+        # written last, it marks the entry as complete
+        with open(self.path(SCHEMA_FILE), "w") as f:
+            json.dump(schema, f)
+        LOGGER.info("Datasets cached: %s", self.cache_dir)
+
+    def dataset(self, name, reference=None):
+        """
+        :param name: str, binary file name
+        :param reference: lgb.Dataset, Dataset the bins are taken from
+
+        :return dataset: lgb.Dataset loaded from the binary
+        """
+        return lgb.Dataset(self.path(name), reference=reference)
+
+    def train_valid(self):
+        """
+        :return dtrain: lgb.Dataset, training set
+        :return dvalid: lgb.Dataset, validation set binned like dtrain
+        """
+        dtrain = self.dataset(TRAIN_BINARY)
+        return dtrain, self.dataset(VALID_BINARY, reference=dtrain)
+
+    def validation(self, mmap_mode=None):
+        """
+        :param mmap_mode: str, numpy memory map mode of the features
+
+        :return x_val: numpy array, validation features
+        :return y_val: numpy array, validation sales
+        """
+        x_val = np.load(self.path(X_VALID_FILE), mmap_mode=mmap_mode)
+        return x_val, np.load(self.path(Y_VALID_FILE))
+
+    def schema(self):
+        with open(self.path(SCHEMA_FILE)) as f:
+            return json.load(f)
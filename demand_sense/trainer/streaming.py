@@ -0,0 +1,217 @@
+import os
+import shutil
+import logging
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from demand_sense.utils.check_df import check_df
+from demand_sense.storage.loader import cast_sales_data
+from demand_sense.storage.partition import partition_by_series
+from demand_sense.feature_extractor.feature_extractor import add_features
+from demand_sense.feature_extractor.feature_extractor import feature_columns
+from demand_sense.feature_extractor.feature_extractor import TRAIN_END
+from demand_sense.feature_extractor.feature_extractor import VALIDATION_END
+from demand_sense.feature_extractor.encoding import ONEHOT_COLUMNS
+from demand_sense.feature_extractor.encoding import categorical_features
+from demand_sense.feature_extractor.encoding import encode_ids
+from demand_sense.feature_extractor.schema import build_feature_schema
+from demand_sense.feature_extractor.schema import build_feature_matrix
+from demand_sense.trainer.dataset_cache import TRAIN_BINARY
+from demand_sense.trainer.dataset_cache import VALID_BINARY
+from demand_sense.trainer.dataset_cache import FULL_BINARY
+
+LOGGER = logging.getLogger(__name__)
+
+# split of every row in the on-disk feature matrix
+TRAIN_ROWS, VALID_ROWS, LATER_ROWS = 0, 1, 2
+
+
+class RowSequence(lgb.Sequence):
+    """
+    Rows of an on-disk feature matrix read by LightGBM in batches while it
+    builds a Dataset, so the rows are never all loaded at once
+    """
+
+    def __init__(self, matrix, rows, batch_size=65536):
+        self.matrix = matrix
+        self.rows = rows
+        self.batch_size = batch_size
+
+    def __getitem__(self, idx):
+        # LightGBM samples and pushes doubles, the matrix is float32 on disk
+        return self.matrix[self.rows[idx]].astype(np.float64)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def read_partition(path):
+    """
+    :param path: str, series partition file
+
+    :return data: pandas.Dataframe, typed sales data of the partition sorted
+    by date
+    """
+    data = cast_sales_data(pd.read_parquet(path))
+    return data.sort_values("date", kind="stable").reset_index(drop=True)
+
+
+def stream_schema(sample, config, mapping, vocab):
+    """
+    Feature schema of the whole data built from one partition, the one-hot
+    columns coming from the vocabulary of the whole data in the order
+    pandas.get_dummies gives them
+
+    :param sample: pandas.Dataframe, sales data of one partition
+    :param config: dict, feature configuration
+    :param mapping: dict, id code mapping for categorical encoding
+    :param vocab: dict, sorted values of the one-hot encoded columns
+
+    :return schema: dict, feature schema of the model input
+    """
+    data = add_features(sample.copy(), config)
+    if config.get("encoding") == "categorical":
+        data = encode_ids(data, mapping)
+        return build_feature_schema(
+            data[feature_columns(data)], config, mapping
+        )
+    base = data.drop(columns=ONEHOT_COLUMNS)
+    dummies = [
+        pd.get_dummies(
+            pd.Categorical(data[col], categories=vocab[col]), prefix=col
+        )
+        for col in ONEHOT_COLUMNS
+    ]
+    x_sample = pd.concat([base[feature_columns(base)]] + dummies, axis=1)
+    return build_feature_schema(x_sample, config, mapping)
+
+
+def split_codes(dates):
+    """
+    :param dates: pandas.Series, row dates
+
+    :return split: numpy array, TRAIN_ROWS, VALID_ROWS or LATER_ROWS
+    """
+    dates = dates.to_numpy()
+    return np.where(
+        dates < np.datetime64(TRAIN_END),
+        TRAIN_ROWS,
+        np.where(
+            dates < np.datetime64(VALIDATION_END), VALID_ROWS, LATER_ROWS
+        ),
+    ).astype(np.int8)
+
+
+def build_datasets_chunked(
+    data_file,
+    cache,
+    config,
+    mapping=None,
+    n_partitions=16,
+    chunk_rows=1000000,
+    feature_jobs=1,
+):
+    """
+    Builds the cached Datasets of build_datasets with memory bounded by the
+    size of a series partition rather than by the whole data. The data is
+    streamed into files of whole (customer, product) series, each partition
+    is featurized on its own into an on-disk float32 feature matrix, and
+    LightGBM reads that matrix in batches.
+
+    :param data_file: str, data file path
+    :param cache: DatasetCache, cache entry of the data and configuration
+    :param config: dict, feature configuration
+    :param mapping: dict, id code mapping for categorical encoding
+    :param n_partitions: int, number of series partitions
+    :param chunk_rows: int, maximum number of rows read from the source at a
+    time
+    :param feature_jobs: int, number of processes computing the series
+    features of a partition
+    """
+    work_dir = cache.path("chunked")
+    paths, vocab = partition_by_series(
+        data_file,
+        os.path.join(work_dir, "partitions"),
+        n_partitions,
+        chunk_rows,
+    )
+    # row counts from the parquet footers, no partition is read twice
+    n_rows = sum(pq.ParquetFile(p).metadata.num_rows for p in paths)
+    schema = stream_schema(read_partition(paths[0]), config, mapping, vocab)
+    features = schema["features"]
+    LOGGER.info(
+        "%s rows in %s partitions, %s features",
+        n_rows,
+        len(paths),
+        len(features),
+    )
+
+    matrix = np.lib.format.open_memmap(
+        os.path.join(work_dir, "features.npy"),
+        mode="w+",
+        dtype=np.float32,
+        shape=(n_rows, len(features)),
+    )
+    labels = np.empty(n_rows, dtype=np.float32)
+    split = np.empty(n_rows, dtype=np.int8)
+    offset = 0
+    periods = []
+    for i, path in enumerate(paths):
+        data = read_partition(path)
+        # the checks of build_datasets, one partition at a time
+        check_df(data)
+        if len(data):
+            periods.append((data["date"].min(), data["date"].max()))
+        # every partition draws its own reproducible noise
+        data = add_features(
+            data, config, [config["noise_seed"], i], feature_jobs
+        )
+        stop = offset + len(data)
+        matrix[offset:stop] = build_feature_matrix(data, schema)
+        labels[offset:stop] = data["sales"].to_numpy()
+        split[offset:stop] = split_codes(data["date"])
+        LOGGER.info(
+            "Featurized %s: %s rows", os.path.basename(path), len(data)
+        )
+        offset = stop
+    matrix.flush()
+    if periods:
+        first_date = min(start for start, _ in periods)
+        last_date = max(end for _, end in periods)
+        LOGGER.info("Data period: %s to %s", first_date, last_date)
+        LOGGER.info("Number of days: %s", last_date - first_date)
+
+    train_rows = np.flatnonzero(split == TRAIN_ROWS)
+    valid_rows = np.flatnonzero(split == VALID_ROWS)
+    categorical_feature = categorical_features(config)
+    lgbtrain = lgb.Dataset(
+        RowSequence(matrix, train_rows),
+        label=labels[train_rows],
+        feature_name=features,
+        categorical_feature=categorical_feature,
+    )
+    lgbval = lgb.Dataset(
+        RowSequence(matrix, valid_rows),
+        label=labels[valid_rows],
+        reference=lgbtrain,
+        feature_name=features,
+        categorical_feature=categorical_feature,
+    )
+    lgbfull = lgb.Dataset(
+        RowSequence(matrix, np.arange(n_rows)),
+        label=labels,
+        feature_name=features,
+        categorical_feature=categorical_feature,
+    )
+    # the validation features are copied to the cache in batches too
+    cache.save(
+        {TRAIN_BINARY: lgbtrain, VALID_BINARY: lgbval, FULL_BINARY: lgbfull},
+        RowSequence(matrix, valid_rows),
+        labels[valid_rows],
+        schema,
+    )
+    # the binaries replace the partitions and the feature matrix
+    del matrix
+    shutil.rmtree(work_dir)
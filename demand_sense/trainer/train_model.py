@@ -1,12 +1,31 @@
 import os
 import logging
-import pandas as pd
 import lightgbm as lgb
 import numpy as np
 
 from demand_sense.utils.check_df import check_df
+from demand_sense.storage.loader import load_sales_data
+from demand_sense.storage.partition import series_partition
 from demand_sense.feature_extractor.feature_extractor import get_processed_df
 from demand_sense.feature_extractor.feature_extractor import split
+from demand_sense.feature_extractor.feature_extractor import bytes_per_row
+from demand_sense.feature_extractor.feature_extractor import memory_report
+from demand_sense.feature_extractor.feature_extractor import FEATURE_CONFIG
+from demand_sense.feature_extractor.feature_extractor import VALIDATION_END
+from demand_sense.feature_extractor.encoding import ID_COLUMNS
+from demand_sense.feature_extractor.encoding import categorical_features
+from demand_sense.feature_extractor.encoding import fit_category_mapping
+from demand_sense.feature_extractor.encoding import load_category_mapping
+from demand_sense.feature_extractor.encoding import save_category_mapping
+from demand_sense.feature_extractor.schema import build_feature_schema
+from demand_sense.feature_extractor.schema import save_feature_schema
+from demand_sense.trainer.dataset_cache import DatasetCache
+from demand_sense.trainer.dataset_cache import dataset_key
+from demand_sense.trainer.dataset_cache import TRIAL_FILES
+from demand_sense.trainer.dataset_cache import TRAIN_BINARY
+from demand_sense.trainer.dataset_cache import VALID_BINARY
+from demand_sense.trainer.dataset_cache import FULL_BINARY
+from demand_sense.trainer.streaming import build_datasets_chunked
 from demand_sense.metrics.metrics import lgbm_smape
 from demand_sense.metrics.metrics import mean_absolute_error
 from demand_sense.metrics.metrics import mean_squared_error
@@ -15,48 +34,195 @@ from demand_sense.metrics.metrics import r2_score
 
 LOGGER = logging.getLogger(__name__)
 
+# rows of the series sample featurized twice for the memory report
+MEMORY_REPORT_ROWS = 100000
+# trees of the validated, final and backtested models
+LGB_PARAMS = {
+    "num_leaves": 10,
+    "learning_rate": 0.02,
+    "feature_fraction": 0.8,
+    "max_depth": 5,
+}
 
-def train_model(model_dir, data_file):
+
+def fit_encoding(data, model_dir, encoding, compact=False):
     """
-    Trains a LightGBM model and saves it in the model_dir
+    Feature configuration and id code mapping for the encoding mode. The
+    mapping is extended from the one saved in model_dir and saved back.
 
+    :param data: pandas.Dataframe, sales data
     :param model_dir: str, model directory
-    :param data_file: str, data file path
+    :param encoding: str, onehot or categorical
+    :param compact: bool, whether to store the features in small dtypes
+
+    :return config: dict, feature configuration
+    :return mapping: dict, id code mapping, None for onehot encoding
     """
-    LOGGER.info("Model directory: %s", model_dir)
-    data = pd.read_csv(data_file)
-    data["customer_id"] = data["customer_id"].astype(str)
-    data["date"] = pd.to_datetime(data["date"])
+    config = dict(FEATURE_CONFIG, encoding=encoding, compact=compact)
+    mapping = None
+    if encoding == "categorical":
+        mapping = fit_category_mapping(data, load_category_mapping(model_dir))
+        save_category_mapping(mapping, model_dir)
+    return config, mapping
 
-    LOGGER.info("Data directory: %s", data_file)
+
+def build_datasets(
+    data_file, cache, config, mapping=None, full=True, feature_jobs=1
+):
+    """
+    Featurizes the data, bins it into LightGBM Datasets and saves them in the
+    dataset cache
+
+    :param data_file: str, data file path
+    :param cache: DatasetCache, cache entry of the data and configuration
+    :param config: dict, feature configuration
+    :param mapping: dict, id code mapping for categorical encoding
+    :param full: bool, whether to build the Dataset of the full data used by
+    the final model, otherwise only the data up to the validation end is read
+    :param feature_jobs: int, number of processes computing the series
+    features
+    """
+    data = load_sales_data(
+        data_file, end_date=None if full else VALIDATION_END
+    )
     check_df(data)
     LOGGER.info(
         "Data period: %s to %s", data["date"].min(), data["date"].max()
     )
     LOGGER.info("Number of days: %s", data["date"].max() - data["date"].min())
+    if config.get("compact"):
+        # both modes featurized on whole series of a sample of the data
+        n_samples = max(1, len(data) // MEMORY_REPORT_ROWS)
+        memory_report(
+            data[series_partition(data, n_samples) == 0], config, mapping
+        )
 
-    data = get_processed_df(data)
+    data = get_processed_df(
+        data, config, mapping, config["noise_seed"], feature_jobs
+    )
+    LOGGER.info("Feature frame: %.1f bytes per row", bytes_per_row(data))
+    categorical_feature = categorical_features(config)
 
     x_train, y_train, x_val, y_val, train_features = split(data)
+    schema = build_feature_schema(x_train, config, mapping)
 
-    lgb_params = {
-        "num_leaves": 10,
-        "learning_rate": 0.02,
-        "feature_fraction": 0.8,
-        "max_depth": 5,
-        "verbose": 0,
-        "num_boost_round": 1500,
-        "early_stopping_rounds": 300,
-        "nthread": -1,
-    }
     lgbtrain = lgb.Dataset(
-        data=x_train, label=y_train, feature_name=train_features
+        data=x_train,
+        label=y_train,
+        feature_name=train_features,
+        categorical_feature=categorical_feature,
     )
     lgbval = lgb.Dataset(
         data=x_val,
         label=y_val,
         reference=lgbtrain,
         feature_name=train_features,
+        categorical_feature=categorical_feature,
+    )
+    datasets = {TRAIN_BINARY: lgbtrain, VALID_BINARY: lgbval}
+    if full:
+        datasets[FULL_BINARY] = lgb.Dataset(
+            data=data[train_features],
+            label=data["sales"],
+            feature_name=train_features,
+            categorical_feature=categorical_feature,
+        )
+    cache.save(datasets, x_val, y_val, schema)
+
+
+def cached_datasets(
+    model_dir,
+    data_file,
+    config,
+    mapping=None,
+    full=True,
+    n_partitions=0,
+    feature_jobs=1,
+):
+    """
+    Dataset cache entry of the data and feature configuration, built on the
+    first run and reused while the data and configuration are unchanged
+
+    :param model_dir: str, model directory holding the cache
+    :param data_file: str, data file path
+    :param config: dict, feature configuration
+    :param mapping: dict, id code mapping for categorical encoding
+    :param full: bool, whether the full data Dataset is needed
+    :param n_partitions: int, number of series partitions the data is
+    streamed through, the data is loaded at once if 0
+    :param feature_jobs: int, number of processes computing the series
+    features
+
+    :return cache: DatasetCache with the Datasets built
+    """
+    key = dataset_key(data_file, config, mapping, n_partitions, model_dir)
+    cache = DatasetCache(model_dir, key)
+    names = TRIAL_FILES + [FULL_BINARY] if full else TRIAL_FILES
+    if cache.has(names):
+        LOGGER.info("Using cached datasets: %s", cache.cache_dir)
+    elif n_partitions:
+        build_datasets_chunked(
+            data_file,
+            cache,
+            config,
+            mapping,
+            n_partitions,
+            feature_jobs=feature_jobs,
+        )
+    else:
+        build_datasets(data_file, cache, config, mapping, full, feature_jobs)
+    cache.touch()
+    cache.prune()
+    return cache
+
+
+def train_model(
+    model_dir,
+    data_file,
+    encoding="onehot",
+    n_partitions=0,
+    compact=False,
+    feature_jobs=1,
+):
+    """
+    Trains a LightGBM model and saves it in the model_dir
+
+    :param model_dir: str, model directory
+    :param data_file: str, data file path
+    :param encoding: str, onehot or categorical encoding of the ids
+    :param n_partitions: int, number of series partitions the data is
+    streamed through when it does not fit in memory, 0 to load it at once
+    :param compact: bool, whether to featurize into int8 / int16 / float32
+    columns to reduce the memory of the feature frame
+    :param feature_jobs: int, number of processes computing the series
+    features
+    """
+    LOGGER.info("Model directory: %s", model_dir)
+    LOGGER.info("Data directory: %s", data_file)
+    config, mapping = fit_encoding(
+        load_sales_data(data_file, columns=ID_COLUMNS),
+        model_dir,
+        encoding,
+        compact,
+    )
+    cache = cached_datasets(
+        model_dir,
+        data_file,
+        config,
+        mapping,
+        n_partitions=n_partitions,
+        feature_jobs=feature_jobs,
+    )
+    lgbtrain, lgbval = cache.train_valid()
+    x_val, y_val = cache.validation()
+    schema = cache.schema()
+
+    lgb_params = dict(
+        LGB_PARAMS,
+        verbose=0,
+        num_boost_round=1500,
+        early_stopping_rounds=300,
+        nthread=-1,
     )
     model = lgb.train(
         lgb_params,
@@ -83,22 +249,17 @@ def train_model(model_dir, data_file):
     LOGGER.info("%%% Training done %%%")
     LOGGER.info("%%% Get final model %%%")
 
-    x_train = data[train_features]
-    y_train = data["sales"]
-    lgb_params = {
-        "metric": {"mae"},
-        "num_leaves": 10,
-        "learning_rate": 0.02,
-        "feature_fraction": 0.8,
-        "max_depth": 5,
-        "verbose": 0,
-        "nthread": -1,
-        "num_boost_round": model.best_iteration,
-    }
-    lgbtrain_all = lgb.Dataset(
-        data=x_train, label=y_train, feature_name=train_features
+    lgb_params = dict(
+        LGB_PARAMS,
+        metric={"mae"},
+        verbose=0,
+        nthread=-1,
+        num_boost_round=model.best_iteration,
     )
+    lgbtrain_all = cache.dataset(FULL_BINARY)
     model = lgb.train(
         lgb_params, lgbtrain_all, num_boost_round=model.best_iteration
     )
-    model.save_model(os.path.join(model_dir, "model_trained.txt"))
+    model_file = os.path.join(model_dir, "model_trained.txt")
+    model.save_model(model_file)
+    save_feature_schema(schema, model_file)
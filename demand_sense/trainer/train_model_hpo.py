@@ -1,13 +1,17 @@
 import os
+import time
 import logging
-import pandas as pd
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import lightgbm as lgb
 import numpy as np
 import optuna
 
-from demand_sense.utils.check_df import check_df
-from demand_sense.feature_extractor.feature_extractor import get_processed_df
-from demand_sense.feature_extractor.feature_extractor import split
+from demand_sense.storage.loader import load_sales_data
+from demand_sense.feature_extractor.encoding import ID_COLUMNS
+from demand_sense.trainer.train_model import fit_encoding
+from demand_sense.trainer.train_model import cached_datasets
+from demand_sense.feature_extractor.schema import save_feature_schema
 from demand_sense.metrics.metrics import mean_absolute_error
 from demand_sense.metrics.metrics import mean_squared_error
 from demand_sense.metrics.metrics import explained_variance_score
@@ -16,48 +20,54 @@ from demand_sense.metrics.metrics import r2_score
 LOGGER = logging.getLogger(__name__)
 
 
+STUDY_FILE = "study.db"
+
+
+def search_params(trial):
+    """
+    Hyperparameter optimization search space for different variables
+
+    :param trial: optuna.Trial, current trial
+
+    :return param: dict, LightGBM parameters of the trial
+    """
+    return {
+        "objective": "regression",
+        "metric": "l1",
+        "verbosity": -1,
+        "learning_rate": trial.suggest_float(
+            "learning_rate", 0.005, 0.2, log=True
+        ),
+        "num_leaves": trial.suggest_int("num_leaves", 5, 15),
+        "max_depth": trial.suggest_int("max_depth", 3, 8),
+        "feature_fraction": trial.suggest_float("feature_fraction", 0.5, 1),
+    }
+
+
 class Objective:
-    def __init__(self):
-        self.best_booster = None
-        self._booster = None
+    """
+    Trains one model per trial on the Dataset binaries and validation arrays
+    of the dataset cache, so trials never featurize the data again. The
+    validation features are memory mapped and shared by concurrent trials.
+    """
 
-    def __call__(self, trial, data_file):
+    def __init__(self, cache, num_threads=0):
+        self.cache = cache
+        self.num_threads = num_threads
+        self.x_val, self.y_val = cache.validation(mmap_mode="r")
+
+    def __call__(self, trial):
         """
         Objective module for performing hyperparameter optimization
 
-        :param trial: int, trial id
-        :param data_file: str, data file path
+        :param trial: optuna.Trial, current trial
+
+        :return error: float, validation mean absolute error
         """
-        data = pd.read_csv(data_file)
-        data["date"] = pd.to_datetime(data["date"])
-        check_df(data)
-        LOGGER.info(
-            "Data period: %s to %s", data["date"].min(), data["date"].max()
-        )
-        LOGGER.info(
-            "Number of days: %s", data["date"].max() - data["date"].min()
-        )
-        data = get_processed_df(data)
-
-        x_train, y_train, x_test, y_test, train_features = split(data)
-
-        dtrain = lgb.Dataset(x_train, label=y_train)
-        dvalid = lgb.Dataset(x_test, label=y_test)
-
-        # hyperparameter optimization search space for different variables
-        param = {
-            "objective": "regression",
-            "metric": "l1",
-            "verbosity": 1,
-            "learning_rate": trial.suggest_float(
-                "learning_rate", 0.005, 0.2, log=True
-            ),
-            "num_leaves": trial.suggest_int("num_leaves", 5, 15),
-            "max_depth": trial.suggest_int("max_depth", 3, 8),
-            "feature_fraction": trial.suggest_uniform(
-                "feature_fraction", 0.5, 1
-            ),
-        }
+        param = search_params(trial)
+        # threads of concurrent trials share the cores
+        param["num_threads"] = self.num_threads
+        dtrain, dvalid = self.cache.train_valid()
 
         # Prune config for HPO
         pruning_callback = optuna.integration.LightGBMPruningCallback(
@@ -71,29 +81,37 @@ class Objective:
             callbacks=[pruning_callback],
         )
 
-        self._booster = gbm
-
-        preds = gbm.predict(x_test)
+        preds = gbm.predict(self.x_val)
         pred_labels = np.rint(preds)
-        error = mean_absolute_error(y_test, pred_labels)
+        error = mean_absolute_error(self.y_val, pred_labels)
         return error
 
-    def callback(self, study, trial):
-        if study.best_trial == trial:
-            self.best_booster = self._booster
+
+def run_trials(study_name, storage, cache, n_trials, n_jobs, num_threads):
+    """
+    Runs trials of a study stored in a database, in a worker process
+
+    :param study_name: str, name of the study
+    :param storage: str, database url of the study
+    :param cache: DatasetCache, cached Datasets shared by the trials
+    :param n_trials: int, number of trials of this worker
+    :param n_jobs: int, number of concurrent trials of this worker
+    :param num_threads: int, LightGBM threads of each trial
+    """
+    study = optuna.load_study(study_name=study_name, storage=storage)
+    study.optimize(
+        Objective(cache, num_threads), n_trials=n_trials, n_jobs=n_jobs
+    )
 
 
-def validate_model(data_file, best_model):
+def validate_model(best_model, x_val, y_val):
     """
     Validation module
 
-    :param data_file: str, data file path
     :param best_model: LightGBM model after hyperparameter optimization
+    :param x_val: numpy array, validation features
+    :param y_val: numpy array, validation sales
     """
-    data = pd.read_csv(data_file)
-    data["date"] = pd.to_datetime(data["date"])
-    data = get_processed_df(data)
-    x_train, y_train, x_val, y_val, train_features = split(data)
     LOGGER.info("%%% Validation metrics %%%")
     y_pred_val = best_model.predict(x_val)
     LOGGER.info(
@@ -110,21 +128,101 @@ def validate_model(data_file, best_model):
     LOGGER.info("\tR2 score: %s", r2_score(y_val, y_pred_val))
 
 
-def train_model_hpo(model_dir, data_file):
+def train_model_hpo(
+    model_dir,
+    data_file,
+    encoding="onehot",
+    n_trials=10,
+    n_jobs=1,
+    workers=1,
+    storage=None,
+    n_partitions=0,
+    compact=False,
+    feature_jobs=1,
+):
     """
     Trains a LightGBM model with hyperparameter optimization using OPTUNA
-    and saves it in the model_dir
+    and saves it in the model_dir. The data is featurized once; trials run
+    n_jobs at a time in each of the worker processes, which share the study
+    through a database. The Datasets come from the dataset cache shared
+    with train_model.
 
     :param model_dir: str, model directory
     :param data_file: str, data file path
+    :param encoding: str, onehot or categorical encoding of the ids
+    :param n_trials: int, total number of trials
+    :param n_jobs: int, number of concurrent trials per worker process
+    :param workers: int, number of worker processes
+    :param storage: str, database url of the study, a SQLite file in the hpo
+    directory of model_dir if None
+    :param n_partitions: int, number of series partitions the data is
+    streamed through, 0 to load it at once
+    :param compact: bool, whether to featurize into small dtypes
+    :param feature_jobs: int, number of processes computing the series
+    features
     """
-    objective = Objective()
-    func = lambda trial: objective(trial, data_file)
-    study = optuna.create_study(direction="minimize")
-    study.optimize(func, n_trials=10, callbacks=[objective.callback])
+    config, mapping = fit_encoding(
+        load_sales_data(data_file, columns=ID_COLUMNS),
+        model_dir,
+        encoding,
+        compact,
+    )
+    cache = cached_datasets(
+        model_dir,
+        data_file,
+        config,
+        mapping,
+        full=False,
+        n_partitions=n_partitions,
+        feature_jobs=feature_jobs,
+    )
+    hpo_dir = os.path.join(model_dir, "hpo")
+    os.makedirs(hpo_dir, exist_ok=True)
+    storage = storage or "sqlite:///" + os.path.abspath(
+        os.path.join(hpo_dir, STUDY_FILE)
+    )
+    study = optuna.create_study(
+        study_name="demand_sense_hpo_" + time.strftime("%Y%m%d_%H%M%S"),
+        storage=storage,
+        direction="minimize",
+    )
+    num_threads = max(1, (os.cpu_count() or 1) // (n_jobs * workers))
+    if workers > 1:
+        # spawned, forking after LightGBM used OpenMP may deadlock
+        context = multiprocessing.get_context("spawn")
+        shares = np.array_split(np.arange(n_trials), workers)
+        with ProcessPoolExecutor(workers, mp_context=context) as executor:
+            futures = [
+                executor.submit(
+                    run_trials,
+                    study.study_name,
+                    storage,
+                    cache,
+                    len(share),
+                    n_jobs,
+                    num_threads,
+                )
+                for share in shares
+                if len(share)
+            ]
+            for future in futures:
+                future.result()
+    else:
+        study.optimize(
+            Objective(cache, num_threads), n_trials=n_trials, n_jobs=n_jobs
+        )
 
-    best_model = objective.best_booster
     print("Number of finished trials:", len(study.trials))
     print("Best trial:", study.best_trial.params)
-    validate_model(data_file, best_model)
-    best_model.save_model(os.path.join(model_dir, "model_trained_hpo.txt"))
+    # boosters are not kept per trial, the best one is refit on the shared
+    # binaries from its parameters
+    param = dict(study.best_trial.params, objective="regression")
+    param.update(metric="l1", verbosity=-1)
+    dtrain, dvalid = cache.train_valid()
+    best_model = lgb.train(
+        param, dtrain, valid_sets=[dvalid], verbose_eval=False
+    )
+    validate_model(best_model, *cache.validation())
+    model_file = os.path.join(model_dir, "model_trained_hpo.txt")
+    best_model.save_model(model_file)
+    save_feature_schema(cache.schema(), model_file)
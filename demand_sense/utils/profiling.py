@@ -0,0 +1,278 @@
+import io
+import os
+import math
+import time
+import bisect
+import pstats
+import cProfile
+import logging
+import threading
+from contextlib import contextmanager
+
+LOGGER = logging.getLogger(__name__)
+
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+class Histogram:
+    """
+    Latency distribution of a span: count, sum and maximum of the durations
+    and the number of durations per bucket of upper bounds
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # the last count is the overflow above the largest bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        :param q: float, quantile between 0 and 1
+
+        :return value: float, upper bound of the bucket holding the quantile,
+        the maximum above the largest bound, NaN without observations
+        """
+        if not self.count:
+            return math.nan
+        rank, cumulative = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        """
+        :return snapshot: dict, count, sum, mean, maximum, quantiles and
+        cumulative counts per bucket bound
+        """
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else math.nan,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+
+class Metrics:
+    """
+    Process wide counters and span latency histograms, safe to update from
+    concurrent request threads
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        """
+        :return snapshot: dict, counters and span histogram snapshots by name
+        """
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "spans": {
+                    name: histogram.snapshot()
+                    for name, histogram in sorted(self.histograms.items())
+                },
+            }
+
+    def prometheus(self, prefix="demand_sense"):
+        """
+        :param prefix: str, prefix of the metric names
+
+        :return text: str, counters and histograms in the Prometheus text
+        exposition format, span and counter names as labels
+        """
+        snapshot = self.snapshot()
+        lines = [
+            "# TYPE {}_events_total counter".format(prefix),
+        ]
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(
+                '{}_events_total{{name="{}"}} {}'.format(prefix, name, value)
+            )
+        lines.append("# TYPE {}_span_seconds histogram".format(prefix))
+        for name, span_snapshot in snapshot["spans"].items():
+            for bound, count in span_snapshot["buckets"].items():
+                lines.append(
+                    '{}_span_seconds_bucket{{span="{}",le="{}"}} {}'.format(
+                        prefix, name, bound, count
+                    )
+                )
+            lines.append(
+                '{}_span_seconds_sum{{span="{}"}} {}'.format(
+                    prefix, name, span_snapshot["sum"]
+                )
+            )
+            lines.append(
+                '{}_span_seconds_count{{span="{}"}} {}'.format(
+                    prefix, name, span_snapshot["count"]
+                )
+            )
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+# stages recorded by the spans of the trace running on each thread
+_LOCAL = threading.local()
+# cProfile profiles one block at a time
+_PROFILE_LOCK = threading.Lock()
+
+
+@contextmanager
+def span(name, logger=LOGGER, level=logging.DEBUG, metrics=METRICS):
+    """
+    Times the enclosed block into the latency histogram of name, counts its
+    errors and logs its duration. The duration is also added to the stage
+    breakdown of the trace the block runs in.
+
+    :param name: str, span name, dotted by component
+    :param logger: logging.Logger, logger of the calling module
+    :param level: int, log level of the duration
+    :param metrics: Metrics, registry the span is recorded in
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metrics.increment(name + ".errors")
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe(name, elapsed)
+        stages = getattr(_LOCAL, "stages", None)
+        if stages is not None:
+            stages.append((name, elapsed))
+        logger.log(level, "%s: %.1f ms", name, 1000 * elapsed)
+
+
+@contextmanager
+def trace(name, logger=LOGGER, slow_seconds=None, metrics=METRICS):
+    """
+    Span of a whole request collecting the spans run inside it on the same
+    thread. The stage breakdown is logged at INFO when the request took at
+    least slow_seconds, at DEBUG otherwise.
+
+    :param name: str, request name
+    :param logger: logging.Logger, logger of the calling module
+    :param slow_seconds: float, duration of a slow request, None to log
+    every breakdown at DEBUG
+    :param metrics: Metrics, registry the request is recorded in
+
+    :return stages: yields the list of (span name, seconds) of the request
+    """
+    outer = getattr(_LOCAL, "stages", None)
+    stages = _LOCAL.stages = []
+    start = time.perf_counter()
+    try:
+        yield stages
+    except Exception:
+        metrics.increment(name + ".errors")
+        raise
+    finally:
+        _LOCAL.stages = outer
+        elapsed = time.perf_counter() - start
+        metrics.observe(name, elapsed)
+        slow = slow_seconds is not None and elapsed >= slow_seconds
+        logger.log(
+            logging.INFO if slow else logging.DEBUG,
+            "%s: %.1f ms [%s]",
+            name,
+            1000 * elapsed,
+            ", ".join(
+                "{} {:.1f} ms".format(stage, 1000 * seconds)
+                for stage, seconds in stages
+            ),
+        )
+
+
+@contextmanager
+def profiled(name, profile_dir, logger=LOGGER, top=25):
+    """
+    Runs the enclosed block under cProfile and saves its stats in
+    profile_dir, readable with pstats or snakeviz. Blocks starting while
+    another one is profiled run without the profiler.
+
+    :param name: str, name of the profiled block, prefix of the stats file
+    :param profile_dir: str, directory of the stats files, no profiling if
+    empty
+    :param logger: logging.Logger, logger of the calling module
+    :param top: int, number of functions by cumulative time logged at DEBUG
+
+    :return path: yields the stats file path, None when not profiled
+    """
+    if not profile_dir or not _PROFILE_LOCK.acquire(blocking=False):
+        yield None
+        return
+    path = os.path.join(
+        profile_dir,
+        "{}-{}.prof".format(name.replace(os.sep, "_"), time.time_ns()),
+    )
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            yield path
+        finally:
+            profiler.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            profiler.dump_stats(path)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats(
+            "cumulative"
+        ).print_stats(top)
+        logger.debug("Profile saved: %s\n%s", path, stream.getvalue())
+    finally:
+        _PROFILE_LOCK.release()
@@ -0,0 +1,70 @@
+import logging
+import click
+
+from demand_sense.utils import setup_logging
+from demand_sense.app.app import app
+from demand_sense.inference_module.engine import get_engine
+from demand_sense.inference_module.engine import PREDICT_BACKENDS
+from demand_sense.inference_module.forecast import check_and_generate_test_date
+from demand_sense.inference_module.warmup import warm_up
+
+LOGGER = logging.getLogger(__name__)
+
+
+@click.command()
+@click.option(
+    "--log_level",
+    default="INFO",
+    type=click.Choice(["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG"]),
+)
+@click.option("--log_dir", default="")
+@click.option("--model_file", default="model/model.txt")
+@click.option("--data_file", default="data_trc.csv")
+@click.option("--cache_dir", default="cache/")
+@click.option("--start_date", default="")
+@click.option("--months", default=3)
+@click.option(
+    "--backend",
+    default=app.config["PREDICT_BACKEND"],
+    type=click.Choice(PREDICT_BACKENDS),
+)
+@click.option("--active_days", default=app.config["ACTIVE_DAYS"] or 0)
+def warmup(
+    log_level,
+    log_dir,
+    model_file,
+    data_file,
+    cache_dir,
+    start_date,
+    months,
+    backend,
+    active_days,
+):
+    """
+    Warm-up module, predicts the coming months into the forecast cache
+    directory shared with the server workers
+
+    :param log_level: str, logger level
+    :param log_dir: str, specific log directory
+    :param model_file: str, trained model file
+    :param data_file: str, data path
+    :param cache_dir: str, cache directory of the server
+    :param start_date: str, date in the first month (DDMMYYYY), the day after
+    the sales history if empty
+    :param months: int, number of months to predict
+    :param backend: str, predict backend of the server
+    :param active_days: int, active pairs lookback of the server, every pair
+    if 0; the months are only served by a server with the same setting
+    """
+    setup_logging(log_level=log_level, log_dir=log_dir)
+    LOGGER.info(">warming up the forecast cache")
+    engine = get_engine(
+        model_file, data_file, cache_dir, backend, active_days or None
+    )
+    if start_date:
+        start_date = check_and_generate_test_date(start_date)
+    warm_up(engine, start_date or None, months)
+
+
+if __name__ == "__main__":
+    warmup()
@@ -18,8 +18,8 @@ dependencies = [
     "black",
     "flask",
     "flask-caching",
-    "requests",
     "optuna",
+    "pyarrow",
 ]
 
 setup(
@@ -28,6 +28,7 @@ setup(
     description="Demand Sensing",
     author="Deepan Chakravarthi Padmanabhan",
     install_requires=dependencies,
+    extras_require=dict(test=["pytest"]),
     packages=find_packages(),
     zip_safe=False,
     entry_points=dict(
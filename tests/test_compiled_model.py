@@ -0,0 +1,73 @@
+import lightgbm as lgb
+import numpy as np
+import pytest
+
+from demand_sense.inference_module.compiled_model import CompiledModel
+from demand_sense.inference_module.compiled_model import Predictor
+from demand_sense.inference_module.compiled_model import native_kernel
+from demand_sense.inference_module.compiled_model import parity_rows
+
+
+@pytest.fixture(scope="module")
+def booster():
+    rng = np.random.default_rng(0)
+    n_rows = 2000
+    x_data = np.column_stack(
+        [
+            rng.normal(size=n_rows),
+            rng.integers(0, 8, n_rows).astype(np.float64),
+            rng.normal(size=n_rows),
+            rng.integers(0, 5, n_rows).astype(np.float64),
+        ]
+    )
+    y_data = (
+        x_data[:, 0]
+        + np.isin(x_data[:, 1], [1, 3, 6])
+        + 0.5 * x_data[:, 3]
+        + rng.normal(scale=0.1, size=n_rows)
+    )
+    # missing values in a numerical and in a categorical feature
+    x_data[rng.random(n_rows) < 0.1, 0] = np.nan
+    x_data[rng.random(n_rows) < 0.1, 1] = np.nan
+    dataset = lgb.Dataset(x_data, label=y_data, categorical_feature=[1, 3])
+    params = {
+        "objective": "regression",
+        "num_leaves": 15,
+        "min_data_in_leaf": 5,
+        "verbosity": -1,
+    }
+    return lgb.train(params, dataset, num_boost_round=30)
+
+
+def scoring_rows(booster):
+    rng = np.random.default_rng(1)
+    x_data = rng.normal(size=(200, 4))
+    x_data[:, 1] = rng.integers(-1, 10, 200)
+    x_data[:, 3] = rng.integers(0, 6, 200)
+    x_data[rng.random(200) < 0.2, 0] = np.nan
+    x_data[rng.random(200) < 0.2, 1] = np.nan
+    x_data[:5, 2] = 0.0
+    compiled = CompiledModel.from_booster(booster)
+    return np.vstack([x_data, parity_rows(compiled)])
+
+
+@pytest.mark.parametrize("native", [False, True])
+def test_predictor_matches_booster(booster, native):
+    if native and native_kernel() is None:
+        pytest.skip("no C compiler")
+    compiled = CompiledModel.from_booster(booster, native=native)
+    assert compiled.native == native
+    predictor = Predictor(booster, compiled, max_rows=np.inf)
+    x_data = scoring_rows(booster)
+    for dtype in [np.float64, np.float32]:
+        x_rows = x_data.astype(dtype)
+        np.testing.assert_allclose(
+            predictor.predict(x_rows),
+            booster.predict(x_rows),
+            rtol=1e-12,
+            atol=1e-12,
+        )
+
+
+def test_compiled_is_numpy_by_default(booster):
+    assert not CompiledModel.from_booster(booster).native
@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+
+from demand_sense.trainer.dataset_cache import data_fingerprint
+from demand_sense.trainer.dataset_cache import save_rows
+from demand_sense.trainer.streaming import RowSequence
+
+
+def test_save_rows_streams_a_sequence(tmp_path):
+    matrix = np.arange(50 * 3, dtype=np.float32).reshape(50, 3)
+    rows = np.array([1, 4, 5, 9, 20, 21, 22, 49])
+    path = str(tmp_path / "x.npy")
+    save_rows(path, RowSequence(matrix, rows, batch_size=3))
+    saved = np.load(path)
+    assert saved.dtype == np.float64
+    np.testing.assert_array_equal(saved, matrix[rows])
+
+
+def test_data_fingerprint_memo(tmp_path):
+    data_file = str(tmp_path / "data.csv")
+    memo_file = str(tmp_path / "cache" / "fingerprints.json")
+    with open(data_file, "w") as f:
+        f.write("date,customer_id,product_id,sales\n2019-01-01,1,P0,3\n")
+    digest = data_fingerprint(data_file)
+    assert data_fingerprint(data_file, memo_file=memo_file) == digest
+    assert os.path.isfile(memo_file)
+
+    # same size and modification time, the memo is trusted
+    stat = os.stat(data_file)
+    with open(data_file, "r+") as f:
+        f.seek(stat.st_size - 2)
+        f.write("4")
+    os.utime(data_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert data_fingerprint(data_file, memo_file=memo_file) == digest
+
+    # touched, the content is hashed again
+    os.utime(data_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    changed = data_fingerprint(data_file, memo_file=memo_file)
+    assert changed != digest
+    assert changed == data_fingerprint(data_file)
@@ -0,0 +1,254 @@
+import os
+import shutil
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import pytest
+
+from demand_sense.feature_extractor.feature_extractor import FEATURE_CONFIG
+from demand_sense.feature_extractor.feature_extractor import feature_columns
+from demand_sense.feature_extractor.feature_extractor import get_processed_df
+from demand_sense.feature_extractor.schema import build_feature_schema
+from demand_sense.feature_extractor.schema import save_feature_schema
+from demand_sense.feature_extractor.series_features import lag_name
+from demand_sense.inference_module.engine import InferenceEngine
+from demand_sense.inference_module.engine import get_engine
+from demand_sense.inference_module.forecast_cache import DiskForecastCache
+from demand_sense.inference_module.test_helper import generate_range_df
+from demand_sense.storage.loader import load_sales_data
+
+# July is forecast in one block after a history ending on June 30
+CONFIG = dict(FEATURE_CONFIG, lags=[31, 38])
+DATES = ["01072019", "15072019", "31072019"]
+
+
+def write_sales(data_file, scale=1.0, seed=0):
+    """
+    Daily sales of 3 customers and 2 products in the first half of 2019
+    following a slow cycle, one series with missing days
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2019-01-01", "2019-06-30")
+    frames = []
+    for i in range(6):
+        # a slow cycle that the lags of a month follow
+        level = 5 + i + 4 * np.sin(np.arange(400) * 2 * np.pi / 90 + i)
+        days = dates
+        if i == 0:
+            days = dates[rng.random(len(dates)) < 0.6]
+        frames.append(
+            pd.DataFrame(
+                {
+                    "date": days,
+                    "customer_id": 1000 + i % 3,
+                    "product_id": "P{}".format(i // 3),
+                    "sales": scale * rng.poisson(level[days.dayofyear]),
+                }
+            )
+        )
+    data = pd.concat(frames).sort_values("date", kind="stable")
+    data.to_csv(data_file, index=False)
+
+
+@pytest.fixture(scope="module")
+def trained(tmp_path_factory):
+    root = tmp_path_factory.mktemp("trained")
+    data_file = str(root / "data.csv")
+    model_file = str(root / "model_trained.txt")
+    write_sales(data_file)
+    processed = get_processed_df(load_sales_data(data_file), CONFIG)
+    x_train = processed[feature_columns(processed)]
+    booster = lgb.train(
+        {"objective": "regression", "num_leaves": 7, "verbose": -1},
+        lgb.Dataset(x_train, processed["sales"]),
+        num_boost_round=20,
+    )
+    booster.save_model(model_file)
+    save_feature_schema(build_feature_schema(x_train, CONFIG), model_file)
+    return root
+
+
+@pytest.fixture
+def files(trained, tmp_path):
+    """
+    Model, schema and data copied for a test that may replace them
+    """
+    for name in os.listdir(trained):
+        shutil.copy(os.path.join(trained, name), tmp_path)
+    return str(tmp_path / "model_trained.txt"), str(tmp_path / "data.csv")
+
+
+def pre_series_month(model_file, data_file, test_date):
+    """
+    Month predicted as before the engine: the whole history and the month
+    featurized together, lags taken by pandas groupby shift
+    """
+    booster = lgb.Booster(model_file=model_file)
+    history = load_sales_data(data_file)
+    first_day = pd.Timestamp(test_date).to_period("M").to_timestamp()
+    series = history[["customer_id", "product_id"]].drop_duplicates()
+    df_test = generate_range_df(
+        first_day, first_day + pd.DateOffset(months=1), series
+    )
+    df_all = pd.concat([history, df_test], ignore_index=True)
+    processed = get_processed_df(df_all.copy(), CONFIG)
+    grouped = df_all.groupby(["customer_id", "product_id"])["sales"]
+    for lag in CONFIG["lags"]:
+        processed[lag_name(lag)] = grouped.shift(lag)
+    test = processed.iloc[len(history) :]
+    df_month = df_all.iloc[len(history) :][["customer_id", "product_id"]]
+    df_month = df_month.astype(str)
+    df_month["date"] = test["date"]
+    df_month["sales"] = booster.predict(test[booster.feature_name()])
+    return df_month
+
+
+def expected_sales(df_month, test_date, customer_id=None, product_id=None):
+    rows = df_month["date"] == pd.to_datetime(test_date, format="%d%m%Y")
+    if customer_id is not None:
+        rows &= df_month["customer_id"] == customer_id
+    if product_id is not None:
+        rows &= df_month["product_id"] == product_id
+    return df_month.loc[rows, "sales"].sum()
+
+
+def test_infer_matches_pre_series_path(files):
+    model_file, data_file = files
+    engine = InferenceEngine(model_file, data_file)
+    df_month = pre_series_month(model_file, data_file, "2019-07-01")
+    for date in DATES:
+        np.testing.assert_allclose(
+            engine.infer(date, "day"), expected_sales(df_month, date)
+        )
+        # the series with missing days
+        np.testing.assert_allclose(
+            engine.infer(date, "customer_product", "1000", "P0"),
+            expected_sales(df_month, date, "1000", "P0"),
+        )
+        np.testing.assert_allclose(
+            engine.infer(date, "customer", "1001"),
+            expected_sales(df_month, date, "1001"),
+        )
+        np.testing.assert_allclose(
+            engine.infer(date, "product", product_id="P1"),
+            expected_sales(df_month, date, product_id="P1"),
+        )
+
+
+def replace_sales(data_file, scale):
+    """
+    Rewrites the data file with a stamp that differs even within the
+    resolution of the file system clock
+    """
+    stat = os.stat(data_file)
+    write_sales(data_file, scale)
+    os.utime(data_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_reload_if_changed(files):
+    model_file, data_file = files
+    engine = InferenceEngine(model_file, data_file)
+    before = engine.infer(DATES[1], "day")
+    key = engine.month_key(pd.Timestamp("2019-07-01"))
+    assert key in engine.forecast_cache
+    assert not engine.reload_if_changed()
+
+    replace_sales(data_file, 2.0)
+    # checked again only after min_interval seconds
+    assert not engine.reload_if_changed(min_interval=3600)
+    assert engine.reload_if_changed()
+    assert key not in engine.forecast_cache
+    assert engine.month_key(pd.Timestamp("2019-07-01")) != key
+    after = engine.infer(DATES[1], "day")
+    df_month = pre_series_month(model_file, data_file, "2019-07-01")
+    np.testing.assert_allclose(after, expected_sales(df_month, DATES[1]))
+    assert after != before
+
+
+def test_stale_forecasts_not_shared(files, tmp_path):
+    model_file, data_file = files
+    cache_dir = str(tmp_path / "forecasts")
+    engine = InferenceEngine(
+        model_file, data_file, DiskForecastCache(cache_dir)
+    )
+    before = engine.infer(DATES[0], "day")
+    replace_sales(data_file, 2.0)
+    # a worker started after the data changed, sharing the directory
+    other = InferenceEngine(
+        model_file, data_file, DiskForecastCache(cache_dir)
+    )
+    after = other.infer(DATES[0], "day")
+    assert after != before
+    assert engine.reload_if_changed()
+    assert engine.infer(DATES[0], "day") == after
+
+
+def test_get_engine_key(files, monkeypatch):
+    model_file, data_file = files
+    engine = get_engine(model_file, data_file)
+    monkeypatch.chdir(os.path.dirname(model_file))
+    assert get_engine("model_trained.txt", "data.csv") is engine
+    compiled = get_engine(model_file, data_file, backend="compiled")
+    active = get_engine(model_file, data_file, active_days=30)
+    assert compiled is not engine and active is not engine
+    assert compiled.backend == "compiled" and active.active_days == 30
+    assert get_engine(model_file, data_file, active_days=30) is active
+
+
+def test_api_reload(files, monkeypatch):
+    from demand_sense.app.app import app
+
+    model_file, data_file = files
+    monkeypatch.setitem(app.config, "MODEL_FILE", model_file)
+    monkeypatch.setitem(app.config, "DATA_FILE", data_file)
+    monkeypatch.setitem(app.config, "FORECAST_CACHE_DIR", None)
+    monkeypatch.setitem(app.config, "RELOAD_CHECK_SECONDS", 3600)
+    client = app.test_client()
+    before = client.get("/api/predict?date=" + DATES[1]).get_json()["sales"]
+
+    replace_sales(data_file, 2.0)
+    # the cached response and the unchecked files still give the old value
+    response = client.get("/api/predict?date=" + DATES[1])
+    assert response.get_json()["sales"] == before
+    response = client.post("/api/reload")
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "model_file": model_file,
+        "data_file": data_file,
+    }
+    after = client.get("/api/predict?date=" + DATES[1]).get_json()["sales"]
+    df_month = pre_series_month(model_file, data_file, "2019-07-01")
+    np.testing.assert_allclose(after, expected_sales(df_month, DATES[1]))
+    assert after != before
+
+
+def test_compiled_series_path(files):
+    model_file, data_file = files
+    engine = InferenceEngine(model_file, data_file)
+    compiled = InferenceEngine(model_file, data_file, backend="compiled")
+    predict = compiled.predictor.compiled.predict
+    scored = []
+
+    def counted(x_data):
+        scored.append(len(x_data))
+        return predict(x_data)
+
+    compiled.predictor.compiled.predict = counted
+    for date in DATES:
+        np.testing.assert_allclose(
+            compiled.infer(date, "customer_product", "1000", "P0"),
+            engine.infer(date, "customer_product", "1000", "P0"),
+            rtol=1e-12,
+        )
+        np.testing.assert_allclose(
+            compiled.infer(date, "customer", "1001", "P1"),
+            engine.infer(date, "customer", "1001"),
+            rtol=1e-12,
+        )
+    # one series over July scored once by the compiled trees, the month
+    # itself never predicted
+    assert scored[0] == 31
+    assert len(compiled.forecast_cache) == 0
+    with pytest.raises(KeyError):
+        compiled.infer(DATES[0], "customer", "999")
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from demand_sense.feature_extractor.feature_extractor import FEATURE_CONFIG
+from demand_sense.feature_extractor.feature_extractor import get_processed_df
+from demand_sense.feature_extractor.series_features import ewm_name
+from demand_sense.feature_extractor.series_features import lag_name
+from demand_sense.feature_extractor.series_features import roll_mean_name
+from demand_sense.inference_module.forecast import forecast_features
+from demand_sense.inference_module.test_helper import generate_range_df
+from demand_sense.storage.loader import cast_sales_data
+
+CONFIG = dict(
+    FEATURE_CONFIG, lags=[7, 14], windows=[14], alphas=[0.5], ewm_lags=[7]
+)
+SERIES_COLUMNS = [lag_name(7), lag_name(14), roll_mean_name(14)] + [
+    ewm_name(0.5, 7)
+]
+
+
+@pytest.fixture(scope="module")
+def gapped_history():
+    """
+    Daily sales of series with missing days, one of them without sales in
+    the last 40 days of the history, sorted by date as loaded
+    """
+    rng = np.random.default_rng(0)
+    dates = pd.date_range("2019-01-01", "2019-06-30")
+    frames = []
+    for i in range(6):
+        days = dates[rng.random(len(dates)) < 0.7]
+        if i == 0:
+            days = days[days < dates[-40]]
+        frames.append(
+            pd.DataFrame(
+                {
+                    "date": days,
+                    "customer_id": str(1000 + i % 3),
+                    "product_id": "P{}".format(i // 3),
+                    "sales": rng.poisson(3, len(days)).astype(np.float64),
+                }
+            )
+        )
+    data = cast_sales_data(pd.concat(frames, ignore_index=True))
+    return data.sort_values("date", kind="stable").reset_index(drop=True)
+
+
+@pytest.mark.parametrize("start", ["2019-05-20", "2019-07-01"])
+def test_forecast_features_match_full_history(gapped_history, start):
+    start = pd.Timestamp(start)
+    history = gapped_history.loc[gapped_history["date"] < start]
+    series = history[["customer_id", "product_id"]].drop_duplicates()
+    df_test = generate_range_df(start, start + pd.Timedelta(days=10), series)
+    test = forecast_features(gapped_history, df_test, CONFIG)
+    full = get_processed_df(
+        pd.concat([history, df_test], ignore_index=True), CONFIG
+    )
+    expected = full.iloc[len(history) :]
+    assert len(test) == len(df_test)
+    np.testing.assert_array_equal(
+        test["date"].to_numpy(), df_test["date"].to_numpy()
+    )
+    np.testing.assert_allclose(
+        test[SERIES_COLUMNS].to_numpy(dtype=np.float64),
+        expected[SERIES_COLUMNS].to_numpy(dtype=np.float64),
+        rtol=1e-5,
+        atol=1e-5,
+    )
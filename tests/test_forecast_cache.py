@@ -0,0 +1,50 @@
+import datetime
+
+import pandas as pd
+
+from demand_sense.inference_module.forecast_cache import DiskForecastCache
+from demand_sense.inference_module.forecast_cache import forecast_key
+
+
+def month_frame(sales):
+    return pd.DataFrame(
+        {
+            "customer_id": pd.Categorical(["1000", "1001"]),
+            "product_id": pd.Categorical(["P0", "P1"]),
+            "date": pd.to_datetime(["2020-04-01", "2020-04-02"]),
+            "sales": [sales, sales + 1.0],
+        }
+    )
+
+
+def test_disk_forecast_cache_round_trip(tmp_path):
+    key = forecast_key("model-1", "data-1", datetime.date(2020, 4, 1))
+    df_month = month_frame(2.5)
+    DiskForecastCache(str(tmp_path)).put(key, df_month)
+    # another process sees the month through the directory only
+    other = DiskForecastCache(str(tmp_path))
+    assert key in other
+    pd.testing.assert_frame_equal(other.get(key), df_month)
+    assert other.hits == 1 and other.misses == 0
+
+
+def test_disk_forecast_cache_keys(tmp_path):
+    cache = DiskForecastCache(str(tmp_path))
+    date = datetime.date(2020, 4, 1)
+    cache.put(forecast_key("model-1", "data-1", date), month_frame(1.0))
+    assert cache.get(forecast_key("model-2", "data-1", date)) is None
+    assert cache.get(forecast_key("model-1", "data-1", date, 30)) is None
+
+
+def test_disk_forecast_cache_prunes_oldest(tmp_path):
+    cache = DiskForecastCache(str(tmp_path), max_entries=1, max_files=2)
+    keys = [
+        forecast_key("model-1", "data-1", datetime.date(2020, month, 1))
+        for month in range(1, 5)
+    ]
+    for i, key in enumerate(keys):
+        cache.put(key, month_frame(float(i)))
+    assert len(list(tmp_path.iterdir())) == 2
+    cache.clear()
+    assert cache.get(keys[0]) is None
+    pd.testing.assert_frame_equal(cache.get(keys[-1]), month_frame(3.0))
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from demand_sense.inference_module.hierarchy import Hierarchy
+
+
+@pytest.fixture
+def hierarchy():
+    rng = np.random.default_rng(0)
+    pairs = rng.choice(4 * 6, size=15, replace=False)
+    return Hierarchy(pairs // 6, pairs % 6, 4, 6), pairs
+
+
+def test_aggregate_sums_every_level(hierarchy):
+    hierarchy, pairs = hierarchy
+    bottom = np.arange(hierarchy.n_series * 2, dtype=float).reshape(-1, 2)
+    nodes = hierarchy.aggregate(bottom)
+    assert nodes.shape == (hierarchy.n_nodes, 2)
+    np.testing.assert_allclose(nodes[0], bottom.sum(axis=0))
+    for customer in range(4):
+        np.testing.assert_allclose(
+            nodes[hierarchy.offsets["customer"] + customer],
+            bottom[pairs // 6 == customer].sum(axis=0),
+        )
+    for product in range(6):
+        np.testing.assert_allclose(
+            nodes[hierarchy.offsets["product"] + product],
+            bottom[pairs % 6 == product].sum(axis=0),
+        )
+    np.testing.assert_allclose(
+        nodes[hierarchy.offsets["customer_product"] :], bottom
+    )
+
+
+def test_aggregate_without_series():
+    hierarchy = Hierarchy(np.array([], int), np.array([], int), 2, 3)
+    nodes = hierarchy.aggregate(np.zeros((0, 5)))
+    np.testing.assert_array_equal(nodes, np.zeros((6, 5)))
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from demand_sense.feature_extractor.series_features import ewm_name
+from demand_sense.feature_extractor.series_features import lag_name
+from demand_sense.feature_extractor.series_features import roll_mean_name
+from demand_sense.feature_extractor.series_features import series_features
+from demand_sense.feature_extractor.series_features import series_partitions
+
+LAGS = [1, 7, 30]
+WINDOWS = [14, 30]
+ALPHAS = [0.9, 0.5]
+EWM_LAGS = [1, 14]
+
+
+@pytest.fixture(scope="module")
+def sales():
+    """
+    Daily sales of series of uneven lengths in date order, with missing
+    sales and rows without a customer
+    """
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(12):
+        n_days = int(rng.integers(5, 120))
+        start = pd.Timestamp("2019-01-01") + pd.Timedelta(
+            days=int(rng.integers(0, 60))
+        )
+        frames.append(
+            pd.DataFrame(
+                {
+                    "customer_id": str(1000 + i % 4),
+                    "product_id": "P{}".format(i // 4),
+                    "date": pd.date_range(start, periods=n_days),
+                    "sales": rng.poisson(3, n_days).astype(np.float64),
+                }
+            )
+        )
+    data = pd.concat(frames, ignore_index=True)
+    data.loc[rng.random(len(data)) < 0.05, "sales"] = np.nan
+    data.loc[data.index[:3], "customer_id"] = np.nan
+    return data.sort_values("date", kind="stable").reset_index(drop=True)
+
+
+def test_series_features_match_groupby(sales):
+    features = series_features(
+        sales.copy(),
+        lags=LAGS,
+        windows=WINDOWS,
+        alphas=ALPHAS,
+        ewm_lags=EWM_LAGS,
+    )
+    grouped = sales.groupby(["customer_id", "product_id"])["sales"]
+    for lag in LAGS:
+        expected = grouped.transform(lambda x: x.shift(lag))
+        pd.testing.assert_series_equal(
+            features[lag_name(lag)], expected, check_names=False
+        )
+    for window in WINDOWS:
+        expected = grouped.transform(
+            lambda x: x.shift(1)
+            .rolling(window=window, min_periods=10, win_type="triang")
+            .mean()
+        )
+        pd.testing.assert_series_equal(
+            features[roll_mean_name(window)], expected, check_names=False
+        )
+    for alpha in ALPHAS:
+        for lag in EWM_LAGS:
+            expected = grouped.transform(
+                lambda x: x.shift(lag).ewm(alpha=alpha).mean()
+            )
+            pd.testing.assert_series_equal(
+                features[ewm_name(alpha, lag)], expected, check_names=False
+            )
+
+
+@pytest.mark.parametrize("noise_seed", [None, 3])
+def test_parallel_features_match_serial(sales, noise_seed):
+    kwargs = dict(
+        lags=LAGS,
+        windows=WINDOWS,
+        alphas=ALPHAS,
+        ewm_lags=EWM_LAGS,
+        dtype=np.float32,
+        noise_seed=noise_seed,
+    )
+    serial = series_features(sales.copy(), **kwargs)
+    parallel = series_features(sales.copy(), n_jobs=2, **kwargs)
+    pd.testing.assert_frame_equal(serial, parallel, check_exact=True)
+
+
+def test_series_partitions():
+    lengths = np.array([5, 1, 1, 1, 10, 2])
+    bounds = series_partitions(lengths, 3)
+    assert list(bounds) == [0, 3, 5, 6]
+    assert list(series_partitions(np.array([3]), 4)) == [0, 1]